@@ -0,0 +1,79 @@
+import setup_path
+import cosysairsim as airsim
+from argparse import ArgumentParser
+import timeit
+
+# Measures how many MultirotorState and ImageResponse objects per second MsgpackMixin.from_msgpack decodes from the
+# dictionaries the RPC layer returns, next to the original decoder that instantiated each object before overwriting it.
+# No simulator is needed.
+
+
+def legacy_from_msgpack(cls, encoded):
+    obj = cls()
+    if isinstance(encoded, dict):
+        for k, v in encoded.items():
+            if isinstance(v, dict) and hasattr(getattr(obj, k).__class__, 'from_msgpack'):
+                setattr(obj, k, legacy_from_msgpack(getattr(obj, k).__class__, v))
+            else:
+                setattr(obj, k, v)
+    else:
+        obj = encoded
+    return obj
+
+
+def encoded_vector3r():
+    return {'x_val': 1.0, 'y_val': 2.0, 'z_val': 3.0}
+
+
+def encoded_quaternionr():
+    return {'w_val': 1.0, 'x_val': 0.0, 'y_val': 0.0, 'z_val': 0.0}
+
+
+def encoded_multirotor_state():
+    kinematics = {'position': encoded_vector3r(), 'orientation': encoded_quaternionr(),
+                  'linear_velocity': encoded_vector3r(), 'angular_velocity': encoded_vector3r(),
+                  'linear_acceleration': encoded_vector3r(), 'angular_acceleration': encoded_vector3r()}
+    collision = {'has_collided': False, 'normal': encoded_vector3r(), 'impact_point': encoded_vector3r(),
+                 'position': encoded_vector3r(), 'penetration_depth': 0.0, 'time_stamp': 0, 'object_name': '',
+                 'object_id': -1}
+    rc_data = {'timestamp': 0, 'pitch': 0.0, 'roll': 0.0, 'throttle': 0.0, 'yaw': 0.0, 'switch1': 0, 'switch2': 0,
+               'switch3': 0, 'switch4': 0, 'switch5': 0, 'switch6': 0, 'switch7': 0, 'switch8': 0,
+               'is_initialized': False, 'is_valid': False}
+    return {'collision': collision, 'kinematics_estimated': kinematics,
+            'gps_location': {'latitude': 47.6, 'longitude': -122.1, 'altitude': 120.0}, 'timestamp': 0,
+            'landed_state': airsim.LandedState.Landed, 'rc_data': rc_data, 'ready': True, 'ready_message': '',
+            'can_arm': True}
+
+
+def encoded_image_response(width, height):
+    return {'image_data_uint8': bytes(width * height * 3), 'image_data_float': [], 'camera_name': '0',
+            'camera_position': encoded_vector3r(), 'camera_orientation': encoded_quaternionr(), 'time_stamp': 0,
+            'message': '', 'pixels_as_float': False, 'compress': False, 'width': width, 'height': height,
+            'image_type': airsim.ImageType.Scene, 'annotation_name': ''}
+
+
+def run(name, decode, number):
+    seconds = min(timeit.repeat(decode, number=number, repeat=5))
+    print(f"{name:<40} {number / seconds:>12.0f} decodes/s  {seconds / number * 1e6:>8.2f} us/decode")
+
+
+def main(args):
+    multirotor_state = encoded_multirotor_state()
+    image_response = encoded_image_response(args.width, args.height)
+
+    run("MultirotorState", lambda: airsim.MultirotorState.from_msgpack(multirotor_state), args.number)
+    run("MultirotorState (legacy decoder)",
+        lambda: legacy_from_msgpack(airsim.MultirotorState, multirotor_state), args.number)
+    run("ImageResponse", lambda: airsim.ImageResponse.from_msgpack(image_response), args.number)
+    run("ImageResponse (legacy decoder)",
+        lambda: legacy_from_msgpack(airsim.ImageResponse, image_response), args.number)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument('--number', help="Decodes per measurement", type=int, default=20000)
+    parser.add_argument('--width', help="Width of the encoded image", type=int, default=256)
+    parser.add_argument('--height', help="Height of the encoded image", type=int, default=144)
+
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,59 @@
+import setup_path
+import cosysairsim as airsim
+from argparse import ArgumentParser
+import timeit
+import numpy as np
+
+# Compares the per-sample quaternion, euler and rotation helpers of cosysairsim.utils and cosysairsim.types with
+# their batch versions, as used when post-processing recorded flights. No simulator is needed.
+
+
+def main(args):
+    rng = np.random.default_rng(0)
+    quaternions = rng.normal(size=(args.samples, 4))
+    quaternions /= np.linalg.norm(quaternions, axis=1, keepdims=True)
+    vectors = rng.normal(size=(args.samples, 3))
+    angles = airsim.quaternions_to_euler_angles(quaternions)
+    roll, pitch, yaw = angles.T
+
+    quaternion_objects = [airsim.Quaternionr(*q) for q in quaternions.tolist()]
+    vector_objects = [airsim.Vector3r(*v) for v in vectors.tolist()]
+    angle_rows = angles.tolist()
+
+    cases = [
+        ("quaternion_to_euler_angles",
+         lambda: [airsim.quaternion_to_euler_angles(q) for q in quaternion_objects],
+         lambda: airsim.quaternions_to_euler_angles(quaternions)),
+        ("euler_to_quaternion",
+         lambda: [airsim.euler_to_quaternion(*a) for a in angle_rows],
+         lambda: airsim.euler_angles_to_quaternions(roll, pitch, yaw)),
+        ("euler_to_rotation_matrix",
+         lambda: [airsim.euler_to_rotation_matrix(*a) for a in angle_rows],
+         lambda: airsim.euler_angles_to_rotation_matrices(roll, pitch, yaw)),
+        ("apply_rotation_offset",
+         lambda: [airsim.apply_rotation_offset(v, a[1], a[2], a[0]) for v, a in zip(vector_objects, angle_rows)],
+         lambda: airsim.apply_rotation_offsets(vectors, pitch, yaw, roll)),
+        ("Quaternionr.__mul__",
+         lambda: [a * b for a, b in zip(quaternion_objects, reversed(quaternion_objects))],
+         lambda: airsim.quaternions_multiply(quaternions, quaternions[::-1])),
+        ("rotate vector",
+         lambda: [q * v.to_Quaternionr() * q.inverse() for q, v in zip(quaternion_objects, vector_objects)],
+         lambda: airsim.quaternions_rotate(quaternions, vectors)),
+    ]
+
+    print(f"{args.samples} samples")
+    print(f"{'':<28} {'per sample ms':>14} {'batch ms':>10} {'speedup':>8}")
+    for name, scalar, batch in cases:
+        scalar_seconds = min(timeit.repeat(scalar, number=1, repeat=args.repeat))
+        batch_seconds = min(timeit.repeat(batch, number=1, repeat=args.repeat))
+        print(f"{name:<28} {scalar_seconds * 1e3:>14.1f} {batch_seconds * 1e3:>10.2f} "
+              f"{scalar_seconds / batch_seconds:>7.0f}x")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument('--samples', help="Number of samples per call", type=int, default=100000)
+    parser.add_argument('--repeat', help="Repetitions, the fastest one is reported", type=int, default=3)
+
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,60 @@
+import setup_path
+import cosysairsim as airsim
+from argparse import ArgumentParser
+import timeit
+import tracemalloc
+
+# Measures the memory footprint and construction time of the value types in cosysairsim.types, for example to keep
+# long trajectories of poses in memory. No simulator is needed.
+
+
+def make_pose(index):
+    return airsim.Pose(airsim.Vector3r(index, 2.0, 3.0), airsim.Quaternionr(0.0, 0.0, 0.0, 1.0))
+
+
+def decode_pose(index):
+    return airsim.Pose.from_msgpack({'position': {'x_val': index, 'y_val': 2.0, 'z_val': 3.0},
+                                     'orientation': {'w_val': 1.0, 'x_val': 0.0, 'y_val': 0.0, 'z_val': 0.0}})
+
+
+def make_kinematics_state(index):
+    return airsim.KinematicsState.from_msgpack(
+        {'position': {'x_val': index, 'y_val': 2.0, 'z_val': 3.0},
+         'orientation': {'w_val': 1.0, 'x_val': 0.0, 'y_val': 0.0, 'z_val': 0.0},
+         'linear_velocity': {'x_val': 0.0, 'y_val': 0.0, 'z_val': 0.0},
+         'angular_velocity': {'x_val': 0.0, 'y_val': 0.0, 'z_val': 0.0},
+         'linear_acceleration': {'x_val': 0.0, 'y_val': 0.0, 'z_val': 0.0},
+         'angular_acceleration': {'x_val': 0.0, 'y_val': 0.0, 'z_val': 0.0}})
+
+
+def measure_memory(factory, count):
+    tracemalloc.start()
+    objects = [factory(float(index)) for index in range(count)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return size / count
+
+
+def measure_time(factory, number):
+    return min(timeit.repeat(lambda: factory(1.0), number=number, repeat=5)) / number
+
+
+def main(args):
+    print(f"{'':<28} {'bytes/object':>14} {'us/object':>10}")
+    for name, factory in [("Vector3r", lambda index: airsim.Vector3r(index, 2.0, 3.0)),
+                          ("Pose", make_pose),
+                          ("Pose.from_msgpack", decode_pose),
+                          ("KinematicsState.from_msgpack", make_kinematics_state)]:
+        memory = measure_memory(factory, args.count)
+        seconds = measure_time(factory, args.number)
+        print(f"{name:<28} {memory:>14.1f} {seconds * 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument('--count', help="Objects kept alive for the memory measurement", type=int, default=100000)
+    parser.add_argument('--number', help="Constructions per time measurement", type=int, default=20000)
+
+    args = parser.parse_args()
+    main(args)
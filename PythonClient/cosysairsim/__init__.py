@@ -1,4 +1,5 @@
 from .client import *
+from .async_client import *
 from .utils import *
 from .types import *
 
@@ -0,0 +1,643 @@
+from .utils import *
+from .types import *
+from .client import _sensor_snapshot_requests, _sensor_snapshot_from_results
+import asyncio
+import itertools
+import msgpack
+import msgpackrpc  # install as admin: pip install rpc-msgpack
+
+_REQUEST = 0
+_RESPONSE = 1
+
+
+class AsyncRpcClient:
+    """
+    Minimal msgpack-rpc client running on the asyncio event loop it is used from.
+
+    Requests are pipelined over a single connection and matched to their responses by message id, so any number of
+    calls can be awaited concurrently from one event loop without extra threads.
+    """
+    def __init__(self, ip="127.0.0.1", port=41451, timeout_value=3600):
+        self._address = (ip, port)
+        self._timeout = timeout_value
+        self._packer = msgpack.Packer(default=lambda x: x.to_msgpack())
+        self._msgid = itertools.count()
+        self._pending = {}
+        self._reader = None
+        self._writer = None
+        self._read_task = None
+        self._connect_lock = None
+
+    def _connected(self):
+        return self._writer is not None and self._read_task is not None and not self._read_task.done()
+
+    async def connect(self):
+        if self._connected():
+            return
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if not self._connected():
+                self._reader, self._writer = await asyncio.open_connection(*self._address)
+                self._read_task = asyncio.ensure_future(self._read_loop(self._reader, self._writer))
+
+    async def _read_loop(self, reader, writer):
+        unpacker = msgpack.Unpacker()
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                unpacker.feed(data)
+                for message in unpacker:
+                    if len(message) != 4 or message[0] != _RESPONSE:
+                        continue
+                    _, msgid, error, result = message
+                    future = self._pending.pop(msgid, None)
+                    if future is None or future.done():
+                        continue
+                    if error is not None:
+                        future.set_exception(msgpackrpc.error.RPCError(error))
+                    else:
+                        future.set_result(result)
+        finally:
+            # Forget the dead connection, so the next call opens a new one instead of waiting for a lost reply
+            writer.close()
+            if self._writer is writer:
+                self._reader = None
+                self._writer = None
+                self._read_task = None
+            self._fail_pending(msgpackrpc.error.TransportError("Connection to Cosys-AirSim was closed"))
+
+    def _fail_pending(self, exception):
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(exception)
+        self._pending = {}
+
+    async def call(self, method, *args):
+        await self.connect()
+        msgid = next(self._msgid)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[msgid] = future
+        self._writer.write(self._packer.pack([_REQUEST, msgid, method, args]))
+        await self._writer.drain()
+        try:
+            return await asyncio.wait_for(future, self._timeout)
+        except asyncio.TimeoutError:
+            self._pending.pop(msgid, None)
+            raise msgpackrpc.error.TimeoutError("Request timed out")
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._read_task is not None:
+            self._read_task.cancel()
+            self._read_task = None
+        self._fail_pending(msgpackrpc.error.TransportError("Client is closed"))
+
+
+class AsyncVehicleClient:
+    """
+    asyncio counterpart of `VehicleClient`.
+
+    Every method is a coroutine. Calls are pipelined over one connection, so many vehicles and sensors can be
+    driven from a single event loop, e.g. with `asyncio.gather(client.getImuData(), client.getLidarData(...))`.
+    The connection is opened on the first call, or explicitly with `await client.connect()`.
+    """
+    def __init__(self, ip="", port=41451, timeout_value=3600):
+        if ip == "":
+            ip = "127.0.0.1"
+        self.client = AsyncRpcClient(ip, port, timeout_value)
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def connect(self):
+        """
+        Open the connection to the simulator
+        """
+        await self.client.connect()
+
+    async def close(self):
+        """
+        Close the connection to the simulator, failing any call that is still pending
+        """
+        await self.client.close()
+
+    #----------------------------------- Common vehicle APIs ---------------------------------------------
+    async def reset(self):
+        """
+        Reset the vehicle to its original starting state
+        """
+        await self.client.call('reset')
+
+    async def ping(self):
+        """
+        Returns:
+            bool: True if connection is established
+        """
+        return await self.client.call('ping')
+
+    async def enableApiControl(self, is_enabled, vehicle_name=''):
+        """
+        Args:
+            is_enabled (bool): True to enable, False to disable API control
+            vehicle_name (str, optional): Name of the vehicle to send this command to
+        """
+        await self.client.call('enableApiControl', is_enabled, vehicle_name)
+
+    async def isApiControlEnabled(self, vehicle_name=''):
+        """
+        Args:
+            vehicle_name (str, optional): Name of the vehicle
+
+        Returns:
+            bool: If API control is enabled
+        """
+        return await self.client.call('isApiControlEnabled', vehicle_name)
+
+    async def armDisarm(self, arm, vehicle_name=''):
+        """
+        Args:
+            arm (bool): True to arm, False to disarm the vehicle
+            vehicle_name (str, optional): Name of the vehicle to send this command to
+
+        Returns:
+            bool: Success
+        """
+        return await self.client.call('armDisarm', arm, vehicle_name)
+
+    async def simPause(self, is_paused):
+        """
+        Args:
+            is_paused (bool): True to pause the simulation, False to release
+        """
+        await self.client.call('simPause', is_paused)
+
+    async def simIsPause(self):
+        """
+        Returns:
+            bool: If the simulation is paused
+        """
+        return await self.client.call('simIsPaused')
+
+    async def simContinueForTime(self, seconds):
+        """
+        Args:
+            seconds (float): Time to run the simulation for
+        """
+        await self.client.call('simContinueForTime', seconds)
+
+    async def simContinueForFrames(self, frames):
+        """
+        Args:
+            frames (int): Frames to run the simulation for
+        """
+        await self.client.call('simContinueForFrames', frames)
+
+    async def simGetImage(self, camera_name, image_type, vehicle_name='', annotation_name=""):
+        """
+        Args:
+            camera_name (str): Name of the camera
+            image_type (ImageType): Type of image required
+            vehicle_name (str, optional): Name of the vehicle with the camera
+            annotation_name (str, optional): Name of the annotation to be applied if using image type Annotation.
+
+        Returns:
+            bytes: Binary string literal of compressed png image
+        """
+        result = await self.client.call('simGetImage', str(camera_name), image_type, vehicle_name, annotation_name)
+        if result == "" or result == "\0":
+            return None
+        return result
+
+    async def simGetImages(self, requests, vehicle_name='', as_numpy=False):
+        """
+        Args:
+            requests (list[ImageRequest]): Images required
+            vehicle_name (str, optional): Name of vehicle associated with the camera
+            as_numpy (bool, optional): Return the pixel data as NumPy arrays, see `decode_image_response()`
+
+        Returns:
+            list[ImageResponse]: List of image responses
+        """
+        responses_raw = await self.client.call('simGetImages', requests, vehicle_name)
+        responses = [ImageResponse.from_msgpack(response_raw) for response_raw in responses_raw]
+        if as_numpy:
+            responses = [decode_image_response(response) for response in responses]
+        return responses
+
+    async def simSetVehiclePose(self, pose, ignore_collision, vehicle_name=''):
+        """
+        Args:
+            pose (Pose): Desired pose of the vehicle.
+            ignore_collision (bool): Whether to ignore any collision or not.
+            vehicle_name (str, optional): Name of the vehicle to move.
+        """
+        await self.client.call('simSetVehiclePose', pose, ignore_collision, vehicle_name)
+
+    async def simGetVehiclePose(self, vehicle_name=''):
+        """
+        Args:
+            vehicle_name (str, optional): Name of the vehicle to get the pose of.
+
+        Returns:
+            Pose: Pose of the specified vehicle.
+        """
+        return Pose.from_msgpack(await self.client.call('simGetVehiclePose', vehicle_name))
+
+    async def simGetObjectPose(self, object_name, ned=True):
+        """
+        Args:
+            object_name (str): Name of the object to get the pose of.
+            ned (bool, optional): Whether the pose is in NED coordinates.
+
+        Returns:
+            Pose: Pose of the specified object.
+        """
+        return Pose.from_msgpack(await self.client.call('simGetObjectPose', object_name, ned))
+
+    async def simGetGroundTruthKinematics(self, vehicle_name=''):
+        """
+        Args:
+            vehicle_name (str, optional): Name of the vehicle
+
+        Returns:
+            KinematicsState: Ground truth of the vehicle
+        """
+        return KinematicsState.from_msgpack(await self.client.call('simGetGroundTruthKinematics', vehicle_name))
+
+    async def simGetGroundTruthEnvironment(self, vehicle_name=''):
+        """
+        Args:
+            vehicle_name (str, optional): Name of the vehicle
+
+        Returns:
+            EnvironmentState: Ground truth environment state
+        """
+        return EnvironmentState.from_msgpack(await self.client.call('simGetGroundTruthEnvironment', vehicle_name))
+
+    async def simGetCollisionInfo(self, vehicle_name=''):
+        """
+        Args:
+            vehicle_name (str, optional): Name of the vehicle to get the collision information of.
+
+        Returns:
+            CollisionInfo: Collision information of the specified vehicle.
+        """
+        return CollisionInfo.from_msgpack(await self.client.call('simGetCollisionInfo', vehicle_name))
+
+    async def getImuData(self, imu_name='', vehicle_name=''):
+        """
+        Args:
+            imu_name (str, optional): Name of IMU to get data from, specified in settings.json
+            vehicle_name (str, optional): Name of vehicle to which the sensor corresponds to
+
+        Returns:
+            ImuData:
+        """
+        return ImuData.from_msgpack(await self.client.call('getImuData', imu_name, vehicle_name))
+
+    async def getBarometerData(self, barometer_name='', vehicle_name=''):
+        """
+        Args:
+            barometer_name (str, optional): Name of Barometer to get data from, specified in settings.json
+            vehicle_name (str, optional): Name of vehicle to which the sensor corresponds to
+
+        Returns:
+            BarometerData:
+        """
+        return BarometerData.from_msgpack(await self.client.call('getBarometerData', barometer_name, vehicle_name))
+
+    async def getMagnetometerData(self, magnetometer_name='', vehicle_name=''):
+        """
+        Args:
+            magnetometer_name (str, optional): Name of Magnetometer to get data from, specified in settings.json
+            vehicle_name (str, optional): Name of vehicle to which the sensor corresponds to
+
+        Returns:
+            MagnetometerData:
+        """
+        return MagnetometerData.from_msgpack(await self.client.call('getMagnetometerData', magnetometer_name,
+                                                                    vehicle_name))
+
+    async def getGpsData(self, gps_name='', vehicle_name=''):
+        """
+        Args:
+            gps_name (str, optional): Name of GPS to get data from, specified in settings.json
+            vehicle_name (str, optional): Name of vehicle to which the sensor corresponds to
+
+        Returns:
+            GpsData:
+        """
+        return GpsData.from_msgpack(await self.client.call('getGpsData', gps_name, vehicle_name))
+
+    async def getDistanceSensorData(self, distance_sensor_name='', vehicle_name=''):
+        """
+        Args:
+            distance_sensor_name (str, optional): Name of Distance Sensor to get data from, specified in settings.json
+            vehicle_name (str, optional): Name of vehicle to which the sensor corresponds to
+
+        Returns:
+            DistanceSensorData:
+        """
+        return DistanceSensorData.from_msgpack(await self.client.call('getDistanceSensorData', distance_sensor_name,
+                                                                      vehicle_name))
+
+    async def getLidarData(self, lidar_name='', vehicle_name=''):
+        """
+        Args:
+            lidar_name (str, optional): Name of Lidar to get data from, specified in settings.json
+            vehicle_name (str, optional): Name of vehicle to which the sensor corresponds to
+
+        Returns:
+            LidarData:
+        """
+        return LidarData.from_msgpack(await self.client.call('getLidarData', lidar_name, vehicle_name))
+
+    async def getGPULidarData(self, lidar_name='', vehicle_name=''):
+        """
+        Args:
+            lidar_name (str, optional): Name of the GPU LiDAR to get data from, specified in settings.json.
+            vehicle_name (str, optional): Name of the vehicle to which the sensor corresponds.
+
+        Returns:
+            GPULidarData: Data from the specified GPU LiDAR sensor.
+        """
+        return GPULidarData.from_msgpack(await self.client.call('getGPULidarData', lidar_name, vehicle_name))
+
+    async def getEchoData(self, echo_name='', vehicle_name=''):
+        """
+        Args:
+            echo_name (str, optional): Name of the Echo sensor to get data from, specified in settings.json.
+            vehicle_name (str, optional): Name of the vehicle to which the sensor corresponds.
+
+        Returns:
+            EchoData: Data from the specified Echo sensor.
+        """
+        return EchoData.from_msgpack(await self.client.call('getEchoData', echo_name, vehicle_name))
+
+    async def getUWBData(self, uwb_name='', vehicle_name=''):
+        """
+        Args:
+            uwb_name (str, optional): Name of the UWB sensor to get data from, specified in settings.json.
+            vehicle_name (str, optional): Name of the vehicle to which the sensor corresponds.
+
+        Returns:
+            UwbData: Data from the specified UWB sensor.
+        """
+        return UwbData.from_msgpack(await self.client.call('getUWBData', uwb_name, vehicle_name))
+
+    async def getWifiData(self, wifi_name='', vehicle_name=''):
+        """
+        Args:
+            wifi_name (str, optional): Name of the Wi-Fi sensor to get data from, specified in settings.json.
+            vehicle_name (str, optional): Name of the vehicle to which the sensor corresponds.
+
+        Returns:
+            WifiData: Data from the specified Wi-Fi sensor.
+        """
+        return WifiData.from_msgpack(await self.client.call('getWifiData', wifi_name, vehicle_name))
+
+    async def getSensorSnapshot(self, spec, vehicle_name=''):
+        """
+        Args:
+            spec (dict[str, str] or list[str]): Sensor kinds to fetch, see `VehicleClient.getSensorSnapshot`
+            vehicle_name (str, optional): Name of the vehicle to which the sensors correspond.
+
+        Returns:
+            SensorSnapshot: Data per requested sensor kind
+        """
+        requests = _sensor_snapshot_requests(spec, vehicle_name)
+        results = await asyncio.gather(*[self.client.call(method, *args) for _, method, args in requests])
+        return _sensor_snapshot_from_results(zip([sensor_kind for sensor_kind, _, _ in requests], results))
+
+    async def cancelLastTask(self, vehicle_name=''):
+        """
+        Args:
+            vehicle_name (str, optional): Name of the vehicle
+        """
+        await self.client.call('cancelLastTask', vehicle_name)
+
+    async def listVehicles(self):
+        """
+        Returns:
+            list[str]: List containing names of all vehicles
+        """
+        return await self.client.call('listVehicles')
+
+
+# -----------------------------------  Multirotor APIs ---------------------------------------------
+class AsyncMultirotorClient(AsyncVehicleClient, object):
+    """
+    asyncio counterpart of `MultirotorClient`. The movement commands complete when the movement does, like
+    calling `.join()` on the future returned by the synchronous client.
+    """
+    def __init__(self, ip="", port=41451, timeout_value=3600):
+        super(AsyncMultirotorClient, self).__init__(ip, port, timeout_value)
+
+    async def takeoffAsync(self, timeout_sec=20, vehicle_name=''):
+        """
+        Args:
+            timeout_sec (int, optional): Timeout for the vehicle to reach desired altitude
+            vehicle_name (str, optional): Name of the vehicle to send this command to
+        """
+        return await self.client.call('takeoff', timeout_sec, vehicle_name)
+
+    async def landAsync(self, timeout_sec=60, vehicle_name=''):
+        """
+        Args:
+            timeout_sec (int, optional): Timeout for the vehicle to land
+            vehicle_name (str, optional): Name of the vehicle to send this command to
+        """
+        return await self.client.call('land', timeout_sec, vehicle_name)
+
+    async def goHomeAsync(self, timeout_sec=3e+38, vehicle_name=''):
+        """
+        Args:
+            timeout_sec (int, optional): Timeout for the vehicle to reach desired altitude
+            vehicle_name (str, optional): Name of the vehicle to send this command to
+        """
+        return await self.client.call('goHome', timeout_sec, vehicle_name)
+
+    async def hoverAsync(self, vehicle_name=''):
+        """
+        Args:
+            vehicle_name (str, optional): Name of the vehicle to send this command to
+        """
+        return await self.client.call('hover', vehicle_name)
+
+    async def moveByVelocityAsync(self, vx, vy, vz, duration, drivetrain=DrivetrainType.MaxDegreeOfFreedom,
+                                  yaw_mode=YawMode(), vehicle_name=''):
+        """
+        Args:
+            vx (float): desired velocity in world (NED) X axis
+            vy (float): desired velocity in world (NED) Y axis
+            vz (float): desired velocity in world (NED) Z axis
+            duration (float): Desired amount of time (seconds), to send this command for
+            drivetrain (DrivetrainType, optional):
+            yaw_mode (YawMode, optional):
+            vehicle_name (str, optional): Name of the multirotor to send this command to
+        """
+        return await self.client.call('moveByVelocity', vx, vy, vz, duration, drivetrain, yaw_mode, vehicle_name)
+
+    async def moveByVelocityZAsync(self, vx, vy, z, duration, drivetrain=DrivetrainType.MaxDegreeOfFreedom,
+                                   yaw_mode=YawMode(), vehicle_name=''):
+        """
+        Args:
+            vx (float): desired velocity in world (NED) X axis
+            vy (float): desired velocity in world (NED) Y axis
+            z (float): desired Z value (in local NED frame of the vehicle)
+            duration (float): Desired amount of time (seconds), to send this command for
+            drivetrain (DrivetrainType, optional):
+            yaw_mode (YawMode, optional):
+            vehicle_name (str, optional): Name of the multirotor to send this command to
+        """
+        return await self.client.call('moveByVelocityZ', vx, vy, z, duration, drivetrain, yaw_mode, vehicle_name)
+
+    async def moveByVelocityBodyFrameAsync(self, vx, vy, vz, duration, drivetrain=DrivetrainType.MaxDegreeOfFreedom,
+                                           yaw_mode=YawMode(), vehicle_name=''):
+        """
+        Args:
+            vx (float): desired velocity in the X axis of the vehicle's local NED frame.
+            vy (float): desired velocity in the Y axis of the vehicle's local NED frame.
+            vz (float): desired velocity in the Z axis of the vehicle's local NED frame.
+            duration (float): Desired amount of time (seconds), to send this command for
+            drivetrain (DrivetrainType, optional):
+            yaw_mode (YawMode, optional):
+            vehicle_name (str, optional): Name of the multirotor to send this command to
+        """
+        return await self.client.call('moveByVelocityBodyFrame', vx, vy, vz, duration, drivetrain, yaw_mode,
+                                      vehicle_name)
+
+    async def moveOnPathAsync(self, path, velocity, timeout_sec=3e+38, drivetrain=DrivetrainType.MaxDegreeOfFreedom,
+                              yaw_mode=YawMode(), lookahead=-1, adaptive_lookahead=1, vehicle_name=''):
+        """
+        Args:
+            path (list[Vector3r] | Vector3rArray): Points of the path, in NED frame
+            velocity (float): Desired velocity in m/s
+            timeout_sec (float, optional): Timeout for the vehicle to reach the end of the path
+            drivetrain (DrivetrainType, optional):
+            yaw_mode (YawMode, optional):
+            lookahead (float, optional):
+            adaptive_lookahead (float, optional):
+            vehicle_name (str, optional): Name of the multirotor to send this command to
+        """
+        return await self.client.call('moveOnPath', path, velocity, timeout_sec, drivetrain, yaw_mode, lookahead,
+                                      adaptive_lookahead, vehicle_name)
+
+    async def moveToPositionAsync(self, x, y, z, velocity, timeout_sec=3e+38,
+                                  drivetrain=DrivetrainType.MaxDegreeOfFreedom, yaw_mode=YawMode(), lookahead=-1,
+                                  adaptive_lookahead=1, vehicle_name=''):
+        """
+        Args:
+            x (float): Desired X position, in NED frame
+            y (float): Desired Y position, in NED frame
+            z (float): Desired Z position, in NED frame
+            velocity (float): Desired velocity in m/s
+            timeout_sec (float, optional): Timeout for the vehicle to reach the position
+            drivetrain (DrivetrainType, optional):
+            yaw_mode (YawMode, optional):
+            lookahead (float, optional):
+            adaptive_lookahead (float, optional):
+            vehicle_name (str, optional): Name of the multirotor to send this command to
+        """
+        return await self.client.call('moveToPosition', x, y, z, velocity, timeout_sec, drivetrain, yaw_mode,
+                                      lookahead, adaptive_lookahead, vehicle_name)
+
+    async def moveToZAsync(self, z, velocity, timeout_sec=3e+38, yaw_mode=YawMode(), lookahead=-1,
+                           adaptive_lookahead=1, vehicle_name=''):
+        """
+        Args:
+            z (float): Desired Z position, in NED frame
+            velocity (float): Desired velocity in m/s
+            timeout_sec (float, optional): Timeout for the vehicle to reach the altitude
+            yaw_mode (YawMode, optional):
+            lookahead (float, optional):
+            adaptive_lookahead (float, optional):
+            vehicle_name (str, optional): Name of the multirotor to send this command to
+        """
+        return await self.client.call('moveToZ', z, velocity, timeout_sec, yaw_mode, lookahead, adaptive_lookahead,
+                                      vehicle_name)
+
+    async def rotateToYawAsync(self, yaw, timeout_sec=3e+38, margin=5, vehicle_name=''):
+        """
+        Args:
+            yaw (float): Desired yaw angle, in degrees
+            timeout_sec (float, optional): Timeout for the vehicle to reach the yaw angle
+            margin (float, optional):
+            vehicle_name (str, optional): Name of the multirotor to send this command to
+        """
+        return await self.client.call('rotateToYaw', yaw, timeout_sec, margin, vehicle_name)
+
+    async def rotateByYawRateAsync(self, yaw_rate, duration, vehicle_name=''):
+        """
+        Args:
+            yaw_rate (float): Desired yaw rate, in degrees per second
+            duration (float): Desired amount of time (seconds), to send this command for
+            vehicle_name (str, optional): Name of the multirotor to send this command to
+        """
+        return await self.client.call('rotateByYawRate', yaw_rate, duration, vehicle_name)
+
+    async def getMultirotorState(self, vehicle_name=''):
+        """
+        Args:
+            vehicle_name (str, optional): Vehicle to get the state of
+
+        Returns:
+            MultirotorState: Struct containing multirotor state values
+        """
+        return MultirotorState.from_msgpack(await self.client.call('getMultirotorState', vehicle_name))
+
+    async def getRotorStates(self, vehicle_name=''):
+        """
+        Args:
+            vehicle_name (str, optional): Vehicle to get the rotor state of
+
+        Returns:
+            RotorStates: Containing a timestamp and the speed, thrust and torque of all rotors.
+        """
+        return RotorStates.from_msgpack(await self.client.call('getRotorStates', vehicle_name))
+
+
+#----------------------------------- Car APIs ---------------------------------------------
+class AsyncCarClient(AsyncVehicleClient, object):
+    """
+    asyncio counterpart of `CarClient`.
+    """
+    def __init__(self, ip="", port=41451, timeout_value=3600):
+        super(AsyncCarClient, self).__init__(ip, port, timeout_value)
+
+    async def setCarControls(self, controls, vehicle_name=''):
+        """
+        Args:
+            controls (CarControls): Struct containing control values
+            vehicle_name (str, optional): Name of vehicle to be controlled
+        """
+        await self.client.call('setCarControls', controls, vehicle_name)
+
+    async def getCarState(self, vehicle_name=''):
+        """
+        Args:
+            vehicle_name (str, optional): Name of vehicle
+
+        Returns:
+            CarState: Struct containing car state values
+        """
+        return CarState.from_msgpack(await self.client.call('getCarState', vehicle_name))
+
+    async def getCarControls(self, vehicle_name=''):
+        """
+        Args:
+            vehicle_name (str, optional): Name of vehicle
+
+        Returns:
+            CarControls: Struct containing control values
+        """
+        return CarControls.from_msgpack(await self.client.call('getCarControls', vehicle_name))
@@ -2,6 +2,215 @@ from .utils import *
 from .types import *
 import msgpackrpc  # install as admin: pip install rpc-msgpack
 import logging
+import time
+import threading
+import queue
+
+# sensor kind -> (rpc method, result type, takes a sensor name) as used by getSensorSnapshot
+_SENSOR_SNAPSHOT_CALLS = {
+    'imu': ('getImuData', ImuData, True),
+    'barometer': ('getBarometerData', BarometerData, True),
+    'magnetometer': ('getMagnetometerData', MagnetometerData, True),
+    'gps': ('getGpsData', GpsData, True),
+    'distance': ('getDistanceSensorData', DistanceSensorData, True),
+    'lidar': ('getLidarData', LidarData, True),
+    'gpulidar': ('getGPULidarData', GPULidarData, True),
+    'echo': ('getEchoData', EchoData, True),
+    'pose': ('simGetVehiclePose', Pose, False),
+    'kinematics': ('simGetGroundTruthKinematics', KinematicsState, False),
+}
+
+
+def _sensor_snapshot_requests(spec, vehicle_name):
+    if not isinstance(spec, dict):
+        spec = {sensor_kind: '' for sensor_kind in spec}
+    requests = []
+    for sensor_kind, sensor_name in spec.items():
+        if sensor_kind not in _SENSOR_SNAPSHOT_CALLS:
+            raise ValueError("Unknown sensor kind '%s', expected one of %s"
+                             % (sensor_kind, ', '.join(_SENSOR_SNAPSHOT_CALLS)))
+        method, _, has_sensor_name = _SENSOR_SNAPSHOT_CALLS[sensor_kind]
+        args = (sensor_name, vehicle_name) if has_sensor_name else (vehicle_name,)
+        requests.append((sensor_kind, method, args))
+    return requests
+
+
+def _sensor_snapshot_from_results(results):
+    snapshot = SensorSnapshot()
+    time_stamps = []
+    for sensor_kind, result_raw in results:
+        data = _SENSOR_SNAPSHOT_CALLS[sensor_kind][1].from_msgpack(result_raw)
+        setattr(snapshot, sensor_kind, data)
+        if hasattr(data, 'time_stamp'):
+            time_stamps.append(data.time_stamp)
+    if time_stamps:
+        snapshot.time_stamp = max(time_stamps)
+        snapshot.time_stamp_spread = max(time_stamps) - min(time_stamps)
+    return snapshot
+
+
+class SensorSubscription:
+    """
+    Polls one sensor stream at a fixed rate in a background thread, see `VehicleClient.subscribe()`.
+
+    Frames whose time stamp did not change since the previous poll are dropped before they are decoded. New samples
+    go through a bounded queue: when the consumer falls behind, the oldest queued sample is dropped so the freshest one
+    always gets through. Samples are handed to the callback from a second thread, or fetched with `get()` when there is
+    no callback. `stats()` reports how many polls, duplicates and drops there were.
+
+    The poller uses its own connection, as the msgpack-rpc client of the vehicle client must not be shared between
+    threads.
+    """
+    def __init__(self, address, timeout_value, sensor_kind, sensor_name='', vehicle_name='', callback=None,
+                 rate_hz=10.0, queue_size=4):
+        if sensor_kind not in _SENSOR_SNAPSHOT_CALLS:
+            raise ValueError("Unknown sensor kind '%s', expected one of %s"
+                             % (sensor_kind, ', '.join(_SENSOR_SNAPSHOT_CALLS)))
+        if rate_hz <= 0:
+            raise ValueError("rate_hz must be positive, got %s" % rate_hz)
+        method, self._type, has_sensor_name = _SENSOR_SNAPSHOT_CALLS[sensor_kind]
+        self._method = method
+        self._args = (sensor_name, vehicle_name) if has_sensor_name else (vehicle_name,)
+        self._address = address
+        self._timeout_value = timeout_value
+        self._callback = callback
+        self._period = 1.0 / rate_hz
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {'polled': 0, 'unchanged': 0, 'queued': 0, 'delivered': 0, 'dropped': 0, 'errors': 0}
+        self.sensor_kind = sensor_kind
+        self.last_error = None
+        self._threads = [threading.Thread(target=self._poll, name='airsim-poll-%s' % sensor_kind, daemon=True)]
+        if callback is not None:
+            self._threads.append(threading.Thread(target=self._dispatch, name='airsim-dispatch-%s' % sensor_kind,
+                                                  daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _poll(self):
+        client = None
+        last_stamp = None
+        next_poll = time.perf_counter()
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    if client is None:
+                        client = msgpackrpc.Client(self._address, timeout=self._timeout_value,
+                                                   pack_encoding='utf-8', unpack_encoding='utf-8')
+                    result_raw = client.call(self._method, *self._args)
+                    self._count('polled')
+                    # sensors without a time stamp, like the pose, are compared as a whole
+                    stamp = result_raw.get('time_stamp', result_raw) if isinstance(result_raw, dict) else result_raw
+                    if stamp == last_stamp:
+                        self._count('unchanged')
+                    else:
+                        last_stamp = stamp
+                        self._put(self._type.from_msgpack(result_raw))
+                except Exception as error:
+                    self.last_error = error
+                    self._count('errors')
+                    if client is not None:
+                        client.close()
+                        client = None
+
+                next_poll += self._period
+                delay = next_poll - time.perf_counter()
+                if delay < 0:
+                    # the call took longer than the period, do not try to catch up
+                    next_poll = time.perf_counter()
+                    delay = 0
+                self._stop_event.wait(delay)
+        finally:
+            if client is not None:
+                client.close()
+
+    def _put(self, sample):
+        while True:
+            try:
+                self._queue.put_nowait(sample)
+                self._count('queued')
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self._count('dropped')
+                except queue.Empty:
+                    pass
+
+    def _dispatch(self):
+        while not self._stop_event.is_set():
+            try:
+                sample = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            self._count('delivered')
+            try:
+                self._callback(sample)
+            except Exception as error:
+                self.last_error = error
+                self._count('errors')
+
+    def get(self, timeout=None):
+        """
+        Waits for the next new sample, only when the subscription has no callback.
+
+        Args:
+            timeout (float, optional): Seconds to wait, or None to wait until a sample arrives
+
+        Returns:
+            The decoded sample, or None if the timeout expired or the subscription was stopped
+        """
+        if self._callback is not None:
+            raise RuntimeError("Samples of a subscription with a callback are delivered to the callback")
+        end = None if timeout is None else time.perf_counter() + timeout
+        while not self._stop_event.is_set():
+            wait = 0.1 if end is None else min(0.1, end - time.perf_counter())
+            if wait <= 0:
+                return None
+            try:
+                sample = self._queue.get(timeout=wait)
+            except queue.Empty:
+                continue
+            self._count('delivered')
+            return sample
+        return None
+
+    def stats(self):
+        """
+        Returns:
+            dict: Counters of the subscription: 'polled' calls to the server, 'unchanged' frames dropped because their
+            time stamp did not change, 'queued' new samples, 'delivered' samples handed to the consumer, 'dropped'
+            samples discarded because the queue was full, 'errors' failed calls or callbacks, and 'backlog' samples
+            waiting in the queue
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats['backlog'] = self._queue.qsize()
+        return stats
+
+    @property
+    def running(self):
+        return not self._stop_event.is_set()
+
+    def stop(self, timeout=None):
+        """
+        Stops polling and waits for the background threads to finish.
+        """
+        self._stop_event.set()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
 
 
 class VehicleClient:
@@ -14,6 +223,8 @@ class VehicleClient:
             pack_encoding='utf-8',
             unpack_encoding='utf-8',
         )
+        self._address = msgpackrpc.Address(ip, port)
+        self._timeout_value = timeout_value
 
     #----------------------------------- Common vehicle APIs ---------------------------------------------
     def reset(self):
@@ -313,19 +524,61 @@ class VehicleClient:
             return None
         return result
 
-    def simGetImages(self, requests, vehicle_name=''):
+    def simGetImages(self, requests, vehicle_name='', as_numpy=False):
         """
         Get multiple images
 
         Args:
             requests (list[ImageRequest]): Images required
             vehicle_name (str, optional): Name of vehicle associated with the camera
+            as_numpy (bool, optional): Return the pixel data as NumPy arrays instead of bytes and lists, see
+                `decode_image_response()`. Uncompressed images are (H, W, C) uint8 and float images (H, W) float32
 
         Returns:
             list[ImageResponse]: List of image responses
         """
         responses_raw = self.client.call('simGetImages', requests, vehicle_name)
-        return [ImageResponse.from_msgpack(response_raw) for response_raw in responses_raw]
+        responses = [ImageResponse.from_msgpack(response_raw) for response_raw in responses_raw]
+        if as_numpy:
+            responses = [decode_image_response(response) for response in responses]
+        return responses
+
+    def simGetImagesMulti(self, requests_per_vehicle, as_numpy=False, return_latencies=False):
+        """
+        Get multiple images from multiple vehicles at once
+
+        All `simGetImages` calls are sent before waiting on any of them, so the simulator can serve them concurrently
+        and the total time approaches that of the slowest vehicle instead of the sum of all of them.
+
+        Args:
+            requests_per_vehicle (dict[str, list[ImageRequest]]): Images required, per vehicle name
+            as_numpy (bool, optional): Return the pixel data as NumPy arrays, see `simGetImages`
+            return_latencies (bool, optional): Also return the round trip time of each vehicle's call, in seconds
+
+        Returns:
+            dict[str, list[ImageResponse]]: Image responses per vehicle name,
+            and a dict[str, float] of latencies per vehicle name if `return_latencies` is True
+        """
+        futures = {}
+        latencies = {}
+        for vehicle_name, requests in requests_per_vehicle.items():
+            start_time = time.perf_counter()
+            future = self.client.call_async('simGetImages', requests, vehicle_name)
+            future.attach_callback(
+                lambda _, vehicle_name=vehicle_name, start_time=start_time:
+                latencies.__setitem__(vehicle_name, time.perf_counter() - start_time))
+            futures[vehicle_name] = future
+
+        responses = {}
+        for vehicle_name, future in futures.items():
+            responses_raw = future.get()
+            responses[vehicle_name] = [ImageResponse.from_msgpack(response_raw) for response_raw in responses_raw]
+            if as_numpy:
+                responses[vehicle_name] = [decode_image_response(response) for response in responses[vehicle_name]]
+
+        if return_latencies:
+            return responses, latencies
+        return responses
 
     def simGetPresetLensSettings(self, camera_name, vehicle_name=''):
         """
@@ -797,18 +1050,21 @@ class VehicleClient:
         """
         return self.client.call('simListInstanceSegmentationObjects')
 
-    def simListInstanceSegmentationPoses(self, ned=True, only_visible=False):
+    def simListInstanceSegmentationPoses(self, ned=True, only_visible=False, as_numpy=False):
         """
         Lists the poses of all instance segmentation objects in the environment.
 
         Args:
             ned (bool, optional): Whether the poses are in NED coordinates.
             only_visible (bool, optional): Whether to include only visible objects.
+            as_numpy (bool, optional): Return a PoseArray instead of a list, which is much faster for many objects.
 
         Returns:
-            list[Pose]: List of poses of instance segmentation objects.
+            list[Pose] | PoseArray: List of poses of instance segmentation objects.
         """
         poses_raw = self.client.call('simListInstanceSegmentationPoses', ned, only_visible)
+        if as_numpy:
+            return PoseArray.from_msgpack(poses_raw)
         return [Pose.from_msgpack(pose_raw) for pose_raw in poses_raw]
 
     def simSetSegmentationObjectID(self, mesh_name, object_id, is_name_regex=False):
@@ -849,7 +1105,7 @@ class VehicleClient:
         """
         return self.client.call('simListAnnotationObjects', annotation_name)
 
-    def simListAnnotationPoses(self, annotation_name, ned=True, only_visible=False):
+    def simListAnnotationPoses(self, annotation_name, ned=True, only_visible=False, as_numpy=False):
         """
         Lists the poses of all annotation objects with the specified name of the layer.
 
@@ -857,11 +1113,14 @@ class VehicleClient:
             annotation_name (str): Name of the annotation layer.
             ned (bool, optional): Whether the poses are in NED coordinates.
             only_visible (bool, optional): Whether to include only visible objects.
+            as_numpy (bool, optional): Return a PoseArray instead of a list, which is much faster for many objects.
 
         Returns:
-            list[Pose]: List of poses of annotation objects with the specified name.
+            list[Pose] | PoseArray: List of poses of annotation objects with the specified name.
         """
         poses_raw = self.client.call('simListAnnotationPoses', annotation_name, ned, only_visible)
+        if as_numpy:
+            return PoseArray.from_msgpack(poses_raw)
         return [Pose.from_msgpack(pose_raw) for pose_raw in poses_raw]
 
     def simSetAnnotationObjectID(self, annotation_name, mesh_name, object_id, is_name_regex=False):
@@ -1008,10 +1267,10 @@ class VehicleClient:
     @staticmethod
     def simGetSegmentationColorMap():
         """
-        Gets the segmentation color map.
+        Gets the segmentation color map, see `load_colormap()`.
 
         Returns:
-            dict: Dictionary mapping object IDs to colors.
+            np.ndarray: (N, 3) array with the color of object ID i in row i.
         """
         return load_colormap()
 
@@ -1028,7 +1287,7 @@ class VehicleClient:
         Returns:
             bool: True if the color is valid, otherwise False.
         """
-        return np.array([r, g, b]) in load_colormap()
+        return bool(colormap_lookup([r, g, b]) >= 0)
 
     def simAddDetectionFilterMeshName(self, camera_name, image_type, mesh_name, vehicle_name='', annotation_name=""):
         """
@@ -1426,6 +1685,52 @@ class VehicleClient:
         return WifiSensorData.from_msgpack(self.client.call('getWifiSensorData', wifi_name,
                                                             vehicle_name))
 
+    def getSensorSnapshot(self, spec, vehicle_name=''):
+        """
+        Retrieves the data of several sensors of a vehicle at once.
+
+        All calls are sent before waiting on any of them, so the snapshot costs roughly one round trip instead of one
+        per sensor.
+
+        Args:
+            spec (dict[str, str] or list[str]): Sensor kinds to fetch, mapped to the sensor name specified in
+                settings.json. A list of sensor kinds uses the default sensor of each kind. Supported kinds are
+                'imu', 'barometer', 'magnetometer', 'gps', 'distance', 'lidar', 'gpulidar', 'echo', 'pose' and
+                'kinematics', where the sensor name is ignored for the last two.
+            vehicle_name (str, optional): Name of the vehicle to which the sensors correspond.
+
+        Returns:
+            SensorSnapshot: Data per requested sensor kind, with `time_stamp` the most recent sensor time stamp and
+            `time_stamp_spread` the difference between the most recent and the oldest one, in nanoseconds.
+        """
+        requests = _sensor_snapshot_requests(spec, vehicle_name)
+        futures = [(sensor_kind, self.client.call_async(method, *args)) for sensor_kind, method, args in requests]
+        return _sensor_snapshot_from_results([(sensor_kind, future.get()) for sensor_kind, future in futures])
+
+    def subscribe(self, sensor_kind, sensor_name='', vehicle_name='', callback=None, rate_hz=10.0, queue_size=4):
+        """
+        Polls a sensor in a background thread and delivers only new samples, instead of a loop calling the getter
+        and comparing time stamps.
+
+        Frames whose `time_stamp` did not change are dropped before they are decoded. New samples pass through a queue
+        of `queue_size` entries that drops the oldest sample when the consumer falls behind.
+
+        Args:
+            sensor_kind (str): One of the sensor kinds of `getSensorSnapshot()`, e.g. 'lidar' or 'imu'
+            sensor_name (str, optional): Name of the sensor specified in settings.json, ignored for 'pose' and
+                'kinematics'
+            vehicle_name (str, optional): Name of the vehicle to which the sensor corresponds
+            callback (callable, optional): Called with every new sample from a background thread. Without callback,
+                use `SensorSubscription.get()`
+            rate_hz (float, optional): Polling rate
+            queue_size (int, optional): Maximum number of new samples waiting for the consumer
+
+        Returns:
+            SensorSubscription: Call `stop()` on it to end the subscription, `stats()` reports duplicates and drops
+        """
+        return SensorSubscription(self._address, self._timeout_value, sensor_kind, sensor_name, vehicle_name,
+                                  callback, rate_hz, queue_size)
+
     def simFlushPersistentMarkers(self):
         """
         Clear any persistent markers - those plotted with setting `is_persistent=True` in the APIs below
@@ -1437,7 +1742,7 @@ class VehicleClient:
         Plot a list of 3D points in World NED frame
 
         Args:
-            points (list[Vector3r]): List of Vector3r objects
+            points (list[Vector3r] | Vector3rArray): List of Vector3r objects
             color_rgba (list, optional): desired RGBA values from 0.0 to 1.0
             size (float, optional): Size of plotted point
             duration (float, optional): Duration (seconds) to plot for
@@ -1454,7 +1759,8 @@ class VehicleClient:
         ... , points[n-2] to points[n-1]
 
         Args:
-            points (list[Vector3r]): List of 3D locations of line start and end points, specified as Vector3r objects
+            points (list[Vector3r] | Vector3rArray): List of 3D locations of line start and end points, specified as
+                Vector3r objects
             color_rgba (list, optional): desired RGBA values from 0.0 to 1.0
             thickness (float, optional): Thickness of line
             duration (float, optional): Duration (seconds) to plot for
@@ -1471,8 +1777,8 @@ class VehicleClient:
          points[n-2] to points[n-1]
 
         Args:
-            points (list[Vector3r]): List of 3D locations of line start and end points, specified as Vector3r objects.
-                Must be even
+            points (list[Vector3r] | Vector3rArray): List of 3D locations of line start and end points, specified as
+                Vector3r objects. Must be even
             color_rgba (list, optional): desired RGBA values from 0.0 to 1.0
             thickness (float, optional): Thickness of line
             duration (float, optional): Duration (seconds) to plot for
@@ -1488,9 +1794,9 @@ class VehicleClient:
         Plots a list of arrows in World NED frame, defined from points_start[0] to points_end[0], points_start[1] to
          points_end[1], ... , points_start[n-1] to points_end[n-1]
         Args:
-            points_start (list[Vector3r]): List of 3D start positions of arrow start positions,
+            points_start (list[Vector3r] | Vector3rArray): List of 3D start positions of arrow start positions,
                 specified as Vector3r objects
-            points_end (list[Vector3r]): List of 3D end positions of arrow start positions,
+            points_end (list[Vector3r] | Vector3rArray): List of 3D end positions of arrow start positions,
                 specified as Vector3r objects
             color_rgba (list, optional): desired RGBA values from 0.0 to 1.0
             thickness (float, optional): Thickness of line
@@ -1509,7 +1815,7 @@ class VehicleClient:
 
         Args:
             strings (list[String], optional): List of strings to plot
-            positions (list[Vector3r]): List of positions where the strings should be plotted.
+            positions (list[Vector3r] | Vector3rArray): List of positions where the strings should be plotted.
                 Should be in one-to-one correspondence with the strings' list
             scale (float, optional): Font scale of transform name
             color_rgba (list, optional): desired RGBA values from 0.0 to 1.0
@@ -1524,7 +1830,7 @@ class VehicleClient:
         Plots a list of transforms in World NED frame.
 
         Args:
-            poses (list[Pose]): List of Pose objects representing the transforms to plot
+            poses (list[Pose] | PoseArray): List of Pose objects representing the transforms to plot
             scale (float, optional): Length of transforms' axes
             thickness (float, optional): Thickness of transforms' axes
             duration (float, optional): Duration (seconds) to plot for
@@ -1538,7 +1844,7 @@ class VehicleClient:
         Plots a list of transforms with their names in World NED frame.
 
         Args:
-            poses (list[Pose]): List of Pose objects representing the transforms to plot
+            poses (list[Pose] | PoseArray): List of Pose objects representing the transforms to plot
             names (list[string]): List of strings with one-to-one correspondence to list of poses
             tf_scale (float, optional): Length of transforms' axes
             tf_thickness (float, optional): Thickness of transforms' axes
@@ -1826,7 +2132,7 @@ class MultirotorClient(VehicleClient, object):
         Initiates a movement along a specified path asynchronously.
 
         Args:
-            path (list[airsim.Vector3r]): List of waypoints defining the path.
+            path (list[airsim.Vector3r] | airsim.Vector3rArray): List of waypoints defining the path.
             velocity (float): Desired velocity along the path (meters per second).
             timeout_sec (float, optional): Timeout duration in seconds.
             drivetrain (DrivetrainType, optional): Specifies the type of drivetrain used by the vehicle.
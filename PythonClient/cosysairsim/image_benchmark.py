@@ -0,0 +1,286 @@
+"""
+Image capture throughput benchmark.
+
+Sweeps cameras, image types, pixels_as_float, compress, batch sizes and numbers of concurrent clients and measures,
+for every combination, the round trip time of the `simGetImages` RPC separately from the time spent decoding the
+responses on the client. Results are plain dicts that can be written to JSON or CSV to compare simulator and client
+versions.
+
+Run it from the command line with `python -m cosysairsim.image_benchmark --help`.
+"""
+import csv
+import json
+import platform
+import threading
+import time
+from argparse import ArgumentParser
+from datetime import datetime
+
+import msgpackrpc
+import numpy as np
+
+from .client import VehicleClient
+from .types import ImageRequest, ImageResponse, ImageType
+from .utils import decode_image_response
+
+# seconds a worker waits after a failed call before the next one
+ERROR_BACKOFF = 0.1
+
+IMAGE_TYPES = {name: getattr(ImageType, name) for name in
+               ('Scene', 'DepthPlanar', 'DepthPerspective', 'DepthVis', 'DisparityNormalized', 'Segmentation',
+                'SurfaceNormals', 'Infrared', 'OpticalFlow', 'OpticalFlowVis', 'Annotation')}
+
+PERCENTILES = (50, 90, 99)
+
+
+def _percentiles(prefix, seconds):
+    values = {}
+    for percentile in PERCENTILES:
+        values['%s_p%d_ms' % (prefix, percentile)] = (float(np.percentile(seconds, percentile)) * 1e3
+                                                     if len(seconds) else None)
+    values['%s_max_ms' % prefix] = float(np.max(seconds)) * 1e3 if len(seconds) else None
+    values['%s_mean_ms' % prefix] = float(np.mean(seconds)) * 1e3 if len(seconds) else None
+    return values
+
+
+def _payload_bytes(response):
+    if response.pixels_as_float:
+        return len(response.image_data_float) * 4
+    return len(response.image_data_uint8)
+
+
+def _client_worker(ip, port, timeout_value, requests, vehicle_name, decode, warmup, duration, start_barrier,
+                   results, index):
+    # Every worker has its own connection, created in its own thread as the RPC client requires
+    samples = {'rpc': [], 'decode': [], 'bytes': 0, 'images': 0, 'calls': 0, 'errors': 0, 'message': ''}
+    results[index] = samples
+    try:
+        client = VehicleClient(ip=ip, port=port, timeout_value=timeout_value)
+    except Exception as e:
+        samples['errors'] += 1
+        samples['message'] = str(e)
+        start_barrier.wait()
+        return
+    start_barrier.wait()
+    measure_from = time.perf_counter() + warmup
+    stop_at = measure_from + duration
+    while True:
+        start_time = time.perf_counter()
+        if start_time >= stop_at:
+            break
+        try:
+            responses_raw = client.client.call('simGetImages', requests, vehicle_name)
+            rpc_end = time.perf_counter()
+            responses = [ImageResponse.from_msgpack(response_raw) for response_raw in responses_raw]
+            if decode:
+                responses = [decode_image_response(response) for response in responses]
+            decode_end = time.perf_counter()
+        except msgpackrpc.error.TransportError as e:
+            # the connection is gone and every further call would fail at once
+            samples['errors'] += 1
+            samples['message'] = str(e)
+            break
+        except Exception as e:
+            samples['errors'] += 1
+            samples['message'] = str(e)
+            time.sleep(ERROR_BACKOFF)
+            continue
+        if start_time < measure_from:
+            continue
+        samples['rpc'].append(rpc_end - start_time)
+        samples['decode'].append(decode_end - rpc_end)
+        samples['bytes'] += sum(_payload_bytes(response) for response in responses)
+        samples['images'] += sum(1 for response in responses if response.width > 0 and response.height > 0)
+        samples['calls'] += 1
+
+
+def run_case(camera_name, image_type, pixels_as_float=False, compress=False, batch_size=1, clients=1,
+             duration=5.0, warmup=1.0, decode=True, vehicle_name='', annotation_name='', ip='', port=41451,
+             timeout_value=3600):
+    """
+    Measures one combination of the sweep.
+
+    Every client thread calls `simGetImages` back to back for `warmup` + `duration` seconds with `batch_size`
+    identical requests. Only the calls that start after the warmup are measured.
+
+    Args:
+        camera_name (str): Name of the camera
+        image_type (ImageType): Type of image to request
+        pixels_as_float (bool, optional): Request float pixels
+        compress (bool, optional): Request png compressed images
+        batch_size (int, optional): Number of images per `simGetImages` call
+        clients (int, optional): Number of concurrent client connections
+        duration (float, optional): Measured time in seconds
+        warmup (float, optional): Time in seconds before measuring starts
+        decode (bool, optional): Also convert the responses to NumPy arrays with `decode_image_response()`
+        vehicle_name (str, optional): Name of the vehicle with the camera
+        annotation_name (str, optional): Annotation layer for image type Annotation
+        ip (str, optional): Address of the simulator
+        port (int, optional): RPC port of the simulator
+        timeout_value (int, optional): RPC timeout in seconds
+
+    Returns:
+        dict: The parameters of the case and the results: calls, images and errors, images_per_second,
+        megabytes_per_second of pixel payload, rpc_* and decode_* latency percentiles, mean and max in milliseconds
+        per call, and the last error message
+    """
+    requests = [ImageRequest(camera_name, image_type, pixels_as_float, compress, annotation_name)
+                for _ in range(batch_size)]
+    results = [None] * clients
+    start_barrier = threading.Barrier(clients)
+    threads = [threading.Thread(target=_client_worker,
+                                args=(ip, port, timeout_value, requests, vehicle_name, decode, warmup, duration,
+                                      start_barrier, results, index))
+               for index in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    rpc = [seconds for samples in results for seconds in samples['rpc']]
+    decode_seconds = [seconds for samples in results for seconds in samples['decode']]
+    total_bytes = sum(samples['bytes'] for samples in results)
+    images = sum(samples['images'] for samples in results)
+    messages = [samples['message'] for samples in results if samples['message']]
+    result = {
+        'camera_name': camera_name,
+        'image_type': next((name for name, value in IMAGE_TYPES.items() if value == image_type), str(image_type)),
+        'pixels_as_float': pixels_as_float,
+        'compress': compress,
+        'batch_size': batch_size,
+        'clients': clients,
+        'decode': decode,
+        'duration_s': duration,
+        'calls': len(rpc),
+        'images': images,
+        'errors': sum(samples['errors'] for samples in results),
+        'images_per_second': images / duration,
+        'megabytes_per_second': total_bytes / duration / 1e6,
+    }
+    result.update(_percentiles('rpc', rpc))
+    result.update(_percentiles('decode', decode_seconds))
+    result['message'] = messages[-1] if messages else ''
+    return result
+
+
+def run_sweep(camera_names, image_types, pixels_as_float=(False,), compress=(False,), batch_sizes=(1,), clients=(1,),
+              callback=None, **kwargs):
+    """
+    Runs `run_case()` for every combination of the given values.
+
+    Args:
+        camera_names (list[str]): Cameras to benchmark
+        image_types (list[ImageType]): Image types to benchmark
+        pixels_as_float (list[bool], optional): Values of pixels_as_float to benchmark
+        compress (list[bool], optional): Values of compress to benchmark
+        batch_sizes (list[int], optional): Numbers of images per call to benchmark
+        clients (list[int], optional): Numbers of concurrent clients to benchmark
+        callback (callable, optional): Called with every result as soon as its case finished
+        **kwargs: Passed on to `run_case()`
+
+    Returns:
+        list[dict]: Results of all cases, see `run_case()`
+    """
+    results = []
+    for camera_name in camera_names:
+        for image_type in image_types:
+            for as_float in pixels_as_float:
+                for compressed in compress:
+                    for batch_size in batch_sizes:
+                        for num_clients in clients:
+                            result = run_case(camera_name, image_type, as_float, compressed, batch_size,
+                                              num_clients, **kwargs)
+                            results.append(result)
+                            if callback is not None:
+                                callback(result)
+    return results
+
+
+def environment_info(ip='', port=41451):
+    """
+    Versions and machine information to store next to results.
+
+    Returns:
+        dict: Client package and API versions, server API version when reachable, Python version, platform and time
+    """
+    from . import __version__
+    info = {
+        'package_version': __version__,
+        'client_version': VehicleClient.getClientVersion(),
+        'server_version': None,
+        'python_version': platform.python_version(),
+        'platform': platform.platform(),
+        'time': datetime.now().isoformat(timespec='seconds'),
+    }
+    try:
+        info['server_version'] = VehicleClient(ip=ip, port=port, timeout_value=10).getServerVersion()
+    except Exception:
+        pass
+    return info
+
+
+def write_results(path, results, info=None):
+    """
+    Writes results as JSON, with the environment info, or as CSV with one row per case when path ends with .csv.
+    """
+    if path.lower().endswith('.csv'):
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0].keys()) if results else [])
+            writer.writeheader()
+            writer.writerows(results)
+    else:
+        with open(path, 'w') as f:
+            json.dump({'environment': info or {}, 'results': results}, f, indent=2)
+
+
+def format_result(result):
+    def ms(value):
+        return '%8.2f' % value if value is not None else '%8s' % '-'
+    return ('%-12s %-20s float=%-d png=%-d batch=%-3d clients=%-3d %8.1f img/s %8.1f MB/s rpc p50 %s p99 %s ms '
+            'decode p50 %s ms errors %d' % (result['camera_name'], result['image_type'], result['pixels_as_float'],
+                                            result['compress'], result['batch_size'], result['clients'],
+                                            result['images_per_second'], result['megabytes_per_second'],
+                                            ms(result['rpc_p50_ms']), ms(result['rpc_p99_ms']),
+                                            ms(result['decode_p50_ms']), result['errors']))
+
+
+def _bools(values):
+    return [value.lower() in ('1', 'true', 'yes') for value in values]
+
+
+def main(argv=None):
+    parser = ArgumentParser(description="Measure simGetImages throughput for a sweep of cameras, image types, "
+                                        "encodings, batch sizes and concurrent clients")
+    parser.add_argument('--ip', default='')
+    parser.add_argument('--port', type=int, default=41451)
+    parser.add_argument('--vehicle', default='', help="Name of the vehicle with the cameras")
+    parser.add_argument('--cameras', nargs='+', default=['front_center'])
+    parser.add_argument('--image_types', nargs='+', default=['Scene'], choices=list(IMAGE_TYPES))
+    parser.add_argument('--pixels_as_float', nargs='+', default=['false'], help="Values to sweep, true/false")
+    parser.add_argument('--compress', nargs='+', default=['false'], help="Values to sweep, true/false")
+    parser.add_argument('--batch_sizes', nargs='+', type=int, default=[1])
+    parser.add_argument('--clients', nargs='+', type=int, default=[1])
+    parser.add_argument('--annotation_name', default='', help="Annotation layer for image type Annotation")
+    parser.add_argument('--duration', type=float, default=5.0, help="Measured seconds per case")
+    parser.add_argument('--warmup', type=float, default=1.0, help="Seconds before measuring each case")
+    parser.add_argument('--no_decode', dest='decode', action='store_false',
+                        help="Do not convert the responses to NumPy arrays")
+    parser.add_argument('--output', help="Write the results to this .json or .csv file")
+    args = parser.parse_args(argv)
+
+    info = environment_info(args.ip, args.port)
+    print("Client %s (API %s), server API %s" % (info['package_version'], info['client_version'],
+                                                 info['server_version']))
+    results = run_sweep(args.cameras, [IMAGE_TYPES[name] for name in args.image_types],
+                        _bools(args.pixels_as_float), _bools(args.compress), args.batch_sizes, args.clients,
+                        callback=lambda result: print(format_result(result)), duration=args.duration,
+                        warmup=args.warmup, decode=args.decode, vehicle_name=args.vehicle,
+                        annotation_name=args.annotation_name, ip=args.ip, port=args.port)
+    if args.output:
+        write_results(args.output, results, info)
+        print("Results written to " + args.output)
+    return results
+
+
+if __name__ == '__main__':
+    main()
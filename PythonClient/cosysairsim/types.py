@@ -1,30 +1,111 @@
 import numpy as np
 import math
+import itertools
+import operator
+
+# class -> (field names, {field name: nested MsgpackMixin class}, slot names), filled in on first use of each class.
+# Fields of __slots__ classes are read from a default constructed instance, those of other classes from the class
+# attributes.
+_msgpack_schemas = {}
+# class -> decoder function generated by _compile_msgpack_decoder
+_msgpack_decoders = {}
+
+
+def _msgpack_schema(cls):
+    schema = _msgpack_schemas.get(cls)
+    if schema is None:
+        slots = tuple(name for klass in reversed(cls.__mro__) for name in vars(klass).get('__slots__', ())
+                      if name not in ('__dict__', '__weakref__'))
+        defaults = {}
+        if slots:
+            prototype = cls()
+            defaults = {name: getattr(prototype, name) for name in slots}
+        else:
+            for klass in reversed(cls.__mro__):
+                for name, value in vars(klass).items():
+                    if (name.startswith('_') or callable(value)
+                            or isinstance(value, (property, staticmethod, classmethod))):
+                        continue
+                    defaults[name] = value
+        nested = {name: type(value) for name, value in defaults.items() if isinstance(value, MsgpackMixin)}
+        schema = (frozenset(defaults), nested, slots)
+        _msgpack_schemas[cls] = schema
+    return schema
+
+
+def _compile_msgpack_decoder(cls):
+    """
+    Generates the decoder of a class, which creates the object without calling __init__ and assigns every field
+    straight from the encoded dict, decoding nested objects with their own decoder. It raises KeyError when a field
+    is missing, as only `MsgpackMixin.from_msgpack` knows how to fill in defaults.
+    """
+    fields, nested, slots = _msgpack_schema(cls)
+    namespace = {'cls': cls, 'new': object.__new__, 'fields': fields}
+    lines = ['def decode(encoded):',
+             '    obj = new(cls)']
+    if slots:
+        target = 'obj.{}'
+        names = slots
+    else:
+        # other classes keep any extra key the server sends, like before
+        lines += ['    if not fields <= encoded.keys():',
+                  '        raise KeyError(next(iter(fields - encoded.keys())))',
+                  '    values = dict(encoded)']
+        target = 'values[{!r}]'
+        names = nested
+    for index, name in enumerate(names):
+        if name in nested:
+            namespace['decode_%d' % index] = _msgpack_decoder(nested[name])
+            lines += ['    value = encoded[%r]' % name,
+                      '    %s = decode_%d(value) if value.__class__ is dict else value' % (target.format(name), index)]
+        else:
+            lines += ['    %s = encoded[%r]' % (target.format(name), name)]
+    if not slots:
+        lines += ['    obj.__dict__ = values']
+    lines += ['    return obj']
+    exec('\n'.join(lines), namespace)
+    decoder = _msgpack_decoders[cls] = namespace['decode']
+    return decoder
+
+
+def _msgpack_decoder(cls):
+    decoder = _msgpack_decoders.get(cls)
+    if decoder is None:
+        decoder = _compile_msgpack_decoder(cls)
+    return decoder
+
 
 class MsgpackMixin:
+    __slots__ = ()
+
     def __repr__(self):
         from pprint import pformat
-        return "<" + type(self).__name__ + "> " + pformat(vars(self), indent=4, width=1)
+        return "<" + type(self).__name__ + "> " + pformat(self.to_msgpack(), indent=4, width=1)
 
     def to_msgpack(self, *args, **kwargs):
-        return self.__dict__
+        slots = _msgpack_schema(type(self))[2]
+        if not slots:
+            return self.__dict__
+        return {name: getattr(self, name) for name in slots}
 
     @classmethod
     def from_msgpack(cls, encoded):
+        if not isinstance(encoded, dict):
+            return encoded
+        try:
+            return _msgpack_decoder(cls)(encoded)
+        except KeyError:
+            pass
+
+        # some fields are missing, start from the defaults
+        _, nested, slots = _msgpack_schema(cls)
         obj = cls()
-        # ww = encoded.items()
-        # obj.__dict__ = {k.decode('utf-8'): (from_msgpack(v.__class__, v) if hasattr(v, "__dict__") else v) for k, v in encoded.items()}
-        if isinstance(encoded, dict):
-            for k, v in encoded.items():
-                if (isinstance(v, dict) and hasattr(getattr(obj, k).__class__, 'from_msgpack')):
-                    obj.__dict__[k] = getattr(getattr(obj, k).__class__, 'from_msgpack')(v)
-                else:
-                    obj.__dict__[k] = v
-        else:
-            obj = encoded
-
-        # obj.__dict__ = { k : (v if not isinstance(v, dict) else getattr(getattr(obj, k).__class__, "from_msgpack")(v)) for k, v in encoded.items()}
-        # return cls(**msgpack.unpack(encoded))
+        for name, value in encoded.items():
+            if slots and name not in slots:
+                continue
+            if name in nested and isinstance(value, dict):
+                value = nested[name].from_msgpack(value)
+            setattr(obj, name, value)
         return obj
 
 class _ImageType(type):
@@ -90,17 +171,14 @@ class WeatherParameter:
     Enabled = 8
 
 class Vector2r(MsgpackMixin):
-    x_val = 0.0
-    y_val = 0.0
+    __slots__ = ('x_val', 'y_val')
 
     def __init__(self, x_val = 0.0, y_val = 0.0):
         self.x_val = x_val
         self.y_val = y_val
 
 class Vector3r(MsgpackMixin):
-    x_val = 0.0
-    y_val = 0.0
-    z_val = 0.0
+    __slots__ = ('x_val', 'y_val', 'z_val')
 
     def __init__(self, x_val=0.0, y_val=0.0, z_val=0.0):
         self.x_val = x_val
@@ -161,10 +239,7 @@ class Vector3r(MsgpackMixin):
         return iter((self.x_val, self.y_val, self.z_val))
 
 class Quaternionr(MsgpackMixin):
-    w_val = 0.0
-    x_val = 0.0
-    y_val = 0.0
-    z_val = 0.0
+    __slots__ = ('w_val', 'x_val', 'y_val', 'z_val')
 
     def __init__(self, x_val = 0.0, y_val = 0.0, z_val = 0.0, w_val = 1.0):
         self.x_val = x_val
@@ -256,8 +331,7 @@ class Quaternionr(MsgpackMixin):
         return iter((self.x_val, self.y_val, self.z_val, self.w_val))
 
 class Pose(MsgpackMixin):
-    position = Vector3r()
-    orientation = Quaternionr()
+    __slots__ = ('position', 'orientation')
 
     def __init__(self, position_val = None, orientation_val = None):
         position_val = position_val if position_val is not None else Vector3r()
@@ -276,12 +350,235 @@ class Pose(MsgpackMixin):
         return iter((self.position, self.orientation))
 
 class Twist(MsgpackMixin):
-    linear = Vector3r()
-    angular = Vector3r()
+    __slots__ = ('linear', 'angular')
+
+    def __init__(self, linear_val=None, angular_val=None):
+        self.linear = linear_val if linear_val is not None else Vector3r()
+        self.angular = angular_val if angular_val is not None else Vector3r()
+
+
+def _quaternion_multiply(a, b):
+    """Hamilton product of quaternion arrays of shape (..., 4) in x, y, z, w order, like `Quaternionr.__mul__`"""
+    ax, ay, az, aw = np.moveaxis(a, -1, 0)
+    bx, by, bz, bw = np.moveaxis(b, -1, 0)
+    return np.stack((bx*aw + bw*ax + bz*ay - by*az,
+                     by*aw + bw*ay + bx*az - bz*ax,
+                     bz*aw + bw*az + by*ax - bx*ay,
+                     bw*aw - bx*ax - by*ay - bz*az), axis=-1)
+
+
+def _quaternion_inverse(q):
+    conjugate = q * np.array([-1.0, -1.0, -1.0, 1.0])
+    return conjugate / np.sum(q * q, axis=-1, keepdims=True)
+
+
+def _quaternion_rotate(q, v):
+    """Rotates vectors of shape (..., 3) by unit quaternions of shape (..., 4), the same as q * v * q.inverse()"""
+    xyz = q[..., :3]
+    t = 2.0 * np.cross(xyz, v)
+    return v + q[..., 3:] * t + np.cross(xyz, t)
+
+
+def _quaternion_to_euler_angles(q):
+    """Vectorized `utils.quaternion_to_euler_angles`, returns (..., 3) roll, pitch, yaw"""
+    x, y, z, w = np.moveaxis(q, -1, 0)
+    roll = np.arctan2(2.0 * (w*x + y*z), 1.0 - 2.0 * (x*x + y*y))
+    pitch = np.arcsin(np.clip(2.0 * (w*y - z*x), -1.0, 1.0))
+    yaw = np.arctan2(2.0 * (w*z + x*y), 1.0 - 2.0 * (y*y + z*z))
+    return np.stack((roll, pitch, yaw), axis=-1)
+
+
+def _euler_angles_to_quaternion(roll, pitch, yaw):
+    """Vectorized `utils.euler_to_quaternion`, returns (..., 4) quaternions in x, y, z, w order"""
+    cr, sr = np.cos(np.multiply(roll, 0.5)), np.sin(np.multiply(roll, 0.5))
+    cp, sp = np.cos(np.multiply(pitch, 0.5)), np.sin(np.multiply(pitch, 0.5))
+    cy, sy = np.cos(np.multiply(yaw, 0.5)), np.sin(np.multiply(yaw, 0.5))
+    return np.stack((cy*sr*cp - sy*cr*sp,
+                     cy*cr*sp + sy*sr*cp,
+                     sy*cr*cp - cy*sr*sp,
+                     cy*cr*cp + sy*sr*sp), axis=-1)
+
+
+_vector3r_items = operator.itemgetter('x_val', 'y_val', 'z_val')
+_vector3r_attrs = operator.attrgetter('x_val', 'y_val', 'z_val')
+_quaternionr_items = operator.itemgetter('x_val', 'y_val', 'z_val', 'w_val')
+_quaternionr_attrs = operator.attrgetter('x_val', 'y_val', 'z_val', 'w_val')
+
+
+def _rows(objects, getter, width):
+    """Reads the fields picked by getter from every object into an (N, width) float64 array"""
+    return np.fromiter(itertools.chain.from_iterable(map(getter, objects)), np.float64,
+                       len(objects) * width).reshape(-1, width)
+
+
+class Vector3rArray:
+    """
+    A batch of N Vector3r stored as one (N, 3) float64 array, see `values`. It can be passed wherever the APIs take a
+    list of Vector3r, e.g. `simPlotPoints()` or `moveOnPathAsync()`.
+    """
+    __slots__ = ('values',)
+
+    def __init__(self, values=None):
+        values = np.zeros((0, 3)) if values is None else values
+        self.values = np.asarray(values, dtype=np.float64).reshape(-1, 3)
+
+    @classmethod
+    def from_list(cls, vectors):
+        return cls(_rows(vectors, _vector3r_attrs, 3))
+
+    @classmethod
+    def from_msgpack(cls, encoded):
+        return cls(_rows(encoded, _vector3r_items, 3))
+
+    def to_msgpack(self, *args, **kwargs):
+        return [{'x_val': x, 'y_val': y, 'z_val': z} for x, y, z in self.values.tolist()]
+
+    def to_list(self):
+        return [Vector3r(x, y, z) for x, y, z in self.values.tolist()]
+
+    def to_numpy_array(self):
+        return self.values
+
+    def containsNan(self):
+        return np.isnan(self.values).any(axis=1)
+
+    def get_length(self):
+        return np.linalg.norm(self.values, axis=1)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return Vector3r(*self.values[index].tolist())
+        return Vector3rArray(self.values[index])
+
+    def __iter__(self):
+        return iter(self.to_list())
+
+    def __repr__(self):
+        return "<Vector3rArray> " + repr(self.values)
+
+
+class PoseArray:
+    """
+    A batch of N Pose stored as an (N, 3) float64 `positions` array and an (N, 4) float64 `orientations` array with
+    the quaternions in x, y, z, w order. It is returned by the pose listing APIs with `as_numpy=True` and can be
+    passed wherever the APIs take a list of Pose, e.g. `simPlotTransforms()`.
+    All operations work on the whole batch at once, a single Pose operand is broadcast.
+    """
+    __slots__ = ('positions', 'orientations')
+
+    def __init__(self, positions=None, orientations=None):
+        positions = np.zeros((0, 3)) if positions is None else positions
+        self.positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        if orientations is None:
+            orientations = np.zeros((len(self.positions), 4))
+            orientations[:, 3] = 1.0
+        self.orientations = np.asarray(orientations, dtype=np.float64).reshape(-1, 4)
+        if len(self.positions) != len(self.orientations):
+            raise ValueError('got %d positions but %d orientations' % (len(self.positions), len(self.orientations)))
+
+    @classmethod
+    def from_list(cls, poses):
+        return cls(_rows([pose.position for pose in poses], _vector3r_attrs, 3),
+                   _rows([pose.orientation for pose in poses], _quaternionr_attrs, 4))
+
+    @classmethod
+    def from_msgpack(cls, encoded):
+        return cls(_rows([pose['position'] for pose in encoded], _vector3r_items, 3),
+                   _rows([pose['orientation'] for pose in encoded], _quaternionr_items, 4))
+
+    @classmethod
+    def from_euler_angles(cls, positions, roll, pitch, yaw):
+        """Builds the poses from positions and roll, pitch, yaw angles in radians, see `utils.euler_to_quaternion()`"""
+        return cls(positions, _euler_angles_to_quaternion(roll, pitch, yaw))
+
+    def to_msgpack(self, *args, **kwargs):
+        return [{'position': {'x_val': x, 'y_val': y, 'z_val': z},
+                 'orientation': {'w_val': qw, 'x_val': qx, 'y_val': qy, 'z_val': qz}}
+                for (x, y, z), (qx, qy, qz, qw) in zip(self.positions.tolist(), self.orientations.tolist())]
+
+    def to_list(self):
+        return [Pose(Vector3r(x, y, z), Quaternionr(qx, qy, qz, qw))
+                for (x, y, z), (qx, qy, qz, qw) in zip(self.positions.tolist(), self.orientations.tolist())]
+
+    def containsNan(self):
+        return np.isnan(self.positions).any(axis=1) | np.isnan(self.orientations).any(axis=1)
+
+    def to_euler_angles(self):
+        """
+        Returns:
+            np.ndarray: (N, 3) roll, pitch, yaw in radians, see `utils.quaternion_to_euler_angles()`
+        """
+        return _quaternion_to_euler_angles(self.orientations)
+
+    def rotate(self, vectors):
+        """
+        Rotates vectors by the orientations, without translating them.
+
+        Args:
+            vectors (Vector3rArray | Vector3r | np.ndarray): N vectors, or a single vector that is rotated by every pose
+
+        Returns:
+            Vector3rArray: The N rotated vectors
+        """
+        return Vector3rArray(_quaternion_rotate(self.orientations, _as_vector_rows(vectors)))
+
+    def transform(self, points):
+        """
+        Transforms points from the frame of each pose into the frame the poses are expressed in.
+
+        Args:
+            points (Vector3rArray | Vector3r | np.ndarray): N points, or a single point that is transformed by every pose
+
+        Returns:
+            Vector3rArray: The N transformed points
+        """
+        return Vector3rArray(self.positions + _quaternion_rotate(self.orientations, _as_vector_rows(points)))
+
+    def compose(self, other):
+        """
+        Chains the poses, the result maps from the frame of `other` into the frame of `self`.
+
+        Args:
+            other (PoseArray | Pose): N poses expressed relative to these poses, or a single relative pose
+
+        Returns:
+            PoseArray: The N composed poses
+        """
+        if isinstance(other, Pose):
+            other = PoseArray.from_list([other])
+        return PoseArray(self.positions + _quaternion_rotate(self.orientations, other.positions),
+                         _quaternion_multiply(self.orientations, other.orientations))
+
+    def inverse(self):
+        orientations = _quaternion_inverse(self.orientations)
+        return PoseArray(-_quaternion_rotate(orientations, self.positions), orientations)
+
+    def __len__(self):
+        return len(self.positions)
 
-    def __init__(self, linear_val=Vector3r(), angular_val=Vector3r()):
-        self.linear = linear_val
-        self.angular = angular_val
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            x, y, z = self.positions[index].tolist()
+            qx, qy, qz, qw = self.orientations[index].tolist()
+            return Pose(Vector3r(x, y, z), Quaternionr(qx, qy, qz, qw))
+        return PoseArray(self.positions[index], self.orientations[index])
+
+    def __iter__(self):
+        return iter(self.to_list())
+
+    def __repr__(self):
+        return "<PoseArray> positions=" + repr(self.positions) + ", orientations=" + repr(self.orientations)
+
+
+def _as_vector_rows(vectors):
+    if isinstance(vectors, Vector3rArray):
+        return vectors.values
+    if isinstance(vectors, Vector3r):
+        return np.array([vectors.x_val, vectors.y_val, vectors.z_val], dtype=np.float64)
+    return np.asarray(vectors, dtype=np.float64)
 
 
 class CollisionInfo(MsgpackMixin):
@@ -295,9 +592,12 @@ class CollisionInfo(MsgpackMixin):
     object_id = -1
 
 class GeoPoint(MsgpackMixin):
-    latitude = 0.0
-    longitude = 0.0
-    altitude = 0.0
+    __slots__ = ('latitude', 'longitude', 'altitude')
+
+    def __init__(self, latitude=0.0, longitude=0.0, altitude=0.0):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.altitude = altitude
 
 class YawMode(MsgpackMixin):
     is_rate = True
@@ -391,12 +691,17 @@ class CarControls(MsgpackMixin):
             self.throttle = - abs(throttle_val)
 
 class KinematicsState(MsgpackMixin):
-    position = Vector3r()
-    orientation = Quaternionr()
-    linear_velocity = Vector3r()
-    angular_velocity = Vector3r()
-    linear_acceleration = Vector3r()
-    angular_acceleration = Vector3r()
+    __slots__ = ('position', 'orientation', 'linear_velocity', 'angular_velocity', 'linear_acceleration',
+                 'angular_acceleration')
+
+    def __init__(self, position=None, orientation=None, linear_velocity=None, angular_velocity=None,
+                 linear_acceleration=None, angular_acceleration=None):
+        self.position = position if position is not None else Vector3r()
+        self.orientation = orientation if orientation is not None else Quaternionr()
+        self.linear_velocity = linear_velocity if linear_velocity is not None else Vector3r()
+        self.angular_velocity = angular_velocity if angular_velocity is not None else Vector3r()
+        self.linear_acceleration = linear_acceleration if linear_acceleration is not None else Vector3r()
+        self.angular_acceleration = angular_acceleration if angular_acceleration is not None else Vector3r()
 
 class EnvironmentState(MsgpackMixin):
     position = Vector3r()
@@ -443,26 +748,144 @@ class CameraInfo(MsgpackMixin):
     fov = -1
     proj_mat = ProjectionMatrix()
 
+_GPU_LIDAR_POINT_DTYPE = np.dtype([('x', np.float32), ('y', np.float32), ('z', np.float32),
+                                   ('rgb', np.uint32), ('intensity', np.float32)])
+_ECHO_POINT_DTYPE = np.dtype([('x', np.float32), ('y', np.float32), ('z', np.float32),
+                              ('attenuation', np.float32), ('distance', np.float32), ('reflections', np.float32)])
+_ECHO_PASSIVE_POINT_DTYPE = np.dtype(_ECHO_POINT_DTYPE.descr + [('reflection_x', np.float32),
+                                                                ('reflection_y', np.float32),
+                                                                ('reflection_z', np.float32)])
+
+
+def _point_cloud_array(point_cloud, floats_per_point):
+    """ Flat point cloud list to a (N, floats_per_point) float32 array, ignoring an incomplete last point """
+    if not isinstance(point_cloud, (list, tuple, np.ndarray)):
+        return np.empty((0, floats_per_point), np.float32)
+    points = np.asarray(point_cloud, np.float32).ravel()
+    points = points[:points.size - points.size % floats_per_point]
+    return points.reshape(-1, floats_per_point)
+
+
+def _point_cloud_structured(point_cloud, dtype):
+    points = _point_cloud_array(point_cloud, len(dtype.names))
+    structured = np.empty(points.shape[0], dtype)
+    for index, name in enumerate(dtype.names):
+        structured[name] = points[:, index]
+    return structured
+
+
+def _categorical_labels(labels, labels_per_point=1):
+    """ Label strings to (codes, names) with names[codes] giving back the labels """
+    if not isinstance(labels, (list, tuple, np.ndarray)) or len(labels) == 0:
+        return np.empty((0,) if labels_per_point == 1 else (0, labels_per_point), np.int32), np.empty(0, str)
+    names, codes = np.unique(np.asarray(labels), return_inverse=True)
+    codes = codes.astype(np.int32).ravel()
+    if labels_per_point > 1:
+        codes = codes[:codes.size - codes.size % labels_per_point].reshape(-1, labels_per_point)
+    return codes, names
+
+
 class LidarData(MsgpackMixin):
-    point_cloud = 0.0
-    time_stamp = np.uint64(0)
-    pose = Pose()
-    groundtruth = ''
+    __slots__ = ('point_cloud', 'time_stamp', 'pose', 'groundtruth')
+
+    def __init__(self, point_cloud=0.0, time_stamp=np.uint64(0), pose=None, groundtruth=''):
+        self.point_cloud = point_cloud
+        self.time_stamp = time_stamp
+        self.pose = pose if pose is not None else Pose()
+        self.groundtruth = groundtruth
+
+    @property
+    def points(self):
+        """ (N, 3) float32 array with the x, y, z coordinates of the point cloud """
+        return _point_cloud_array(self.point_cloud, 3)
+
+    def groundtruth_labels(self):
+        """
+        Groundtruth labels as a categorical array
+
+        Returns:
+            tuple: (N,) int32 array of indices into the second element, an array of the unique label names
+        """
+        return _categorical_labels(self.groundtruth)
 
 
 class GPULidarData(MsgpackMixin):
-    point_cloud = 0.0
-    time_stamp = np.uint64(0)
-    pose = Pose()
+    __slots__ = ('point_cloud', 'time_stamp', 'pose')
+
+    def __init__(self, point_cloud=0.0, time_stamp=np.uint64(0), pose=None):
+        self.point_cloud = point_cloud
+        self.time_stamp = time_stamp
+        self.pose = pose if pose is not None else Pose()
+
+    @property
+    def points(self):
+        """ (N, 3) float32 array with the x, y, z coordinates of the point cloud """
+        return _point_cloud_array(self.point_cloud, 5)[:, :3]
+
+    def as_structured(self):
+        """
+        Point cloud as a structured array with fields x, y, z (float32), rgb (uint32) and intensity (float32)
+
+        Returns:
+            numpy.ndarray: (N,) structured array
+        """
+        return _point_cloud_structured(self.point_cloud, _GPU_LIDAR_POINT_DTYPE)
 
 
 class EchoData(MsgpackMixin):
-    point_cloud = 0.0
-    time_stamp = np.uint64(0)
-    pose = Pose()
-    groundtruth = ''
-    passive_beacons_point_cloud = 0.0
-    passive_beacons_groundtruth = ''
+    __slots__ = ('point_cloud', 'time_stamp', 'pose', 'groundtruth', 'passive_beacons_point_cloud',
+                 'passive_beacons_groundtruth')
+
+    def __init__(self, point_cloud=0.0, time_stamp=np.uint64(0), pose=None, groundtruth='',
+                 passive_beacons_point_cloud=0.0, passive_beacons_groundtruth=''):
+        self.point_cloud = point_cloud
+        self.time_stamp = time_stamp
+        self.pose = pose if pose is not None else Pose()
+        self.groundtruth = groundtruth
+        self.passive_beacons_point_cloud = passive_beacons_point_cloud
+        self.passive_beacons_groundtruth = passive_beacons_groundtruth
+
+    @property
+    def points(self):
+        """ (N, 3) float32 array with the x, y, z coordinates of the active point cloud """
+        return _point_cloud_array(self.point_cloud, 6)[:, :3]
+
+    def as_structured(self):
+        """
+        Active point cloud as a structured array with float32 fields x, y, z, attenuation, distance and reflections
+
+        Returns:
+            numpy.ndarray: (N,) structured array
+        """
+        return _point_cloud_structured(self.point_cloud, _ECHO_POINT_DTYPE)
+
+    def passive_beacons_as_structured(self):
+        """
+        Passive point cloud as a structured array with the float32 fields of `as_structured()` followed by
+        reflection_x, reflection_y and reflection_z
+
+        Returns:
+            numpy.ndarray: (N,) structured array
+        """
+        return _point_cloud_structured(self.passive_beacons_point_cloud, _ECHO_PASSIVE_POINT_DTYPE)
+
+    def groundtruth_labels(self):
+        """
+        Active groundtruth labels as a categorical array
+
+        Returns:
+            tuple: (N,) int32 array of indices into the second element, an array of the unique label names
+        """
+        return _categorical_labels(self.groundtruth)
+
+    def passive_beacons_groundtruth_labels(self):
+        """
+        Passive groundtruth labels as a categorical array, with the object label and the source beacon per point
+
+        Returns:
+            tuple: (N, 2) int32 array of indices into the second element, an array of the unique label names
+        """
+        return _categorical_labels(self.passive_beacons_groundtruth, 2)
 
 
 class UwbSensorData(MsgpackMixin):
@@ -475,21 +898,78 @@ class UwbSensorData(MsgpackMixin):
     beaconsActivePosZ = []
 
 
+def _ranges_structured(ranges, anchor_ids, time_stamps, anchor_x, anchor_y, anchor_z, valid_ranges, distances,
+                       rssis):
+    """ Parallel range lists of `UwbData` or `WifiData` to a structured array, see `UwbData.ranges_as_structured()` """
+    anchor_ids = np.asarray(anchor_ids, dtype=str)
+    structured = np.empty(anchor_ids.shape[0], [('tag_index', np.int32), ('anchor_id', anchor_ids.dtype),
+                                                ('time_stamp', np.uint64), ('anchor_x', np.float32),
+                                                ('anchor_y', np.float32), ('anchor_z', np.float32),
+                                                ('valid_range', np.bool_), ('distance', np.float32),
+                                                ('rssi', np.float32)])
+    structured['anchor_id'] = anchor_ids
+    structured['time_stamp'] = time_stamps
+    structured['anchor_x'] = anchor_x
+    structured['anchor_y'] = anchor_y
+    structured['anchor_z'] = anchor_z
+    structured['valid_range'] = valid_ranges
+    structured['distance'] = distances
+    structured['rssi'] = rssis
+    structured['tag_index'] = -1
+    counts = [len(tag_ranges) for tag_ranges in ranges]
+    structured['tag_index'][np.fromiter(itertools.chain.from_iterable(ranges), np.int64, sum(counts))] = \
+        np.repeat(np.arange(len(counts), dtype=np.int32), counts)
+    return structured
+
+
+def _tags_structured(tag_ids, tag_x, tag_y, tag_z):
+    tag_ids = np.asarray(tag_ids, dtype=str)
+    structured = np.empty(tag_ids.shape[0], [('tag_id', tag_ids.dtype), ('x', np.float32), ('y', np.float32),
+                                             ('z', np.float32)])
+    structured['tag_id'] = tag_ids
+    structured['x'] = tag_x
+    structured['y'] = tag_y
+    structured['z'] = tag_z
+    return structured
+
+
 class UwbData(MsgpackMixin):
-    time_stamp = []
-    mur_achorId = []
-    mur_anchorX = []
-    mur_anchorY = []
-    mur_anchorZ = []
-    mur_anchor_valid_range = []
-    mur_anchor_distance = []
-    mur_anchor_rssi = []
+    mur_time_stamp = []
+    mur_anchorId = []
+    mur_anchorPosX = []
+    mur_anchorPosY = []
+    mur_anchorPosZ = []
+    mur_valid_range = []
+    mur_distance = []
+    mur_rssi = []
     mura_tagId = []
-    mura_tagX = []
-    mura_tagY = []
-    mura_tagZ = []
+    mura_tagPosX = []
+    mura_tagPosY = []
+    mura_tagPosZ = []
     mura_ranges = []
 
+    def ranges_as_structured(self):
+        """
+        All ranges as one structured array with fields tag_index (int32, index of the tag in `tags_as_structured()`
+        whose ranges list the range, -1 for none), anchor_id (str), time_stamp (uint64), anchor_x, anchor_y, anchor_z
+        (float32), valid_range (bool), distance and rssi (float32)
+
+        Returns:
+            numpy.ndarray: (N,) structured array
+        """
+        return _ranges_structured(self.mura_ranges, self.mur_anchorId, self.mur_time_stamp, self.mur_anchorPosX,
+                                  self.mur_anchorPosY, self.mur_anchorPosZ, self.mur_valid_range, self.mur_distance,
+                                  self.mur_rssi)
+
+    def tags_as_structured(self):
+        """
+        All tags as one structured array with fields tag_id (str), x, y and z (float32)
+
+        Returns:
+            numpy.ndarray: (M,) structured array
+        """
+        return _tags_structured(self.mura_tagId, self.mura_tagPosX, self.mura_tagPosY, self.mura_tagPosZ)
+
 
 class WifiSensorData(MsgpackMixin):
     time_stamp = np.uint64(0)
@@ -502,37 +982,66 @@ class WifiSensorData(MsgpackMixin):
 
 
 class WifiData(MsgpackMixin):
-    time_stamp = []
-    wr_achorId = []
-    wr_anchorX = []
-    wr_anchorY = []
-    wr_anchorZ = []
-    wr_anchor_valid_range = []
-    wr_anchor_distance = []
-    wr_anchor_rssi = []
+    wr_time_stamp = []
+    wr_anchorId = []
+    wr_anchorPosX = []
+    wr_anchorPosY = []
+    wr_anchorPosZ = []
+    wr_valid_range = []
+    wr_distance = []
+    wr_rssi = []
     wra_tagId = []
-    wra_tagX = []
-    wra_tagY = []
-    wra_tagZ = []
+    wra_tagPosX = []
+    wra_tagPosY = []
+    wra_tagPosZ = []
     wra_ranges = []
 
+    def ranges_as_structured(self):
+        """
+        All ranges as one structured array, with the fields of `UwbData.ranges_as_structured()`
+
+        Returns:
+            numpy.ndarray: (N,) structured array
+        """
+        return _ranges_structured(self.wra_ranges, self.wr_anchorId, self.wr_time_stamp, self.wr_anchorPosX,
+                                  self.wr_anchorPosY, self.wr_anchorPosZ, self.wr_valid_range, self.wr_distance,
+                                  self.wr_rssi)
+
+    def tags_as_structured(self):
+        """
+        All tags as one structured array with fields tag_id (str), x, y and z (float32)
+
+        Returns:
+            numpy.ndarray: (M,) structured array
+        """
+        return _tags_structured(self.wra_tagId, self.wra_tagPosX, self.wra_tagPosY, self.wra_tagPosZ)
+
 
 class ImuData(MsgpackMixin):
-    time_stamp = np.uint64(0)
-    orientation = Quaternionr()
-    angular_velocity = Vector3r()
-    linear_acceleration = Vector3r()
+    __slots__ = ('time_stamp', 'orientation', 'angular_velocity', 'linear_acceleration')
+
+    def __init__(self, time_stamp=np.uint64(0), orientation=None, angular_velocity=None, linear_acceleration=None):
+        self.time_stamp = time_stamp
+        self.orientation = orientation if orientation is not None else Quaternionr()
+        self.angular_velocity = angular_velocity if angular_velocity is not None else Vector3r()
+        self.linear_acceleration = linear_acceleration if linear_acceleration is not None else Vector3r()
 
 class BarometerData(MsgpackMixin):
-    time_stamp = np.uint64(0)
-    altitude = Quaternionr()
-    pressure = Vector3r()
-    qnh = Vector3r()
+    __slots__ = ('time_stamp', 'altitude', 'pressure', 'qnh')
+
+    def __init__(self, time_stamp=np.uint64(0), altitude=0.0, pressure=0.0, qnh=0.0):
+        self.time_stamp = time_stamp
+        self.altitude = altitude
+        self.pressure = pressure
+        self.qnh = qnh
 
 class MagnetometerData(MsgpackMixin):
-    time_stamp = np.uint64(0)
-    magnetic_field_body = Vector3r()
-    magnetic_field_covariance = 0.0
+    __slots__ = ('time_stamp', 'magnetic_field_body', 'magnetic_field_covariance')
+
+    def __init__(self, time_stamp=np.uint64(0), magnetic_field_body=None, magnetic_field_covariance=0.0):
+        self.time_stamp = time_stamp
+        self.magnetic_field_body = magnetic_field_body if magnetic_field_body is not None else Vector3r()
+        self.magnetic_field_covariance = magnetic_field_covariance
 
 class GnssFixType(MsgpackMixin):
     GNSS_FIX_NO_FIX = 0
@@ -541,24 +1050,49 @@ class GnssFixType(MsgpackMixin):
     GNSS_FIX_3D_FIX = 3
 
 class GnssReport(MsgpackMixin):
-    geo_point = GeoPoint()
-    eph = 0.0
-    epv = 0.0
-    velocity = Vector3r()
-    fix_type = GnssFixType()
-    time_utc = np.uint64(0)
+    __slots__ = ('geo_point', 'eph', 'epv', 'velocity', 'fix_type', 'time_utc')
+
+    def __init__(self, geo_point=None, eph=0.0, epv=0.0, velocity=None, fix_type=GnssFixType.GNSS_FIX_NO_FIX,
+                 time_utc=np.uint64(0)):
+        self.geo_point = geo_point if geo_point is not None else GeoPoint()
+        self.eph = eph
+        self.epv = epv
+        self.velocity = velocity if velocity is not None else Vector3r()
+        self.fix_type = fix_type
+        self.time_utc = time_utc
 
 class GpsData(MsgpackMixin):
-    time_stamp = np.uint64(0)
-    gnss = GnssReport()
-    is_valid = False
+    __slots__ = ('time_stamp', 'gnss', 'is_valid')
+
+    def __init__(self, time_stamp=np.uint64(0), gnss=None, is_valid=False):
+        self.time_stamp = time_stamp
+        self.gnss = gnss if gnss is not None else GnssReport()
+        self.is_valid = is_valid
 
 class DistanceSensorData(MsgpackMixin):
+    __slots__ = ('time_stamp', 'distance', 'min_distance', 'max_distance', 'relative_pose')
+
+    def __init__(self, time_stamp=np.uint64(0), distance=0.0, min_distance=0.0, max_distance=0.0,
+                 relative_pose=None):
+        self.time_stamp = time_stamp
+        self.distance = distance
+        self.min_distance = min_distance
+        self.max_distance = max_distance
+        self.relative_pose = relative_pose if relative_pose is not None else Pose()
+
+class SensorSnapshot(MsgpackMixin):
     time_stamp = np.uint64(0)
-    distance = 0.0
-    min_distance = 0.0
-    max_distance = 0.0
-    relative_pose = Pose()
+    time_stamp_spread = np.uint64(0)
+    imu = None
+    barometer = None
+    magnetometer = None
+    gps = None
+    distance = None
+    lidar = None
+    gpulidar = None
+    echo = None
+    pose = None
+    kinematics = None
 
 class Box2D(MsgpackMixin):
     min = Vector2r()
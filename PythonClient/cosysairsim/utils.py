@@ -5,13 +5,15 @@ import re
 import logging
 import csv
 from .types import *
+from .types import (_quaternion_multiply, _quaternion_inverse, _quaternion_rotate, _quaternion_to_euler_angles,
+                    _euler_angles_to_quaternion)
 
 
 def string_to_uint8_array(bstr):
-    return np.fromstring(bstr, np.uint8)
+    return np.frombuffer(bstr, np.uint8)
     
 def string_to_float_array(bstr):
-    return np.fromstring(bstr, np.float32)
+    return np.frombuffer(bstr, np.float32)
     
 def list_to_2d_float_array(flst, width, height):
     return np.reshape(np.asarray(flst, np.float32), (height, width))
@@ -19,6 +21,35 @@ def list_to_2d_float_array(flst, width, height):
 def get_pfm_array(response):
     return list_to_2d_float_array(response.image_data_float, response.width, response.height)
 
+
+def decode_image_response(response):
+    """
+    Replace the pixel payload of an ImageResponse with NumPy arrays, in place.
+
+    Uncompressed uint8 images become a read-only (H, W, C) view on the received bytes, compressed images a flat
+    uint8 view of the encoded (png) bytes and float images a (H, W) float32 array.
+
+    Args:
+        response (ImageResponse): Response as returned by `simGetImages`
+
+    Returns:
+        ImageResponse: The same response, with `image_data_uint8` and `image_data_float` as NumPy arrays
+    """
+    if response.pixels_as_float:
+        image_data_float = np.asarray(response.image_data_float, np.float32)
+        if response.width * response.height == image_data_float.size:
+            image_data_float = image_data_float.reshape(response.height, response.width)
+        response.image_data_float = image_data_float
+        response.image_data_uint8 = np.empty(0, np.uint8)
+    else:
+        image_data_uint8 = np.frombuffer(response.image_data_uint8, np.uint8)
+        num_pixels = response.width * response.height
+        if not response.compress and num_pixels > 0 and image_data_uint8.size % num_pixels == 0:
+            image_data_uint8 = image_data_uint8.reshape(response.height, response.width, -1)
+        response.image_data_uint8 = image_data_uint8
+        response.image_data_float = np.empty(0, np.float32)
+    return response
+
     
 def get_public_fields(obj):
     return [attr for attr in dir(obj)
@@ -132,26 +163,27 @@ def get_colormap_colors(maxVal, enable1, enable2, enable3, colormap, channelValu
 
 
 def generate_colormap():
+    """
+    Generates the segmentation color map of the simulator, the color of object ID i is row i of the (N, 3) result.
+
+    It is the same palette `get_colormap_colors()` produces for every channel maximum and enabled channel
+    combination, computed at once: every color is a triple of channel value indices whose maximum m picks the outer
+    iteration, the channels equal to m the enabled combination and the indices themselves the order within it.
+    """
     channelValues = get_colormap_channel_values()
     numPerChannel = 256
-    colorMap = []
-    okValues = []
-    num_per_channel = 256
     uneven_start = 79
     full_start = 149
-    for i in np.arange(uneven_start, full_start + 1, 2):
-        okValues.append(i)
-    for i in np.arange(full_start + 1, numPerChannel, 1):
-        okValues.append(i)
-    for maxChannelIndex in range(0, numPerChannel):
-        get_colormap_colors(maxChannelIndex, False, False, True, colorMap, channelValues, okValues)
-        get_colormap_colors(maxChannelIndex, False, True, False, colorMap, channelValues, okValues)
-        get_colormap_colors(maxChannelIndex, False, True, True, colorMap, channelValues, okValues)
-        get_colormap_colors(maxChannelIndex, True, False, False, colorMap, channelValues, okValues)
-        get_colormap_colors(maxChannelIndex, True, False, True, colorMap, channelValues, okValues)
-        get_colormap_colors(maxChannelIndex, True, True, False, colorMap, channelValues, okValues)
-        get_colormap_colors(maxChannelIndex, True, True, True, colorMap, channelValues, okValues)
-    colorMap = np.asarray(colorMap)
+    okValues = np.concatenate((np.arange(uneven_start, full_start + 1, 2), np.arange(full_start + 1, numPerChannel)))
+    okValues = okValues[okValues != full_start]
+    indices = np.flatnonzero(np.isin(channelValues[:numPerChannel], okValues))
+    i, j, k = (a.ravel() for a in np.meshgrid(indices, indices, indices, indexing='ij'))
+    maxVal = np.maximum(np.maximum(i, j), k)
+    enabled = (i == maxVal) * 4 + (j == maxVal) * 2 + (k == maxVal)
+    order = np.argsort(maxVal * 8 + enabled, kind='stable')
+    gamma = np.asarray(gammaCorrectionTable)
+    colorMap = np.stack((gamma[channelValues[i[order]]], gamma[channelValues[j[order]]],
+                         gamma[channelValues[k[order]]]), axis=1)
     return colorMap
 
 def load_read_csv(path: str):
@@ -168,9 +200,123 @@ def load_read_csv(path: str):
 
     return matrix
 
+# process wide color map caches, filled in by the first call to load_colormap() and colormap_lookup()
+_colormap = None
+_colormap_lookup = None
+
+
 def load_colormap():
-    colorMap = np.load(os.path.dirname(os.path.abspath(__file__)) + "/colormap.npy")
-    return colorMap
+    """
+    Returns the segmentation color map, see `generate_colormap()`. It is read from the colormap.npy shipped with the
+    package, or generated when that is missing, only once per process. The array is shared and read-only.
+    """
+    global _colormap
+    if _colormap is None:
+        path = os.path.dirname(os.path.abspath(__file__)) + "/colormap.npy"
+        colorMap = np.load(path) if os.path.isfile(path) else generate_colormap()
+        colorMap.flags.writeable = False
+        _colormap = colorMap
+    return _colormap
+
+
+def colormap_lookup(rgb):
+    """
+    Looks up the object IDs of segmentation colors, i.e. their row in `load_colormap()`, for example to decode a
+    whole segmentation image in one call.
+
+    The lookup table is built once per process: every channel value is mapped to its index among the values that
+    channel takes in the color map, and those indices address a dense table of object IDs.
+
+    Args:
+        rgb (np.ndarray): (..., 3) array of colors in r, g, b order with values in [0 255], e.g. an (H, W, 3)
+            segmentation image
+
+    Returns:
+        np.ndarray: (...) int32 array of object IDs, -1 where the color is not in the color map
+    """
+    global _colormap_lookup
+    if _colormap_lookup is None:
+        colorMap = load_colormap()
+        channel_luts = []
+        channel_indices = []
+        for channel in range(3):
+            values, indices = np.unique(colorMap[:, channel], return_inverse=True)
+            lut = np.full(256, -1, dtype=np.int32)
+            lut[values] = np.arange(len(values))
+            channel_luts.append(lut)
+            channel_indices.append(indices.ravel())
+        table = np.full(tuple(len(np.flatnonzero(lut >= 0)) for lut in channel_luts), -1, dtype=np.int32)
+        table[tuple(channel_indices)] = np.arange(len(colorMap), dtype=np.int32)
+        _colormap_lookup = (channel_luts, table)
+    channel_luts, table = _colormap_lookup
+    rgb = np.asarray(rgb)
+    r = channel_luts[0][rgb[..., 0]]
+    g = channel_luts[1][rgb[..., 1]]
+    b = channel_luts[2][rgb[..., 2]]
+    valid = (r >= 0) & (g >= 0) & (b >= 0)
+    return np.where(valid, table[r, g, b], -1)
+
+
+def unpack_rgb(packed):
+    """
+    Splits packed `r << 16 | g << 8 | b` colors, like the rgb value of GPU LiDAR points, into their channels.
+
+    Args:
+        packed (np.ndarray): (N,) packed colors, as the float32 values the sensor sends or as integers
+
+    Returns:
+        np.ndarray: (N, 3) uint8 array of colors in r, g, b order
+    """
+    packed = np.asarray(packed).astype('<u4').reshape(-1)
+    return packed.view(np.uint8).reshape(-1, 4)[:, 2::-1]
+
+
+def gpulidar_segmentation(lidar_data, object_names=None):
+    """
+    Resolves the ground truth colors of a GPU LiDAR point cloud to instance segmentation object IDs, see
+    `colormap_lookup()`. The sensor must be configured to output instance segmentation colors.
+
+    Args:
+        lidar_data (GPULidarData): Data as returned by `getGPULidarData()`
+        object_names (list[str], optional): Result of `simListInstanceSegmentationObjects()` to also resolve the IDs
+            to object names
+
+    Returns:
+        tuple: (N, 3) uint8 colors and (N,) int32 object IDs, -1 for points without a known color. With
+        `object_names`, a third (N,) array holds the name of the object of every point, '' where there is none.
+    """
+    colors = unpack_rgb(lidar_data.as_structured()['rgb'])
+    ids = colormap_lookup(colors)
+    if object_names is None:
+        return colors, ids
+    # index -1 picks the appended empty name
+    names = np.append(np.asarray(object_names, dtype=object), '')
+    return colors, ids, names[np.where(ids < len(object_names), ids, -1)]
+
+
+def group_ranges_by_tag(range_data):
+    """
+    Groups the ranges of UWB or Wi-Fi data per tag, keeping for every anchor only the range with the highest RSSI.
+
+    Args:
+        range_data (UwbData | WifiData): Data as returned by `getUWBData()` or `getWifiData()`
+
+    Returns:
+        list[np.ndarray]: For every tag of `range_data.tags_as_structured()`, the structured array of its ranges as
+        returned by `ranges_as_structured()`, sorted by anchor ID
+    """
+    ranges = range_data.ranges_as_structured()
+    num_tags = len(range_data.tags_as_structured())
+    ranges = ranges[ranges['tag_index'] >= 0]
+    # by tag, then anchor, then strongest first; lexsort is stable so equal RSSIs keep the first range
+    ranges = ranges[np.lexsort((-ranges['rssi'], ranges['anchor_id'], ranges['tag_index']))]
+    first = np.ones(len(ranges), dtype=bool)
+    first[1:] = ((ranges['tag_index'][1:] != ranges['tag_index'][:-1])
+                 | (ranges['anchor_id'][1:] != ranges['anchor_id'][:-1]))
+    ranges = ranges[first]
+    if num_tags == 0:
+        return []
+    return np.split(ranges, np.searchsorted(ranges['tag_index'], np.arange(1, num_tags)))
 
 
 # helper method for converting getOrientation to roll/pitch/yaw
@@ -251,6 +397,51 @@ def apply_rotation_offset(position, pitch, yaw, roll):
 
     return rotated_position
 
+
+# Batch versions of the helpers above, for post-processing many samples at once. Quaternions are (N, 4) arrays in
+# x, y, z, w order (see `PoseArray.orientations`), vectors are (N, 3) arrays and angles are (N,) arrays in radians.
+# A single row or scalar is broadcast against the others.
+def quaternions_to_euler_angles(q):
+    """Batch `quaternion_to_euler_angles()`, returns an (N, 3) array of roll, pitch, yaw"""
+    return _quaternion_to_euler_angles(np.asarray(q, dtype=np.float64))
+
+
+def euler_angles_to_quaternions(roll, pitch, yaw):
+    """Batch `euler_to_quaternion()`, returns an (N, 4) array of quaternions"""
+    return _euler_angles_to_quaternion(roll, pitch, yaw)
+
+
+def euler_angles_to_rotation_matrices(roll, pitch, yaw):
+    """Batch `euler_to_rotation_matrix()`, returns an (N, 3, 3) array"""
+    cx, sx = np.cos(np.multiply(roll, 0.5)), np.sin(np.multiply(roll, 0.5))
+    cy, sy = np.cos(np.multiply(pitch, 0.5)), np.sin(np.multiply(pitch, 0.5))
+    cz, sz = np.cos(np.multiply(yaw, 0.5)), np.sin(np.multiply(yaw, 0.5))
+    R = np.stack((cy*cz, -cy*sz, sy * np.ones_like(cz),
+                  cx*sz + cz*sx*sy, cx*cz - sx*sy*sz, -cy*sx,
+                  sx*sz - cx*cz*sy, cz*sx + cx*sy*sz, cx*cy), axis=-1)
+    return R.reshape(R.shape[:-1] + (3, 3))
+
+
+def apply_rotation_offsets(positions, pitch, yaw, roll):
+    """Batch `apply_rotation_offset()`, returns an (N, 3) array"""
+    R = euler_angles_to_rotation_matrices(roll, pitch, yaw)
+    return np.einsum('...ij,...j->...i', R, np.asarray(positions, dtype=np.float64))
+
+
+def quaternions_multiply(a, b):
+    """Batch `Quaternionr.__mul__`, returns the (N, 4) Hamilton products a * b"""
+    return _quaternion_multiply(np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64))
+
+
+def quaternions_inverse(q):
+    """Batch `Quaternionr.inverse()`"""
+    return _quaternion_inverse(np.asarray(q, dtype=np.float64))
+
+
+def quaternions_rotate(q, v):
+    """Rotates the (N, 3) vectors v by the (N, 4) unit quaternions q, the batch form of `q * v * q.inverse()`"""
+    return _quaternion_rotate(np.asarray(q, dtype=np.float64), np.asarray(v, dtype=np.float64))
+
 def get_camera_type(cameraType):
     if cameraType == "Scene":
         cameraTypeClass = ImageType.Scene
@@ -1,7 +1,6 @@
-from numba.np.ufunc import parallel
 import numpy as np
 from types import SimpleNamespace
-from numba import njit, prange, set_num_threads
+from numba import njit, prange, get_num_threads
 
 EVENT_TYPE = np.dtype(
     [("timestamp", "f8"), ("x", "u2"), ("y", "u2"), ("polarity", "b")], align=True
@@ -12,81 +11,269 @@ MINIMUM_CONTRAST_THRESHOLD = 0.01
 
 CONFIG = SimpleNamespace(
     **{
-        "contrast_thresholds": (0.01, 0.01),
+        # Positive and negative log intensity change that fires an event, and the standard deviation of the per-pixel
+        # variation around them, sampled once when the simulator is initialized
+        "contrast_thresholds": (TOL, TOL),
         "sigma_contrast_thresholds": (0.0, 0.0),
         "refractory_period_ns": 1000,
         "max_events_per_frame": 200000,
+        # Number of output buffers image_callback cycles through, the arrays it returns stay valid
+        # for this many calls
+        "output_buffers": 2,
+        # With optical flow, frames are interpolated so no pixel moves more than this many pixels per step,
+        # using at most max_upsampling_steps steps between two images
+        "upsampling_max_displacement": 1.0,
+        "max_upsampling_steps": 16,
+        # Seed of the per-pixel contrast threshold noise
+        "seed": None,
+        # Events are sorted into at most this many time buckets per step, one per microsecond when the step is short
+        # enough and wider otherwise, which bounds the memory and time per frame after long gaps between images
+        "max_time_buckets": 1 << 14,
     }
 )
 
 
+@njit(inline="always")
+def _event_time(start_time, delta_time, i, spike_num, start_progress, end_progress):
+    # Event time in whole microseconds, the resolution of the output timestamps. Event i of spike_num fires when the
+    # pixel has made i / spike_num of its change, which is spread linearly over a step from start_progress to
+    # end_progress of the change.
+    return np.round(
+        start_time + delta_time * (i - start_progress * spike_num) / ((end_progress - start_progress) * spike_num)
+    )
+
+
 @njit(parallel=True)
-def esim(
-    x_end,
-    current_image,
-    previous_image,
+def count_events(
+    current_log_image,
+    previous_log_image,
     delta_time,
-    crossings,
-    last_time,
-    output_events,
+    positive_thresholds,
+    negative_thresholds,
+    spike_counts,
     spikes,
     refractory_period_ns,
-    max_events_per_frame,
-    n_pix_row,
 ):
-    count = 0
+    # Pass 1: the polarity and number of events of every pixel, see the docs for the crossing model
     max_spikes = int(delta_time / (refractory_period_ns * 1e-3))
-    for x in prange(x_end):
-        itdt = np.log(current_image[x])
-        it = np.log(previous_image[x])
+    for x in prange(current_log_image.size):
+        spike_counts[x] = 0
+        spikes[x] = 0
+
+        itdt = current_log_image[x]
+        it = previous_log_image[x]
         deltaL = itdt - it
 
-        if np.abs(deltaL) < TOL:
+        threshold = positive_thresholds[x] if deltaL > 0 else negative_thresholds[x]
+        if np.abs(deltaL) < threshold:
             continue
 
         pol = np.sign(deltaL)
+        crossing = it + pol * threshold
 
-        cross_update = pol * TOL
-        crossings[x] = np.log(crossings[x]) + cross_update
+        # The first crossing must lie strictly between both intensities
+        if pol * (itdt - crossing) <= 0:
+            continue
 
-        lb = crossings[x] - it
-        ub = crossings[x] - itdt
+        spike_nums = np.abs(int((itdt - crossing) / threshold))
+        if spike_nums > 0:
+            spikes[x] = pol
 
-        pos_check = lb > 0 and (pol == 1) and ub < 0
-        neg_check = lb < 0 and (pol == -1) and ub > 0
+        spike_counts[x] = max_spikes if spike_nums > max_spikes else spike_nums
 
-        spike_nums = (itdt - crossings[x]) / TOL
-        cross_check = pos_check + neg_check
-        spike_nums = np.abs(int(spike_nums * cross_check))
 
-        crossings[x] = itdt - cross_update
-        if spike_nums > 0:
-            spikes[x] = pol
+@njit(parallel=True)
+def step_events(
+    step_log_image,
+    first_log_image,
+    last_log_image,
+    spike_counts,
+    last_step,
+    progress,
+    emitted,
+    step_start_progress,
+    step_end_progress,
+    step_first,
+    step_counts,
+):
+    # Which events of every pixel fire during a step: those its change passes in this step. The progress of a pixel
+    # is the furthest fraction of its change from first_log_image to last_log_image it reached so far.
+    for x in prange(spike_counts.size):
+        spike_num = spike_counts[x]
+        step_counts[x] = 0
+        if spike_num == 0:
+            continue
+        start = progress[x]
+        if last_step:
+            end = 1.0
+            end_index = spike_num
+        else:
+            end = (step_log_image[x] - first_log_image[x]) / (last_log_image[x] - first_log_image[x])
+            end = min(max(end, start), 1.0)
+            end_index = min(int(np.ceil(end * spike_num)), spike_num)
+        step_start_progress[x] = start
+        step_end_progress[x] = end
+        step_first[x] = emitted[x]
+        step_counts[x] = end_index - emitted[x]
+        progress[x] = end
+        emitted[x] = end_index
 
-        spike_nums = max_spikes if spike_nums > max_spikes else spike_nums
 
-        current_time = last_time
-        for i in range(spike_nums):
-            output_events[count].x = x % n_pix_row
-            output_events[count].y = x // n_pix_row
-            output_events[count].timestamp = np.round(current_time * 1e-6, 6)
-            output_events[count].polarity = 1 if pol > 0 else -1
+@njit(parallel=True)
+def interpolate_log_image(previous_log_image, current_log_image, flow, alpha, n_pix_row, output):
+    # Log image at fraction alpha between both images: both are warped along the flow to that moment, bilinearly
+    # sampled with clamping at the borders, and blended
+    n_rows = previous_log_image.size // n_pix_row
+    for x in prange(previous_log_image.size):
+        col = x % n_pix_row
+        row = x // n_pix_row
+        u = flow[x, 0]
+        v = flow[x, 1]
+        before = _sample(previous_log_image, col - alpha * u, row - alpha * v, n_pix_row, n_rows)
+        after = _sample(current_log_image, col + (1 - alpha) * u, row + (1 - alpha) * v, n_pix_row, n_rows)
+        output[x] = (1 - alpha) * before + alpha * after
+
+
+@njit(inline="always")
+def _sample(image, col, row, n_pix_row, n_rows):
+    col = min(max(col, 0.0), n_pix_row - 1.0)
+    row = min(max(row, 0.0), n_rows - 1.0)
+    col0 = min(int(col), n_pix_row - 2) if n_pix_row > 1 else 0
+    row0 = min(int(row), n_rows - 2) if n_rows > 1 else 0
+    col1 = min(col0 + 1, n_pix_row - 1)
+    row1 = min(row0 + 1, n_rows - 1)
+    fc = col - col0
+    fr = row - row0
+    top = image[row0 * n_pix_row + col0] * (1 - fc) + image[row0 * n_pix_row + col1] * fc
+    bottom = image[row1 * n_pix_row + col0] * (1 - fc) + image[row1 * n_pix_row + col1] * fc
+    return top * (1 - fr) + bottom * fr
 
-            count += 1
-            current_time += (delta_time) / spike_nums
 
-            if count == max_events_per_frame:
-                return count
+@njit(parallel=True)
+def histogram_events(
+    spike_counts,
+    step_start_progress,
+    step_end_progress,
+    step_first,
+    step_counts,
+    block_size,
+    start_time,
+    delta_time,
+    first_bucket,
+    bucket_width,
+    n_buckets,
+    histogram,
+):
+    # Per block of pixels, the number of events of the step in every time bucket of bucket_width microseconds
+    for block in prange(histogram.shape[0]):
+        histogram[block, :n_buckets] = 0
+        for x in range(block * block_size, min((block + 1) * block_size, spike_counts.size)):
+            spike_num = spike_counts[x]
+            for i in range(step_first[x], step_first[x] + step_counts[x]):
+                current_time = _event_time(
+                    start_time, delta_time, i, spike_num, step_start_progress[x], step_end_progress[x]
+                )
+                histogram[block, (int(current_time) - first_bucket) // bucket_width] += 1
 
-    return count
+
+@njit(parallel=True)
+def bucket_offsets(histogram, n_buckets, bucket_starts):
+    # Exclusive prefix sum over (bucket, block), in place, so every block knows where its events of every bucket
+    # go in the timestamp ordered output. bucket_starts gets where every bucket begins, followed by the total number
+    # of events, which is returned.
+    for bucket in prange(n_buckets):
+        count = 0
+        for block in range(histogram.shape[0]):
+            count += histogram[block, bucket]
+        bucket_starts[bucket + 1] = count
+    bucket_starts[0] = 0
+    for bucket in range(n_buckets):
+        bucket_starts[bucket + 1] += bucket_starts[bucket]
+    for bucket in prange(n_buckets):
+        total = bucket_starts[bucket]
+        for block in range(histogram.shape[0]):
+            count = histogram[block, bucket]
+            histogram[block, bucket] = total
+            total += count
+    return bucket_starts[n_buckets]
+
+
+@njit(parallel=True)
+def fill_events(
+    spike_counts,
+    spikes,
+    step_start_progress,
+    step_end_progress,
+    step_first,
+    step_counts,
+    block_size,
+    start_time,
+    delta_time,
+    first_bucket,
+    bucket_width,
+    offsets,
+    output_events,
+    n_pix_row,
+):
+    # Pass 2: every block writes its events to its own slots, so the output is the same for any number of threads.
+    # Events are ordered by bucket and then by pixel index. Events past the end of the output are dropped.
+    capacity = output_events.shape[0]
+    for block in prange(offsets.shape[0]):
+        for x in range(block * block_size, min((block + 1) * block_size, spike_counts.size)):
+            spike_num = spike_counts[x]
+            for i in range(step_first[x], step_first[x] + step_counts[x]):
+                current_time = _event_time(
+                    start_time, delta_time, i, spike_num, step_start_progress[x], step_end_progress[x]
+                )
+                bucket = (int(current_time) - first_bucket) // bucket_width
+                slot = offsets[block, bucket]
+                offsets[block, bucket] = slot + 1
+                if slot < capacity:
+                    output_events[slot].x = x % n_pix_row
+                    output_events[slot].y = x // n_pix_row
+                    output_events[slot].timestamp = current_time * 1e-6
+                    output_events[slot].polarity = 1 if spikes[x] > 0 else -1
+
+
+@njit(parallel=True)
+def sort_buckets(output_events, scratch, bucket_starts, n_buckets, first_bucket, bucket_width):
+    # Stable counting sort of the events of every bucket wider than a microsecond by their timestamp, so the output
+    # is ordered by timestamp and then by pixel index, as with one bucket per microsecond
+    capacity = output_events.shape[0]
+    for bucket in prange(n_buckets):
+        begin = bucket_starts[bucket]
+        end = min(bucket_starts[bucket + 1], capacity)
+        if end - begin < 2:
+            continue
+        bucket_time = first_bucket + bucket * bucket_width
+        positions = np.zeros(bucket_width + 1, dtype=np.int64)
+        for slot in range(begin, end):
+            positions[int(np.round(output_events[slot].timestamp * 1e6)) - bucket_time + 1] += 1
+        for offset in range(bucket_width):
+            positions[offset + 1] += positions[offset]
+        for slot in range(begin, end):
+            offset = int(np.round(output_events[slot].timestamp * 1e6)) - bucket_time
+            target = begin + positions[offset]
+            positions[offset] += 1
+            scratch[target].x = output_events[slot].x
+            scratch[target].y = output_events[slot].y
+            scratch[target].timestamp = output_events[slot].timestamp
+            scratch[target].polarity = output_events[slot].polarity
+        for slot in range(begin, end):
+            output_events[slot].x = scratch[slot].x
+            output_events[slot].y = scratch[slot].y
+            output_events[slot].timestamp = scratch[slot].timestamp
+            output_events[slot].polarity = scratch[slot].polarity
 
 
 class EventSimulator:
-    def __init__(self, W, H, first_image=None, first_time=None, config=CONFIG):
+    def __init__(self, W, H, first_image=None, first_time=None, config=CONFIG, writers=None):
         self.H = H
         self.W = W
         self.config = config
-        self.last_image = None
+        # Event sinks from event_writers.py that every frame of events is passed to
+        self.writers = list(writers) if writers is not None else []
+        self.last_log_image = None
         if first_image is not None:
             assert first_time is not None
             self.init(first_image, first_time)
@@ -102,20 +289,70 @@ class EventSimulator:
         # It makes multi-core processing more straightforward
         first_image = first_image.reshape(-1)
 
-        # Allocations
-        self.last_image = first_image.copy()
-        self.current_image = first_image.copy()
+        # Allocations, all reused for every frame. Only the log of the images is kept, taken once per image.
+        self.last_log_image = np.log(first_image)
+        self.current_log_image = np.empty_like(self.last_log_image)
+        self.interpolated_log_image = np.empty_like(self.last_log_image)
 
         self.last_time = first_time
 
+        config = self.config
+        rng = np.random.default_rng(getattr(config, "seed", None))
+        self.contrast_thresholds = np.empty((2, first_image.size), dtype=self.last_log_image.dtype)
+        for index in range(2):
+            threshold = config.contrast_thresholds[index]
+            sigma = config.sigma_contrast_thresholds[index]
+            if sigma > 0:
+                self.contrast_thresholds[index] = np.maximum(
+                    rng.normal(threshold, sigma, first_image.size), MINIMUM_CONTRAST_THRESHOLD
+                )
+            else:
+                self.contrast_thresholds[index] = max(threshold, MINIMUM_CONTRAST_THRESHOLD)
+
+        output_buffers = getattr(config, "output_buffers", 2)
         self.output_events = np.zeros(
-            (self.config.max_events_per_frame), dtype=EVENT_TYPE
+            (output_buffers, config.max_events_per_frame), dtype=EVENT_TYPE
         )
+        self.spikes = np.zeros((output_buffers, first_image.size))
+        self.scratch_events = np.zeros(config.max_events_per_frame, dtype=EVENT_TYPE)
+        self.output_index = 0
         self.event_count = 0
-        self.spikes = np.zeros((self.npix))
-
-    def image_callback(self, new_image, new_time):
-        if self.last_image is None:
+        self.dropped_event_count = 0
+        self.upsampling_steps = 1
+
+        self.spike_counts = np.zeros(first_image.size, dtype=np.int64)
+        # Per pixel state while stepping through an interval, see step_events
+        self.progress = np.zeros(first_image.size)
+        self.emitted = np.zeros(first_image.size, dtype=np.int64)
+        self.step_start_progress = np.zeros(first_image.size)
+        self.step_end_progress = np.zeros(first_image.size)
+        self.step_first = np.zeros(first_image.size, dtype=np.int64)
+        self.step_counts = np.zeros(first_image.size, dtype=np.int64)
+        # Pixels are split in blocks that each fill their own part of the output, a few per thread to balance the load
+        self.n_blocks = min(first_image.size, 4 * get_num_threads())
+        self.block_size = -(-first_image.size // self.n_blocks)
+        self.max_time_buckets = getattr(config, "max_time_buckets", 1 << 14)
+        self.histogram = np.zeros((self.n_blocks, self.max_time_buckets), dtype=np.int64)
+        self.bucket_starts = np.zeros(self.max_time_buckets + 1, dtype=np.int64)
+
+    def image_callback(self, new_image, new_time, flow=None):
+        """
+        Simulates the events between the previous image and new_image.
+
+        Args:
+            new_image (np.ndarray): Grayscale image with the resolution of the first image, without zeros
+            new_time (float): Time of new_image in microseconds
+            flow (np.ndarray, optional): (H, W, 2) motion of every pixel from the previous to the new image, in
+                pixels. With it, the interval is split in up to `max_upsampling_steps` steps of interpolated images,
+                so events get timestamps along the motion instead of evenly spread over the interval.
+
+        Returns:
+            tuple: The event image, a (H * W,) array of -1, 0 or +1 per pixel, and the events as an array of
+            `EVENT_TYPE` in timestamp order, at most `max_events_per_frame` of them, or (None, None) for the first
+            image. Both are views into buffers that are reused after `output_buffers` calls, copy them to keep them
+            longer.
+        """
+        if self.last_log_image is None:
             self.init(new_image, new_time)
             return None, None
 
@@ -123,35 +360,134 @@ class EventSimulator:
         assert new_image.shape == self.resolution
         new_image = new_image.reshape(-1)  # Free operation
 
-        np.copyto(self.current_image, new_image)
+        np.log(new_image, out=self.current_log_image)
 
         delta_time = new_time - self.last_time
 
         config = self.config
-        self.output_events = np.zeros(
-            (self.config.max_events_per_frame), dtype=EVENT_TYPE
-        )
-        self.spikes = np.zeros((self.npix))
-
-        self.crossings = self.last_image.copy()
-        self.event_count = esim(
-            self.current_image.size,
-            self.current_image,
-            self.last_image,
+        output_events = self.output_events[self.output_index]
+        spikes = self.spikes[self.output_index]
+        self.output_index = (self.output_index + 1) % self.output_events.shape[0]
+
+        # The number of events of every pixel follows from both images, optical flow only decides when they fire
+        count_events(
+            self.current_log_image,
+            self.last_log_image,
             delta_time,
-            self.crossings,
-            self.last_time,
-            self.output_events,
-            self.spikes,
+            self.contrast_thresholds[0],
+            self.contrast_thresholds[1],
+            self.spike_counts,
+            spikes,
             config.refractory_period_ns,
-            config.max_events_per_frame,
-            self.W,
         )
 
-        np.copyto(self.last_image, self.current_image)
+        steps = 1
+        if flow is not None:
+            flow = np.asarray(flow, dtype=self.current_log_image.dtype).reshape(-1, 2)
+            max_displacement = np.sqrt((flow ** 2).sum(axis=1).max()) if flow.shape[0] > 0 else 0.0
+            steps = int(np.ceil(max_displacement / config.upsampling_max_displacement))
+            steps = min(max(steps, 1), config.max_upsampling_steps)
+        self.upsampling_steps = steps
+
+        self.progress[:] = 0
+        self.emitted[:] = 0
+        count = 0
+        total = 0
+        for step in range(1, steps + 1):
+            step_log_image = self.current_log_image
+            if step < steps:
+                step_log_image = self.interpolated_log_image
+                interpolate_log_image(
+                    self.last_log_image,
+                    self.current_log_image,
+                    flow,
+                    step / steps,
+                    self.W,
+                    step_log_image,
+                )
+            total += self.simulate_step(
+                step_log_image,
+                step == steps,
+                self.last_time + delta_time * (step - 1) / steps,
+                delta_time / steps,
+                spikes,
+                output_events[count:],
+            )
+            count = min(total, output_events.shape[0])
+
+        self.event_count = count
+        self.dropped_event_count = total - count
+
+        np.copyto(self.last_log_image, self.current_log_image)
         self.last_time = new_time
 
-        result = self.output_events[: self.event_count]
-        result.sort(order=["timestamp"], axis=0)
+        result = output_events[: self.event_count]
+        for writer in self.writers:
+            writer.write(result)
+
+        return spikes, result
+
+    def simulate_step(self, step_log_image, last_step, start_time, delta_time, spikes, output_events):
+        # Writes the events that fire while the log image goes to step_log_image to output_events in timestamp
+        # order and returns how many there were, including those that did not fit
+        step_events(
+            step_log_image,
+            self.last_log_image,
+            self.current_log_image,
+            self.spike_counts,
+            last_step,
+            self.progress,
+            self.emitted,
+            self.step_start_progress,
+            self.step_end_progress,
+            self.step_first,
+            self.step_counts,
+        )
 
-        return self.spikes, result
+        first_bucket = int(np.floor(start_time))
+        n_microseconds = int(np.ceil(start_time + delta_time)) - first_bucket + 1
+        bucket_width = -(-n_microseconds // self.max_time_buckets)
+        n_buckets = -(-n_microseconds // bucket_width)
+
+        histogram_events(
+            self.spike_counts,
+            self.step_start_progress,
+            self.step_end_progress,
+            self.step_first,
+            self.step_counts,
+            self.block_size,
+            start_time,
+            delta_time,
+            first_bucket,
+            bucket_width,
+            n_buckets,
+            self.histogram,
+        )
+        total = bucket_offsets(self.histogram, n_buckets, self.bucket_starts)
+        fill_events(
+            self.spike_counts,
+            spikes,
+            self.step_start_progress,
+            self.step_end_progress,
+            self.step_first,
+            self.step_counts,
+            self.block_size,
+            start_time,
+            delta_time,
+            first_bucket,
+            bucket_width,
+            self.histogram,
+            output_events,
+            self.W,
+        )
+        if bucket_width > 1:
+            # Where a bucket crosses the end of the output, the events that fit are those first in pixel order
+            sort_buckets(
+                output_events,
+                self.scratch_events[: output_events.shape[0]],
+                self.bucket_starts,
+                n_buckets,
+                first_bucket,
+                bucket_width,
+            )
+        return total
@@ -0,0 +1,217 @@
+import os
+import queue
+import threading
+import numpy as np
+
+from event_simulator import EVENT_TYPE
+
+BINARY_MAGIC = b"AIRSIMEV"
+BINARY_HEADER_SIZE = 16  # magic followed by the uint64 number of events
+
+
+def events_to_columns(events):
+    """Splits an array of EVENT_TYPE into int64 microsecond timestamps, x, y and 0/1 polarities"""
+    t = np.round(events["timestamp"] * 1e6).astype(np.int64)
+    return t, events["x"], events["y"], (events["polarity"] > 0).astype(np.uint8)
+
+
+class EventWriter:
+    """
+    Base class of the event sinks. Events passed to write() are copied and written on a separate writer thread,
+    so the simulator never waits for the disk unless max_pending batches are already queued. Pass the writers to
+    EventSimulator(writers=[...]) to have every frame of events written, and close them when done.
+    """
+
+    def __init__(self, max_pending=16):
+        self.pending = queue.Queue(max_pending)
+        self.error = None
+        self.event_count = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            events = self.pending.get()
+            if events is None:
+                return
+            if self.error is None:
+                try:
+                    self._append(events)
+                    self.event_count += events.shape[0]
+                except Exception as e:
+                    self.error = e
+
+    def write(self, events):
+        if self.error is not None:
+            raise self.error
+        if events is not None and events.shape[0] > 0:
+            # The simulator reuses its output buffers
+            self.pending.put(np.array(events, dtype=EVENT_TYPE))
+
+    def close(self):
+        if self.thread.is_alive():
+            self.pending.put(None)
+            self.thread.join()
+            self._close()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _append(self, events):
+        raise NotImplementedError
+
+    def _close(self):
+        raise NotImplementedError
+
+
+class BinaryEventWriter(EventWriter):
+    """
+    Append-only log of raw EVENT_TYPE records behind a 16 byte header, written through a memory map that grows by
+    growth_events records at a time. The number of events in the header is updated on every growth and on close, so
+    a log cut short by a crash can still be read up to the last growth. Read it back with read_binary_events().
+    """
+
+    def __init__(self, path, growth_events=1 << 22, max_pending=16):
+        self.path = path
+        self.growth_events = growth_events
+        self.file = open(path, "w+b")
+        self.file.write(BINARY_MAGIC + np.uint64(0).tobytes())
+        self.capacity = 0
+        self.count = 0
+        self.map = None
+        super().__init__(max_pending)
+
+    def _grow(self, min_capacity):
+        if self.map is not None:
+            self.map.flush()
+            self._write_count()
+        self.capacity = max(min_capacity, self.capacity + self.growth_events)
+        self.file.truncate(BINARY_HEADER_SIZE + self.capacity * EVENT_TYPE.itemsize)
+        self.map = np.memmap(self.file, dtype=EVENT_TYPE, mode="r+", offset=BINARY_HEADER_SIZE,
+                             shape=(self.capacity,))
+
+    def _write_count(self):
+        self.file.seek(len(BINARY_MAGIC))
+        self.file.write(np.uint64(self.count).tobytes())
+        self.file.flush()
+
+    def _append(self, events):
+        end = self.count + events.shape[0]
+        if end > self.capacity:
+            self._grow(end)
+        self.map[self.count:end] = events
+        self.count = end
+
+    def _close(self):
+        if self.map is not None:
+            self.map.flush()
+            del self.map
+        self._write_count()
+        self.file.truncate(BINARY_HEADER_SIZE + self.count * EVENT_TYPE.itemsize)
+        self.file.close()
+
+
+def read_binary_events(path):
+    """Memory maps a log written by BinaryEventWriter as a read-only array of EVENT_TYPE"""
+    with open(path, "rb") as f:
+        header = f.read(BINARY_HEADER_SIZE)
+    if header[: len(BINARY_MAGIC)] != BINARY_MAGIC:
+        raise ValueError("%s is not a binary event log" % path)
+    count = int(np.frombuffer(header, np.uint64, 1, len(BINARY_MAGIC))[0])
+    if count == 0:
+        return np.empty(0, EVENT_TYPE)
+    return np.memmap(path, dtype=EVENT_TYPE, mode="r", offset=BINARY_HEADER_SIZE, shape=(count,))
+
+
+class HDF5EventWriter(EventWriter):
+    """
+    Writes events to an HDF5 file in the layout most event camera datasets and tools use: the 1D datasets events/t
+    (int64 microseconds), events/x, events/y (uint16) and events/p (uint8, 1 for positive) and the sensor size in
+    the height and width attributes of events. The datasets are chunked and compressed, and events are buffered so
+    every write fills whole chunks. Requires h5py.
+    """
+
+    def __init__(self, path, width, height, chunk_events=1 << 18, compression="gzip", compression_opts=4,
+                 max_pending=16):
+        import h5py
+
+        self.file = h5py.File(path, "w")
+        group = self.file.create_group("events")
+        group.attrs["width"] = width
+        group.attrs["height"] = height
+        self.chunk_events = chunk_events
+        self.datasets = []
+        for name, dtype in (("t", np.int64), ("x", np.uint16), ("y", np.uint16), ("p", np.uint8)):
+            self.datasets.append(group.create_dataset(name, shape=(0,), maxshape=(None,), dtype=dtype,
+                                                      chunks=(chunk_events,), compression=compression,
+                                                      compression_opts=compression_opts))
+        self.buffered = np.empty(0, EVENT_TYPE)
+        self.count = 0
+        super().__init__(max_pending)
+
+    def _flush(self, events):
+        end = self.count + events.shape[0]
+        for dataset, column in zip(self.datasets, events_to_columns(events)):
+            dataset.resize((end,))
+            dataset[self.count:end] = column
+        self.count = end
+
+    def _append(self, events):
+        if self.buffered.shape[0] > 0:
+            events = np.concatenate((self.buffered, events))
+        full = events.shape[0] - events.shape[0] % self.chunk_events
+        if full > 0:
+            self._flush(events[:full])
+        self.buffered = events[full:]
+
+    def _close(self):
+        if self.buffered.shape[0] > 0:
+            self._flush(self.buffered)
+        self.file.close()
+
+
+class AedatEventWriter(EventWriter):
+    """
+    Writes events as AEDAT 2.0, the format of jAER and the DVS128/DAVIS240 cameras: an ASCII header followed by
+    big-endian int32 address and int32 microsecond timestamp pairs. Addresses use the DAVIS240 layout,
+    y << 22 | x << 12 | polarity << 11. Timestamps are relative to the first event and wrap after about 71 minutes,
+    as they do for the cameras.
+    """
+
+    ADDRESS_TYPE = np.dtype([("address", ">u4"), ("timestamp", ">u4")])
+
+    def __init__(self, path, max_pending=16):
+        self.file = open(path, "wb")
+        self.file.write(b"#!AER-DAT2.0\r\n"
+                        b"# This is a raw AE data file created by the Cosys-AirSim event simulator\r\n"
+                        b"# Data format is int32 address, int32 timestamp (8 bytes total), repeated for each event\r\n"
+                        b"# Timestamps tick is 1 us\r\n")
+        self.first_timestamp = None
+        super().__init__(max_pending)
+
+    def _append(self, events):
+        t, x, y, p = events_to_columns(events)
+        if self.first_timestamp is None:
+            self.first_timestamp = t[0]
+        records = np.empty(events.shape[0], self.ADDRESS_TYPE)
+        records["address"] = (y.astype(np.uint32) << 22) | (x.astype(np.uint32) << 12) | (p.astype(np.uint32) << 11)
+        records["timestamp"] = (t - self.first_timestamp).astype(np.uint32)
+        self.file.write(records.tobytes())
+
+    def _close(self):
+        self.file.close()
+
+
+def open_event_writer(path, width, height, **kwargs):
+    """Creates the writer for the extension of path: .h5/.hdf5, .aedat or anything else for the binary log"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".h5", ".hdf5"):
+        return HDF5EventWriter(path, width, height, **kwargs)
+    if extension == ".aedat":
+        return AedatEventWriter(path, **kwargs)
+    return BinaryEventWriter(path, **kwargs)
@@ -6,25 +6,38 @@ import matplotlib.pyplot as plt
 import argparse
 import sys, signal
 import pandas as pd
-import pickle
 from event_simulator import *
+from event_writers import open_event_writer
 
 parser = argparse.ArgumentParser(description="Simulate event data from AirSim")
 parser.add_argument("--debug", action="store_true")
 parser.add_argument("--save", action="store_true")
 parser.add_argument("--height", type=int, default=144)
 parser.add_argument("--width", type=int, default=256)
+parser.add_argument("--flow", action="store_true",
+                    help="Also capture optical flow to spread events over the motion between two images")
+parser.add_argument("--flow_scale", type=float, default=1.0,
+                    help="Factor from the optical flow image values to pixels between two captured images")
+parser.add_argument("--output", default="events.bin",
+                    help="File to save the events to with --save: .h5, .aedat or a binary event log")
 
 
 class AirSimEventGen:
-    def __init__(self, W, H, save=False, debug=False):
-        self.ev_sim = EventSimulator(W, H)
+    def __init__(self, W, H, save=False, debug=False, output="events.bin", flow=False, flow_scale=1.0):
+        # Events are written on the writer's own thread while the next image is captured
+        self.event_writer = open_event_writer(output, W, H) if save else None
+        self.ev_sim = EventSimulator(W, H, writers=[self.event_writer] if save else None)
         self.H = H
         self.W = W
 
         self.image_request = airsim.ImageRequest(
             "0", airsim.ImageType.Scene, False, False
         )
+        self.image_requests = [self.image_request]
+        if flow:
+            self.image_requests.append(airsim.ImageRequest("0", airsim.ImageType.OpticalFlow, True, False))
+        self.flow = flow
+        self.flow_scale = flow_scale
 
         self.client = airsim.VehicleClient()
         self.client.confirmConnection()
@@ -35,9 +48,6 @@ class AirSimEventGen:
         self.debug = debug
         self.save = save
 
-        self.event_file = open("events.pkl", "ab")
-        self.event_fmt = "%1.7f", "%d", "%d", "%d"
-
         if debug:
             self.fig, self.ax = plt.subplots(1, 1)
 
@@ -58,14 +68,16 @@ class AirSimEventGen:
 
     def _stop_event_gen(self, signal, frame):
         print("\nCtrl+C received. Stopping event sim...")
-        self.event_file.close()
+        if self.event_writer is not None:
+            self.event_writer.close()
         sys.exit(0)
 
 
 if __name__ == "__main__":
     args = parser.parse_args()
 
-    event_generator = AirSimEventGen(args.width, args.height, save=args.save, debug=args.debug)
+    event_generator = AirSimEventGen(args.width, args.height, save=args.save, debug=args.debug,
+                                     output=args.output, flow=args.flow, flow_scale=args.flow_scale)
     i = 0
     start_time = 0
     t_start = time.time()
@@ -75,10 +87,10 @@ if __name__ == "__main__":
     while True:
         image_request = airsim.ImageRequest("0", airsim.ImageType.Scene, False, False)
 
-        response = event_generator.client.simGetImages([event_generator.image_request])
+        response = event_generator.client.simGetImages(event_generator.image_requests)
         while response[0].height == 0 or response[0].width == 0:
             response = event_generator.client.simGetImages(
-                [event_generator.image_request]
+                event_generator.image_requests
             )
 
         ts = time.time_ns()
@@ -99,14 +111,15 @@ if __name__ == "__main__":
         ts = time.time_ns()
         ts_delta = (ts - event_generator.start_ts) * 1e-3
 
+        flow = None
+        if event_generator.flow:
+            flow = np.asarray(response[1].image_data_float, dtype=np.float32).reshape(
+                event_generator.H, event_generator.W, -1
+            )[..., :2] * event_generator.flow_scale
+
         # Event sim keeps track of previous image automatically
-        event_img, events = event_generator.ev_sim.image_callback(img, ts_delta)
+        event_img, events = event_generator.ev_sim.image_callback(img, ts_delta, flow)
 
         if events is not None and events.shape[0] > 0:
-            if event_generator.save:
-                # Using pickle dump in a per-frame fashion to save time, instead of savetxt
-                # Optimizations possible
-                pickle.dump(events, event_generator.event_file)
-
             if event_generator.debug:
                 event_generator.visualize_events(event_img)
@@ -11,6 +11,10 @@ import h5py
 from pathlib import Path
 import copy
 import re
+import multiprocessing
+import functools
+import zlib
+from collections import deque
 
 
 # This constant is used as an upper bound  for normalizing the car's speed to be between 0 and 1 
@@ -47,8 +51,8 @@ def readImagesFromPath(image_names):
             if (np.all(imArr[:, :, 3] == imArr[0, 0, 3])):
                 imArr = imArr[:,:,0:3]
         if len(imArr.shape) != 3 or imArr.shape[2] != 3:
-            print('Error: Image', image_name, 'is not RGB.')
-            sys.exit()            
+            # Raised rather than exiting, so it also stops the cooking when images are read in worker processes
+            raise ValueError('Error: Image {0} is not RGB.'.format(image_name))
 
         returnIm = np.asarray(imArr)
 
@@ -82,10 +86,46 @@ def splitTrainValidationAndTestData(all_data_mappings, split_ratio=(0.7, 0.2, 0.
 
     return [train_data_mappings, validation_data_mappings, test_data_mappings]
     
-def generateDataMapAirSim(folders):
+def readFolderMappings(folder):
+    """ Reads the 'center camera image name - label(s)' tuples of one recording folder, see generateDataMapAirSim.
+           Inputs:
+               folder: folder to collect data from
+
+           Returns:
+               mappings: list of (image filepath, (label(s), previous state)) tuples in recording order
+    """
+    print('Reading data from {0}...'.format(folder))
+    current_df = pd.read_csv(os.path.join(folder, 'airsim_rec.txt'), sep='\t')
+
+    # Whole columns are converted at once, indexing the data frame row by row dominated the reading time
+    norm_steering = ((current_df['Steering'].to_numpy(dtype=float) + 1) / 2.0).tolist()  # Normalize steering: between 0 and 1
+    throttle = current_df['Throttle'].to_numpy(dtype=float).tolist()
+    norm_speed = (current_df['Speed (kmph)'].to_numpy(dtype=float) / MAX_SPEED).tolist()  # Normalize speed: between 0 and 1
+    brake = current_df['Brake'].to_numpy()
+    image_names = current_df['ImageName'].tolist()
+    images_folder = os.path.join(folder, 'images')
+
+    mappings = []
+    for i in range(1, current_df.shape[0] - 1):
+        if brake[i-1] != 0:   # Consider only training examples without breaks
+            continue
+
+        previous_state = [norm_steering[i-1], throttle[i-1], norm_speed[i-1]]
+
+        #compute average steering over 3 consecutive recorded images, this will serve as the label
+        average_steering = (norm_steering[i-1] + norm_steering[i] + norm_steering[i+1]) / 3.0
+        current_label = [average_steering]
+
+        image_filepath = os.path.join(images_folder, image_names[i]).replace('\\', '/')
+        mappings.append((image_filepath, (current_label, previous_state)))
+    return mappings
+
+
+def generateDataMapAirSim(folders, pool=None):
     """ Data map generator for simulator(AirSim) data. Reads the driving_log csv file and returns a list of 'center camera image name - label(s)' tuples
            Inputs:
                folders: list of folders to collect data from
+               pool: optional multiprocessing pool to read the folders concurrently
 
            Returns:
                mappings: All data mappings as a dictionary. Key is the image filepath, the values are a 2-tuple:
@@ -94,41 +134,13 @@ def generateDataMapAirSim(folders):
     """
 
     all_mappings = {}
-    for folder in folders:
-        print('Reading data from {0}...'.format(folder))
-        current_df = pd.read_csv(os.path.join(folder, 'airsim_rec.txt'), sep='\t')
-        
-        for i in range(1, current_df.shape[0] - 1): 
-
-            
-            if current_df.iloc[i-1]['Brake'] != 0:   # Consider only training examples without breaks
-                continue
-
-
-            norm_steering = [ (float(current_df.iloc[i-1][['Steering']]) + 1) / 2.0 ]  # Normalize steering: between 0 and 1
-            norm_throttle = [ float(current_df.iloc[i-1][['Throttle']]) ]
-            norm_speed = [ float(current_df.iloc[i-1][['Speed (kmph)']]) / MAX_SPEED ]  # Normalize speed: between 0 and 1
-
-
-            previous_state = norm_steering + norm_throttle + norm_speed   # Append lists
-
-
-            #compute average steering over 3 consecutive recorded images, this will serve as the label
-
-            norm_steering0 = (float(current_df.iloc[i][['Steering']]) + 1) / 2.0
-            norm_steering1 = (float(current_df.iloc[i+1][['Steering']]) + 1) / 2.0
-
-            temp_sum_steering = norm_steering[0] + norm_steering0 + norm_steering1
-            average_steering = temp_sum_steering / 3.0
-
-            current_label = [average_steering]
-            
-            image_filepath = os.path.join(os.path.join(folder, 'images'), current_df.iloc[i]['ImageName']).replace('\\', '/')
-            
+    folder_mappings = pool.map(readFolderMappings, folders) if pool is not None else map(readFolderMappings, folders)
+    for mappings in folder_mappings:
+        for image_filepath, value in mappings:
             if (image_filepath in all_mappings):
                 print('Error: attempting to add image {0} twice.'.format(image_filepath))
-            
-            all_mappings[image_filepath] = (current_label, previous_state)
+
+            all_mappings[image_filepath] = value
 
     mappings = [(key, all_mappings[key]) for key in all_mappings]
     
@@ -139,87 +151,126 @@ def generateDataMapAirSim(folders):
 
 def generatorForH5py(data_mappings, chunk_size=32):
     """
-    This function batches the data for saving to the H5 file
+    This function batches the data for saving to the H5 file. A last chunk smaller than chunk_size is dropped.
     """
-    for chunk_id in range(0, len(data_mappings), chunk_size):
+    for chunk_id in range(0, len(data_mappings) - chunk_size + 1, chunk_size):
         # Data is expected to be a dict of <image: (label, previousious_state)>
         data_chunk = data_mappings[chunk_id:chunk_id + chunk_size]
-        if (len(data_chunk) == chunk_size):
-            image_names_chunk = [a for (a, b) in data_chunk]
-            labels_chunk = np.asarray([b[0] for (a, b) in data_chunk])
-            previous_state_chunk = np.asarray([b[1] for (a, b) in data_chunk])
-            
-            #Flatten and yield as tuple
-            yield (image_names_chunk, labels_chunk.astype(float), previous_state_chunk.astype(float))
-            if chunk_id + chunk_size > len(data_mappings):
-                raise StopIteration
-    raise StopIteration
-    
-    
-def saveH5pyData(data_mappings, target_file_path, chunk_size):
-    """
-    Saves H5 data to file
+        image_names_chunk = [a for (a, b) in data_chunk]
+        labels_chunk = np.asarray([b[0] for (a, b) in data_chunk])
+        previous_state_chunk = np.asarray([b[1] for (a, b) in data_chunk])
+
+        #Flatten and yield as tuple
+        yield (image_names_chunk, labels_chunk.astype(float), previous_state_chunk.astype(float))
+
+
+def readImageChunk(image_names, image_shape=None, compression_level=None):
+    """ Worker function that loads one chunk of images as a single array, see readImagesFromPath.
+           Inputs:
+                image_names: list of image names
+                image_shape: optional shape every image must have
+                compression_level: optional deflate level, to return the chunk compressed as an HDF5 gzip filter of
+                                   that level stores it
+           Returns:
+                Array of all images, or the bytes of the compressed array
     """
-    gen = generatorForH5py(data_mappings,chunk_size)
+    images = np.asarray(readImagesFromPath(image_names))
+    if image_shape is not None and images.shape[1:] != image_shape:
+        raise ValueError('Error: Images {0} do not all have the shape {1}.'.format(image_names, image_shape))
+    if compression_level is None:
+        return images
+    return zlib.compress(np.ascontiguousarray(images).tobytes(), compression_level)
 
-    image_names_chunk, labels_chunk, previous_state_chunk = next(gen)
-    images_chunk = np.asarray(readImagesFromPath(image_names_chunk))
-    row_count = images_chunk.shape[0]
+
+def saveH5pyData(data_mappings, target_file_path, chunk_size, pool=None, compression_level=1):
+    """
+    Saves H5 data to file. The datasets are created at their final size with one HDF5 chunk per chunk_size rows. The
+    images of every chunk are decoded and compressed in the worker processes of pool while earlier chunks are
+    written, and the compressed chunks are written to the file as they are.
+           Inputs:
+               data_mappings: mappings to save
+               target_file_path: h5 file to create
+               chunk_size: number of rows per chunk
+               pool: optional multiprocessing pool to decode the images in
+               compression_level: gzip level of the datasets, None to store them uncompressed
+    """
+    chunks = list(generatorForH5py(data_mappings, chunk_size))
+    if len(chunks) == 0:
+        print('Warning: fewer than {0} samples for {1}, nothing to save.'.format(chunk_size, target_file_path))
+        return
+    row_count = len(chunks) * chunk_size
+    first_image = readImageChunk(chunks[0][0][:1])
+    image_shape = first_image.shape[1:]
+    _, labels_chunk, previous_state_chunk = chunks[0]
+    compression = 'gzip' if compression_level is not None else None
 
     checkAndCreateDir(target_file_path)
     with h5py.File(target_file_path, 'w') as f:
 
-        # Initialize a resizable dataset to hold the output
-        images_chunk_maxshape = (None,) + images_chunk.shape[1:]
-        labels_chunk_maxshape = (None,) + labels_chunk.shape[1:]
-        previous_state_maxshape = (None,) + previous_state_chunk.shape[1:]
-
-        dset_images = f.create_dataset('image', shape=images_chunk.shape, maxshape=images_chunk_maxshape,
-                                chunks=images_chunk.shape, dtype=images_chunk.dtype)
-
-        dset_labels = f.create_dataset('label', shape=labels_chunk.shape, maxshape=labels_chunk_maxshape,
-                                       chunks=labels_chunk.shape, dtype=labels_chunk.dtype)
-        
-        dset_previous_state = f.create_dataset('previous_state', shape=previous_state_chunk.shape, maxshape=previous_state_maxshape,
-                                       chunks=previous_state_chunk.shape, dtype=previous_state_chunk.dtype)
-                                       
-        dset_images[:] = images_chunk
-        dset_labels[:] = labels_chunk
-        dset_previous_state[:] = previous_state_chunk
-
-        for image_names_chunk, label_chunk, previous_state_chunk in gen:
-            image_chunk = np.asarray(readImagesFromPath(image_names_chunk))
-            
-            # Resize the dataset to accommodate the next chunk of rows
-            dset_images.resize(row_count + image_chunk.shape[0], axis=0)
-            dset_labels.resize(row_count + label_chunk.shape[0], axis=0)
-            dset_previous_state.resize(row_count + previous_state_chunk.shape[0], axis=0)
-            # Create the next chunk
-            dset_images[row_count:] = image_chunk
-            dset_labels[row_count:] = label_chunk
-            dset_previous_state[row_count:] = previous_state_chunk
-
-            # Increment the row count
-            row_count += image_chunk.shape[0]
+        # Datasets at their final size, chunked like the rows are written
+        dset_images = f.create_dataset('image', shape=(row_count,) + image_shape, chunks=(chunk_size,) + image_shape,
+                                       dtype=first_image.dtype, compression=compression,
+                                       compression_opts=compression_level)
+
+        dset_labels = f.create_dataset('label', shape=(row_count,) + labels_chunk.shape[1:],
+                                       chunks=labels_chunk.shape, dtype=labels_chunk.dtype, compression=compression,
+                                       compression_opts=compression_level)
+
+        dset_previous_state = f.create_dataset('previous_state', shape=(row_count,) + previous_state_chunk.shape[1:],
+                                               chunks=previous_state_chunk.shape, dtype=previous_state_chunk.dtype,
+                                               compression=compression, compression_opts=compression_level)
+
+        read_chunk = functools.partial(readImageChunk, image_shape=image_shape, compression_level=compression_level)
+        image_names_chunks = [image_names_chunk for image_names_chunk, _, _ in chunks]
+        if pool is None:
+            image_chunks = map(read_chunk, image_names_chunks)
+        else:
+            image_chunks = _imapBounded(pool, read_chunk, image_names_chunks, 2 * (os.cpu_count() or 1))
+
+        for chunk_index, image_chunk in enumerate(image_chunks):
+            _, label_chunk, previous_state_chunk = chunks[chunk_index]
+            begin = chunk_index * chunk_size
+            if compression_level is None:
+                dset_images[begin:begin + chunk_size] = image_chunk
+            else:
+                dset_images.id.write_direct_chunk((begin,) + (0,) * len(image_shape), image_chunk)
+            dset_labels[begin:begin + chunk_size] = label_chunk
+            dset_previous_state[begin:begin + chunk_size] = previous_state_chunk
+
+
+def _imapBounded(pool, function, arguments, max_pending):
+    """ Like pool.imap, but keeps at most max_pending results in flight so decoded chunks do not pile up in memory
+        when writing is slower than decoding.
+    """
+    pending = deque()
+    for argument in arguments:
+        pending.append(pool.apply_async(function, (argument,)))
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
             
             
-def cook(folders, output_directory, train_eval_test_split, chunk_size):
+def cook(folders, output_directory, train_eval_test_split, chunk_size, num_workers=None, compression_level=1):
     """ Primary function for data pre-processing. Reads and saves all data as h5 files.
             Inputs:
                 folders: a list of all data folders
                 output_directory: location for saving h5 files
                 train_eval_test_split: dataset split ratio
+                num_workers: number of processes reading folders and decoding images, defaults to the number of CPUs
+                compression_level: gzip level of the h5 datasets, None to store them uncompressed
     """
     output_files = [os.path.join(output_directory, f) for f in ['train.h5', 'eval.h5', 'test.h5']]
     if (any([os.path.isfile(f) for f in output_files])):
        print("Preprocessed data already exists at: {0}. Skipping preprocessing.".format(output_directory))
 
     else:
-        all_data_mappings = generateDataMapAirSim(folders)
-        
-        split_mappings = splitTrainValidationAndTestData(all_data_mappings, split_ratio=train_eval_test_split)
-        
-        for i in range(0, len(split_mappings)-1, 1):
-            print('Processing {0}...'.format(output_files[i]))
-            saveH5pyData(split_mappings[i], output_files[i], chunk_size)
-            print('Finished saving {0}.'.format(output_files[i]))
\ No newline at end of file
+        with multiprocessing.Pool(num_workers) as pool:
+            all_data_mappings = generateDataMapAirSim(folders, pool)
+
+            split_mappings = splitTrainValidationAndTestData(all_data_mappings, split_ratio=train_eval_test_split)
+
+            for i in range(0, len(split_mappings)-1, 1):
+                print('Processing {0}...'.format(output_files[i]))
+                saveH5pyData(split_mappings[i], output_files[i], chunk_size, pool, compression_level)
+                print('Finished saving {0}.'.format(output_files[i]))
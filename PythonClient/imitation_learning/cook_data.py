@@ -33,6 +33,7 @@ data_folders = []
 if COOK_ALL_DATA:
 	data_folders = [name for name in os.listdir(RAW_DATA_DIR)]
 
-
-full_path_raw_folders = [os.path.join(RAW_DATA_DIR, f) for f in data_folders]
-Cooking.cook(full_path_raw_folders, COOKED_DATA_DIR, train_eval_test_split, chunk_size)
\ No newline at end of file
+# Cooking uses worker processes, which import this file again on Windows
+if __name__ == '__main__':
+	full_path_raw_folders = [os.path.join(RAW_DATA_DIR, f) for f in data_folders]
+	Cooking.cook(full_path_raw_folders, COOKED_DATA_DIR, train_eval_test_split, chunk_size)
\ No newline at end of file
@@ -1,4 +1,5 @@
 from airgym.envs.airsim_env import AirSimEnv
 from airgym.envs.car_env import AirSimCarEnv
 from airgym.envs.drone_env import AirSimDroneEnv
-
+from airgym.envs.preprocessing import DepthPreprocessor, depth_capture_settings
+from airgym.envs.polyline import Polyline
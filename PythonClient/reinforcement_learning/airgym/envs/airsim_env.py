@@ -1,24 +1,129 @@
+import time
 import numpy as np
 import cosysairsim as airsim
 
 import gym
 from gym import spaces
+from airgym.envs.preprocessing import DepthPreprocessor
+
+
+def wait_paused(envs, futures):
+    """
+    Waits for the simContinueForTime or simContinueForFrames futures of the lockstep environments envs and then until
+    all of their simulators are paused again, polling them together. Raises TimeoutError when a simulator is not
+    paused pause_timeout seconds after its continue call returned, e.g. because it was unpaused by hand.
+    """
+    for future in futures:
+        future.get()
+    deadline = time.time() + max(env.pause_timeout for env in envs)
+    # The simulator may answer before the simulated time has passed
+    running = list(envs)
+    while True:
+        paused = [env.client.client.call_async("simIsPaused") for env in running]
+        running = [env for env, future in zip(running, paused) if not future.get()]
+        if not running:
+            return
+        if time.time() > deadline:
+            raise TimeoutError("The simulator did not pause again after a lockstep, was it unpaused?")
+        time.sleep(0.001)
 
 
 class AirSimEnv(gym.Env):
     metadata = {"render.modes": ["rgb_array"]}
 
-    def __init__(self, image_shape):
+    # Vehicle type passed to simAddVehicle when AirSimVecEnv spawns more vehicles of this environment
+    vehicle_type = None
+    # Seconds an action is applied before the observation is taken, waited once for all vehicles by AirSimVecEnv
+    action_duration = 0.0
+    # Action applied after every reset, None for no action
+    reset_action = None
+    # Seconds a lockstep waits for the simulator to pause again before it fails
+    pause_timeout = 10.0
+
+    def __init__(self, image_shape, step_dt=None, step_frames=None):
+        """
+        With step_dt or step_frames the environment runs in lockstep: the simulation stays paused and every step
+        advances it by exactly step_dt simulated seconds or step_frames frames with simContinueForTime or
+        simContinueForFrames, instead of waiting for the action in wall-clock time. A step then takes as long as the
+        simulator needs to compute it, which is less than real time with a ClockSpeed above 1 in settings.json.
+        Resets still run the simulation unpaused until the vehicle is back at its start.
+        """
         self.observation_space = spaces.Box(0, 255, shape=image_shape, dtype=np.uint8)
+        self.preprocessor = DepthPreprocessor(image_shape)
         self.viewer = None
+        self.step_dt = step_dt
+        self.step_frames = step_frames
+
+    @property
+    def lockstep(self):
+        return self.step_dt is not None or self.step_frames is not None
 
     def __del__(self):
         raise NotImplementedError()
 
+    @property
+    def client(self):
+        raise NotImplementedError()
+
+    def _setup_steps(self):
+        """Generator that resets the vehicle and yields the futures the reset has to wait on, one at a time"""
+        raise NotImplementedError()
+
+    def _action_calls(self, action):
+        """RPC method names and arguments of the calls whose results _start_action() needs, none by default"""
+        return []
+
+    def _start_action(self, action, results):
+        """
+        Starts the action from the raw results of _action_calls() and returns its future, or None when only
+        action_duration has to pass
+        """
+        raise NotImplementedError()
+
+    def _obs_calls(self):
+        """RPC method names and arguments of the calls whose results make up the observation"""
+        raise NotImplementedError()
+
+    def _set_obs(self, results):
+        """Updates the state from the raw results of _obs_calls() and returns the observation"""
+        raise NotImplementedError()
+
+    def _continue(self):
+        """Starts advancing the paused simulation by one lockstep and returns the future to pass to wait_paused()"""
+        if self.step_frames is not None:
+            return self.client.client.call_async("simContinueForFrames", self.step_frames)
+        return self.client.client.call_async("simContinueForTime", self.step_dt)
+
+    def _do_action(self, action):
+        results = [self.client.client.call(method, *args) for method, args in self._action_calls(action)]
+        future = self._start_action(action, results)
+        if self.lockstep:
+            # A still running action is replaced by the next one, so it is never waited on
+            wait_paused([self], [self._continue()])
+            return
+        if self.action_duration > 0:
+            time.sleep(self.action_duration)
+        if future is not None:
+            future.join()
+
+    def _setup(self):
+        self.preprocessor.reset()
+        if self.lockstep:
+            self.client.simPause(False)
+        for future in self._setup_steps():
+            future.join()
+        if self.lockstep:
+            self.client.simPause(True)
+
     def _get_obs(self):
+        return self._set_obs([self.client.client.call(method, *args) for method, args in self._obs_calls()])
+
+    def _path_position(self):
+        """Position of the vehicle as a NumPy array in the frame of path, the Polyline the reward follows"""
         raise NotImplementedError()
 
-    def _compute_reward(self):
+    def _compute_reward(self, dist=None):
+        """Reward and done flag, dist is the distance from _path_position() to path when already computed"""
         raise NotImplementedError()
 
     def close(self):
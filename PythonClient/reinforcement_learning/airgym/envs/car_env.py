@@ -7,13 +7,33 @@ import time
 import gym
 from gym import spaces
 from airgym.envs.airsim_env import AirSimEnv
+from airgym.envs.polyline import Polyline
 
 
 class AirSimCarEnv(AirSimEnv):
-    def __init__(self, ip_address, image_shape):
-        super().__init__(image_shape)
+    vehicle_type = "physxcar"
+    action_duration = 1.0
+    reset_action = 1
+    path = Polyline(
+        [
+            [x, y, 0]
+            for x, y in [
+                (0, -1), (130, -1), (130, 125), (0, 125),
+                (0, -1), (130, -1), (130, -128), (0, -128),
+                (0, -1),
+            ]
+        ]
+    )
+
+    def __init__(self, ip_address, image_shape, vehicle_name="", port=41451, reset_simulator=True, step_dt=None,
+                 step_frames=None):
+        super().__init__(image_shape, step_dt, step_frames)
 
         self.image_shape = image_shape
+        self.vehicle_name = vehicle_name
+        # A simulator reset restarts every vehicle, so with several vehicles in one simulator each one is only
+        # moved back to the pose it had when the environment was created
+        self.reset_simulator = reset_simulator
         self.start_ts = 0
 
         self.state = {
@@ -24,7 +44,8 @@ class AirSimCarEnv(AirSimEnv):
             "collision": False,
         }
 
-        self.car = airsim.CarClient(ip=ip_address)
+        self.car = airsim.CarClient(ip=ip_address, port=port)
+        self.start_pose = self.car.simGetVehiclePose(vehicle_name=self.vehicle_name)
         self.action_space = spaces.Discrete(6)
 
         self.image_request = airsim.ImageRequest(
@@ -34,16 +55,31 @@ class AirSimCarEnv(AirSimEnv):
         self.car_controls = airsim.CarControls()
         self.car_state = None
 
-    def _setup_car(self):
-        self.car.reset()
-        self.car.enableApiControl(True)
-        self.car.armDisarm(True)
+    def _setup_steps(self):
+        if self.reset_simulator:
+            self.car.reset()
+        else:
+            self.car_controls = airsim.CarControls()
+            self.car.setCarControls(self.car_controls, vehicle_name=self.vehicle_name)
+            self.car.simSetVehiclePose(self.start_pose, True, vehicle_name=self.vehicle_name)
+        self.car.enableApiControl(True, vehicle_name=self.vehicle_name)
+        self.car.armDisarm(True, vehicle_name=self.vehicle_name)
         time.sleep(0.01)
+        # Nothing to wait on
+        yield from ()
+
+    def _setup_car(self):
+        self._setup()
 
     def __del__(self):
-        self.car.reset()
+        if self.reset_simulator:
+            self.car.reset()
 
-    def _do_action(self, action):
+    @property
+    def client(self):
+        return self.car
+
+    def _start_action(self, action, results):
         self.car_controls.brake = 0
         self.car_controls.throttle = 1
 
@@ -61,58 +97,41 @@ class AirSimCarEnv(AirSimEnv):
         else:
             self.car_controls.steering = -0.25
 
-        self.car.setCarControls(self.car_controls)
-        time.sleep(1)
+        self.car.setCarControls(self.car_controls, vehicle_name=self.vehicle_name)
 
     def transform_obs(self, response):
-        img1d = np.array(response.image_data_float, dtype=np.float)
-        img1d = 255 / np.maximum(np.ones(img1d.size), img1d)
-        img2d = np.reshape(img1d, (response.height, response.width))
-
-        from PIL import Image
-
-        image = Image.fromarray(img2d)
-        im_final = np.array(image.resize((84, 84)).convert("L"))
+        return self.preprocessor.transform(response)
 
-        return im_final.reshape([84, 84, 1])
+    def _obs_calls(self):
+        return [
+            ("simGetImages", ([self.image_request], self.vehicle_name)),
+            ("getCarState", (self.vehicle_name,)),
+            ("simGetCollisionInfo", (self.vehicle_name,)),
+        ]
 
-    def _get_obs(self):
-        responses = self.car.simGetImages([self.image_request])
-        image = self.transform_obs(responses[0])
+    def _set_obs(self, results):
+        responses_raw, state_raw, collision_raw = results
+        image = self.transform_obs(airsim.ImageResponse.from_msgpack(responses_raw[0]))
 
-        self.car_state = self.car.getCarState()
+        self.car_state = airsim.CarState.from_msgpack(state_raw)
 
         self.state["prev_pose"] = self.state["pose"]
         self.state["pose"] = self.car_state.kinematics_estimated
-        self.state["collision"] = self.car.simGetCollisionInfo().has_collided
+        self.state["collision"] = airsim.CollisionInfo.from_msgpack(collision_raw).has_collided
 
         return image
 
-    def _compute_reward(self):
+    def _path_position(self):
+        return self.state["pose"].position.to_numpy_array()
+
+    def _compute_reward(self, dist=None):
         MAX_SPEED = 300
         MIN_SPEED = 10
         THRESH_DIST = 3.5
         BETA = 3
 
-        pts = [
-            np.array([x, y, 0])
-            for x, y in [
-                (0, -1), (130, -1), (130, 125), (0, 125),
-                (0, -1), (130, -1), (130, -128), (0, -128),
-                (0, -1),
-            ]
-        ]
-        car_pt = self.state["pose"].position.to_numpy_array()
-
-        dist = 10000000
-        for i in range(0, len(pts) - 1):
-            dist = min(
-                dist,
-                np.linalg.norm(
-                    np.cross((car_pt - pts[i]), (car_pt - pts[i + 1]))
-                )
-                / np.linalg.norm(pts[i] - pts[i + 1]),
-            )
+        if dist is None:
+            dist = self.path.distance(self._path_position())
 
         # print(dist)
         if dist > THRESH_DIST:
@@ -144,5 +163,5 @@ class AirSimCarEnv(AirSimEnv):
 
     def reset(self):
         self._setup_car()
-        self._do_action(1)
+        self._do_action(self.reset_action)
         return self._get_obs()
@@ -8,13 +8,30 @@ from argparse import ArgumentParser
 import gym
 from gym import spaces
 from airgym.envs.airsim_env import AirSimEnv
+from airgym.envs.polyline import Polyline
 
 
 class AirSimDroneEnv(AirSimEnv):
-    def __init__(self, ip_address, step_length, image_shape):
-        super().__init__(image_shape)
+    vehicle_type = "simpleflight"
+    path = Polyline(
+        [
+            [-0.55265, -31.9786, -19.0225],
+            [48.59735, -63.3286, -60.07256],
+            [193.5974, -55.0786, -46.32256],
+            [369.2474, 35.32137, -62.5725],
+            [541.3474, 143.6714, -32.07256],
+        ]
+    )
+
+    def __init__(self, ip_address, step_length, image_shape, vehicle_name="", port=41451, reset_simulator=True,
+                 step_dt=None, step_frames=None):
+        super().__init__(image_shape, step_dt, step_frames)
         self.step_length = step_length
         self.image_shape = image_shape
+        self.vehicle_name = vehicle_name
+        # A simulator reset restarts every vehicle, so with several vehicles in one simulator each one is only
+        # moved back to the pose it had when the environment was created
+        self.reset_simulator = reset_simulator
 
         self.state = {
             "position": np.zeros(3),
@@ -22,7 +39,8 @@ class AirSimDroneEnv(AirSimEnv):
             "prev_position": np.zeros(3),
         }
 
-        self.drone = airsim.MultirotorClient(ip=ip_address)
+        self.drone = airsim.MultirotorClient(ip=ip_address, port=port)
+        self.start_pose = self.drone.simGetVehiclePose(vehicle_name=self.vehicle_name)
         self.action_space = spaces.Discrete(7)
         self._setup_flight()
 
@@ -31,86 +49,78 @@ class AirSimDroneEnv(AirSimEnv):
         )
 
     def __del__(self):
-        self.drone.reset()
+        if self.reset_simulator:
+            self.drone.reset()
 
-    def _setup_flight(self):
-        self.drone.reset()
-        self.drone.enableApiControl(True)
-        self.drone.armDisarm(True)
+    @property
+    def client(self):
+        return self.drone
 
-        # Set home position and velocity
-        self.drone.moveToPositionAsync(-0.55265, -31.9786, -19.0225, 10).join()
-        self.drone.moveByVelocityAsync(1, -0.67, -0.8, 5).join()
+    def _setup_steps(self):
+        if self.reset_simulator:
+            self.drone.reset()
+        else:
+            self.drone.simSetVehiclePose(self.start_pose, True, vehicle_name=self.vehicle_name)
+        self.drone.enableApiControl(True, vehicle_name=self.vehicle_name)
+        self.drone.armDisarm(True, vehicle_name=self.vehicle_name)
 
-    def transform_obs(self, responses):
-        img1d = np.array(responses[0].image_data_float, dtype=np.float)
-        img1d = 255 / np.maximum(np.ones(img1d.size), img1d)
-        img2d = np.reshape(img1d, (responses[0].height, responses[0].width))
+        # Set home position and velocity
+        yield self.drone.moveToPositionAsync(-0.55265, -31.9786, -19.0225, 10, vehicle_name=self.vehicle_name)
+        yield self.drone.moveByVelocityAsync(1, -0.67, -0.8, 5, vehicle_name=self.vehicle_name)
 
-        from PIL import Image
+    def _setup_flight(self):
+        self._setup()
 
-        image = Image.fromarray(img2d)
-        im_final = np.array(image.resize((84, 84)).convert("L"))
+    def transform_obs(self, responses):
+        return self.preprocessor.transform(responses[0])
 
-        return im_final.reshape([84, 84, 1])
+    def _obs_calls(self):
+        return [
+            ("simGetImages", ([self.image_request], self.vehicle_name)),
+            ("getMultirotorState", (self.vehicle_name,)),
+            ("simGetCollisionInfo", (self.vehicle_name,)),
+        ]
 
-    def _get_obs(self):
-        responses = self.drone.simGetImages([self.image_request])
-        image = self.transform_obs(responses)
-        self.drone_state = self.drone.getMultirotorState()
+    def _set_obs(self, results):
+        responses_raw, state_raw, collision_raw = results
+        image = self.transform_obs([airsim.ImageResponse.from_msgpack(response_raw) for response_raw in responses_raw])
+        self.drone_state = airsim.MultirotorState.from_msgpack(state_raw)
 
         self.state["prev_position"] = self.state["position"]
         self.state["position"] = self.drone_state.kinematics_estimated.position
         self.state["velocity"] = self.drone_state.kinematics_estimated.linear_velocity
 
-        collision = self.drone.simGetCollisionInfo().has_collided
+        collision = airsim.CollisionInfo.from_msgpack(collision_raw).has_collided
         self.state["collision"] = collision
 
         return image
 
-    def _do_action(self, action):
+    def _action_calls(self, action):
+        return [("getMultirotorState", (self.vehicle_name,))]
+
+    def _start_action(self, action, results):
         quad_offset = self.interpret_action(action)
-        quad_vel = self.drone.getMultirotorState().kinematics_estimated.linear_velocity
-        self.drone.moveByVelocityAsync(
+        quad_vel = airsim.MultirotorState.from_msgpack(results[0]).kinematics_estimated.linear_velocity
+        return self.drone.moveByVelocityAsync(
             quad_vel.x_val + quad_offset[0],
             quad_vel.y_val + quad_offset[1],
             quad_vel.z_val + quad_offset[2],
             5,
-        ).join()
+            vehicle_name=self.vehicle_name,
+        )
+
+    def _path_position(self):
+        return self.state["position"].to_numpy_array()
 
-    def _compute_reward(self):
+    def _compute_reward(self, dist=None):
         thresh_dist = 7
         beta = 1
 
-        z = -10
-        pts = [
-            np.array([-0.55265, -31.9786, -19.0225]),
-            np.array([48.59735, -63.3286, -60.07256]),
-            np.array([193.5974, -55.0786, -46.32256]),
-            np.array([369.2474, 35.32137, -62.5725]),
-            np.array([541.3474, 143.6714, -32.07256]),
-        ]
-
-        quad_pt = np.array(
-            list(
-                (
-                    self.state["position"].x_val,
-                    self.state["position"].y_val,
-                    self.state["position"].z_val,
-                )
-            )
-        )
-
         if self.state["collision"]:
             reward = -100
         else:
-            dist = 10000000
-            for i in range(0, len(pts) - 1):
-                dist = min(
-                    dist,
-                    np.linalg.norm(np.cross((quad_pt - pts[i]), (quad_pt - pts[i + 1])))
-                    / np.linalg.norm(pts[i] - pts[i + 1]),
-                )
+            if dist is None:
+                dist = self.path.distance(self._path_position())
 
             if dist > thresh_dist:
                 reward = -10
@@ -0,0 +1,49 @@
+import numpy as np
+
+
+class Polyline:
+    """
+    Path through a list of 3D points with vectorized distances from any number of positions to the closest point on
+    any of its segments. Everything that depends only on the path is computed once, so a distance query is two
+    matrix products over the (positions, segments) pairs, done in chunks of positions to bound memory for paths
+    with many segments.
+    """
+
+    def __init__(self, points):
+        points = np.asarray(points, dtype=np.float64)
+        self.points = points
+        self.starts = points[:-1]
+        self.directions = points[1:] - points[:-1]
+        lengths_squared = np.einsum("ij,ij->i", self.directions, self.directions)
+        # Zero length segments are points, their projection is always their start
+        self.inverse_lengths_squared = np.divide(1.0, lengths_squared, out=np.zeros_like(lengths_squared),
+                                                 where=lengths_squared > 0)
+        self.lengths_squared = lengths_squared
+        self.starts_dot_directions = np.einsum("ij,ij->i", self.starts, self.directions)
+        self.starts_squared = np.einsum("ij,ij->i", self.starts, self.starts)
+
+    def distance(self, positions, chunk_size=4096):
+        """
+        Distance from every position to the path.
+
+        Args:
+            positions (numpy.ndarray): One position of shape (3,) or several of shape (N, 3)
+            chunk_size (int, optional): Positions handled per matrix product
+
+        Returns:
+            float or numpy.ndarray: The distance, or an array of shape (N,) of distances
+        """
+        positions = np.asarray(positions, dtype=np.float64)
+        if positions.ndim == 1:
+            return float(self.distance(positions[None, :], chunk_size)[0])
+        distances = np.empty(positions.shape[0])
+        for begin in range(0, positions.shape[0], chunk_size):
+            chunk = positions[begin:begin + chunk_size]
+            # Offset of the positions from the segment starts along the segments, and its squared length
+            along = chunk @ self.directions.T - self.starts_dot_directions
+            offset_squared = (np.einsum("ij,ij->i", chunk, chunk)[:, None] - 2 * (chunk @ self.starts.T)
+                              + self.starts_squared)
+            t = np.clip(along * self.inverse_lengths_squared, 0, 1)
+            distance_squared = offset_squared - 2 * t * along + t * t * self.lengths_squared
+            distances[begin:begin + chunk_size] = np.sqrt(np.maximum(distance_squared.min(axis=1), 0))
+        return distances
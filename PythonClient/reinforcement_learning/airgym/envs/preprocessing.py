@@ -0,0 +1,72 @@
+import numpy as np
+import cosysairsim as airsim
+
+
+def area_resize_weights(in_size, out_size):
+    """
+    (out_size, in_size) matrix that averages the input pixels every output pixel covers, weighted by how much of
+    them it covers. Multiplying an image by these matrices from both sides is an area resize.
+    """
+    scale = in_size / out_size
+    edges = np.arange(out_size + 1) * scale
+    pixels = np.arange(in_size)[None, :]
+    overlap = np.minimum(edges[1:, None], pixels + 1) - np.maximum(edges[:-1, None], pixels)
+    return (np.clip(overlap, 0, None) / scale).astype(np.float32)
+
+
+def depth_capture_settings(width, height, image_type=airsim.ImageType.DepthPerspective):
+    """
+    Entry for the CaptureSettings list of a camera in settings.json that makes the simulator render the depth image
+    at width x height. There is no API to change the resolution at runtime, and capturing close to the observation
+    size saves render time, transfer and preprocessing.
+    """
+    return {"ImageType": int(image_type), "Width": width, "Height": height}
+
+
+class DepthPreprocessor:
+    """
+    Turns float depth images into uint8 observations of image_shape (height, width, frames): depth is clamped to at
+    least 1 meter, inverted to 255 / depth, area resized and truncated to uint8. All intermediate buffers are
+    allocated once per input resolution, so any capture resolution can be used. With more than one frame the last
+    frames are stacked along the last axis, newest last, and the first frame after reset() fills the whole stack.
+    """
+
+    def __init__(self, image_shape):
+        self.height, self.width, self.frames = image_shape
+        self.observation = np.zeros(image_shape, dtype=np.uint8)
+        self.input_size = None
+        self.fill = True
+
+    def _allocate(self, height, width):
+        self.input_size = (height, width)
+        self.rows = area_resize_weights(height, self.height)
+        self.columns = np.ascontiguousarray(area_resize_weights(width, self.width).T)
+        self.inverse = np.empty((height, width), dtype=np.float32)
+        self.partial = np.empty((self.height, width), dtype=np.float32)
+        self.resized = np.empty((self.height, self.width), dtype=np.float32)
+
+    def reset(self):
+        self.fill = True
+
+    def transform(self, response):
+        if (response.height, response.width) != self.input_size:
+            self._allocate(response.height, response.width)
+        data = response.image_data_float
+        if isinstance(data, np.ndarray):
+            depth = data.astype(np.float32, copy=False).reshape(self.input_size)
+        else:
+            # Faster than np.asarray for the list of floats msgpack returns
+            depth = np.fromiter(data, dtype=np.float32, count=len(data)).reshape(self.input_size)
+
+        np.maximum(depth, 1, out=self.inverse)
+        np.divide(255, self.inverse, out=self.inverse)
+        np.matmul(self.rows, self.inverse, out=self.partial)
+        np.matmul(self.partial, self.columns, out=self.resized)
+
+        if self.fill:
+            self.observation[...] = self.resized[:, :, None]
+            self.fill = False
+        else:
+            self.observation[:, :, :-1] = self.observation[:, :, 1:]
+            self.observation[:, :, -1] = self.resized
+        return self.observation.copy()
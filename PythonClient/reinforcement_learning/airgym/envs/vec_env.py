@@ -0,0 +1,195 @@
+import setup_path
+import cosysairsim as airsim
+import numpy as np
+import time
+
+from stable_baselines3.common.vec_env import VecEnv
+from airgym.envs.airsim_env import wait_paused
+
+
+class AirSimVecEnv(VecEnv):
+    """
+    Steps several AirSim environments together. The actions of all vehicles are started before any of them is waited
+    on, the observation RPCs of all vehicles are sent before any result is read, and observations, rewards and dones
+    are returned as stacked NumPy arrays. Each environment keeps its own client, so the calls of different vehicles
+    are served concurrently by the simulator. Finished environments are reset automatically and their last
+    observation is stored in info["terminal_observation"], as with the stable-baselines3 vectorized environments.
+
+    The environments can control vehicles in one simulator, created with reset_simulator=False so resetting one does
+    not restart the others, or in several simulators, with shared_simulator=False. Use make_airsim_vec_env() to
+    create both. When the environments run in lockstep, every step advances each simulator once for all of its
+    vehicles.
+    """
+
+    def __init__(self, envs, shared_simulator=True):
+        self.envs = envs
+        self.shared_simulator = shared_simulator
+        env = envs[0]
+        super().__init__(len(envs), env.observation_space, env.action_space)
+        self.buf_obs = np.zeros((self.num_envs,) + env.observation_space.shape, dtype=env.observation_space.dtype)
+        self.buf_rews = np.zeros(self.num_envs, dtype=np.float32)
+        self.buf_dones = np.zeros(self.num_envs, dtype=bool)
+        self.actions = None
+
+    def _simulators(self, indices):
+        # One environment per simulator to pause and continue it through
+        envs = [self.envs[i] for i in indices]
+        return envs[:1] if self.shared_simulator else envs
+
+    def _setup(self, indices):
+        lockstep = [env for env in self._simulators(indices) if env.lockstep]
+        for env in lockstep:
+            env.client.simPause(False)
+        for i in indices:
+            self.envs[i].preprocessor.reset()
+        # Runs the resets side by side so the vehicles fly or drive to their start at the same time
+        steps = [self.envs[i]._setup_steps() for i in indices]
+        while steps:
+            futures = []
+            running = []
+            for step in steps:
+                future = next(step, None)
+                if future is not None:
+                    futures.append(future)
+                    running.append(step)
+            for future in futures:
+                future.join()
+            steps = running
+        for env in lockstep:
+            env.client.simPause(True)
+
+    def _do_actions(self, indices, actions):
+        # The calls the actions depend on are sent for all vehicles first, so the actions start together
+        calls = [[self.envs[i].client.client.call_async(method, *args) for method, args in
+                  self.envs[i]._action_calls(action)] for i, action in zip(indices, actions)]
+        futures = [self.envs[i]._start_action(action, [future.get() for future in action_futures])
+                   for i, action, action_futures in zip(indices, actions, calls)]
+        lockstep = [env for env in self._simulators(indices) if env.lockstep]
+        if lockstep:
+            wait_paused(lockstep, [env._continue() for env in lockstep])
+            return
+        duration = max(self.envs[i].action_duration for i in indices)
+        if duration > 0:
+            time.sleep(duration)
+        for future in futures:
+            if future is not None:
+                future.join()
+
+    def _get_obs(self, indices):
+        calls = [[self.envs[i].client.client.call_async(method, *args) for method, args in self.envs[i]._obs_calls()]
+                 for i in indices]
+        for i, futures in zip(indices, calls):
+            self.buf_obs[i] = self.envs[i]._set_obs([future.get() for future in futures])
+
+    def _reset_envs(self, indices):
+        self._setup(indices)
+        reset_indices = [i for i in indices if self.envs[i].reset_action is not None]
+        if reset_indices:
+            self._do_actions(reset_indices, [self.envs[i].reset_action for i in reset_indices])
+        self._get_obs(indices)
+
+    def reset(self):
+        self._reset_envs(range(self.num_envs))
+        return self.buf_obs.copy()
+
+    def _path_distances(self):
+        # The distances of all vehicles following the same path are computed in one batch
+        distances = [None] * self.num_envs
+        paths = {}
+        for i, env in enumerate(self.envs):
+            paths.setdefault(id(env.path), (env.path, []))[1].append(i)
+        for path, indices in paths.values():
+            positions = np.array([self.envs[i]._path_position() for i in indices])
+            for i, dist in zip(indices, path.distance(positions)):
+                distances[i] = float(dist)
+        return distances
+
+    def step_async(self, actions):
+        self.actions = actions
+
+    def step_wait(self):
+        indices = range(self.num_envs)
+        self._do_actions(indices, [int(action) for action in self.actions])
+        self._get_obs(indices)
+
+        infos = []
+        for i, (env, dist) in enumerate(zip(self.envs, self._path_distances())):
+            self.buf_rews[i], self.buf_dones[i] = env._compute_reward(dist)
+            infos.append(dict(env.state))
+        done_indices = np.flatnonzero(self.buf_dones)
+        for i in done_indices:
+            infos[i]["terminal_observation"] = self.buf_obs[i].copy()
+        if len(done_indices):
+            self._reset_envs(done_indices)
+        return self.buf_obs.copy(), self.buf_rews.copy(), self.buf_dones.copy(), infos
+
+    def close(self):
+        for env in self.envs:
+            env.client.enableApiControl(False, vehicle_name=env.vehicle_name)
+
+    def _get_target_envs(self, indices):
+        return [self.envs[i] for i in self._get_indices(indices)]
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(env, attr_name) for env in self._get_target_envs(indices)]
+
+    def set_attr(self, attr_name, value, indices=None):
+        for env in self._get_target_envs(indices):
+            setattr(env, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        return [getattr(env, method_name)(*method_args, **method_kwargs) for env in self._get_target_envs(indices)]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        return [isinstance(env, wrapper_class) for env in self._get_target_envs(indices)]
+
+    def seed(self, seed=None):
+        return [None for _ in self.envs]
+
+    def get_images(self):
+        return [env.render() for env in self.envs]
+
+
+def make_airsim_vec_env(env_class, num_envs, ip_address="127.0.0.1", ports=None, vehicle_prefix=None, spacing=10.0,
+                        **env_kwargs):
+    """
+    Creates an AirSimVecEnv of num_envs environments of env_class.
+
+    Without ports all environments share the simulator at the default port. Its existing vehicles are used first
+    and the missing ones are spawned with simAddVehicle, vehicle_prefix followed by the index, spacing meters apart
+    along the y axis. Positions, rewards and home positions of the environments stay in the frame of each vehicle's
+    start, so the vehicles follow parallel courses. With ports, one environment is created for the default vehicle
+    of the simulator at each port and num_envs is ignored.
+
+    Args:
+        env_class (type): AirSimEnv subclass, e.g. AirSimDroneEnv or AirSimCarEnv
+        num_envs (int): Number of vehicles in the simulator
+        ip_address (str, optional): Address of the simulators
+        ports (list[int], optional): RPC ports of several simulators with one vehicle each
+        vehicle_prefix (str, optional): Name prefix of spawned vehicles, defaults to the vehicle type
+        spacing (float, optional): Distance in meters between spawned vehicles
+        **env_kwargs: Passed on to env_class, e.g. image_shape
+
+    Returns:
+        AirSimVecEnv: The vectorized environment
+    """
+    if ports:
+        return AirSimVecEnv([env_class(ip_address=ip_address, port=port, **env_kwargs) for port in ports],
+                            shared_simulator=False)
+
+    client = airsim.VehicleClient(ip=ip_address)
+    client.confirmConnection()
+    vehicle_names = client.listVehicles()
+    prefix = vehicle_prefix or env_class.vehicle_type
+    for i in range(len(vehicle_names), num_envs):
+        vehicle_name = "%s%d" % (prefix, i)
+        pose = airsim.Pose(airsim.Vector3r(0, i * spacing, 0))
+        if not client.simAddVehicle(vehicle_name, env_class.vehicle_type, pose):
+            raise RuntimeError("Could not spawn vehicle " + vehicle_name)
+        vehicle_names.append(vehicle_name)
+    return AirSimVecEnv(
+        [
+            env_class(ip_address=ip_address, vehicle_name=vehicle_name, reset_simulator=num_envs == 1, **env_kwargs)
+            for vehicle_name in vehicle_names[:num_envs]
+        ]
+    )
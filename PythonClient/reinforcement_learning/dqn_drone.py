@@ -1,26 +1,25 @@
 import setup_path
-import gym
-import airgym
+from airgym.envs import AirSimDroneEnv
+from airgym.envs.vec_env import make_airsim_vec_env
 import time
 
 from stable_baselines3 import DQN
-from stable_baselines3.common.monitor import Monitor
-from stable_baselines3.common.vec_env import DummyVecEnv, VecTransposeImage
+from stable_baselines3.common.vec_env import VecMonitor, VecTransposeImage
 from stable_baselines3.common.evaluation import evaluate_policy
 from stable_baselines3.common.callbacks import EvalCallback
 
-# Create a DummyVecEnv for main airsim gym env
-env = DummyVecEnv(
-    [
-        lambda: Monitor(
-            gym.make(
-                "airgym:airsim-drone-sample-v0",
-                ip_address="127.0.0.1",
-                step_length=0.25,
-                image_shape=(84, 84, 1),
-            )
-        )
-    ]
+# Number of drones trained together, spawned in the simulator when it has fewer vehicles
+num_envs = 1
+
+# Create a vectorized env that steps all vehicles together
+env = VecMonitor(
+    make_airsim_vec_env(
+        AirSimDroneEnv,
+        num_envs,
+        ip_address="127.0.0.1",
+        step_length=0.25,
+        image_shape=(84, 84, 1),
+    )
 )
 
 # Wrap env as VecTransposeImage to allow SB to handle frame observations
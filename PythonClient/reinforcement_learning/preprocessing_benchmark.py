@@ -0,0 +1,66 @@
+import setup_path
+import cosysairsim as airsim
+import numpy as np
+from argparse import ArgumentParser
+import timeit
+
+from airgym.envs.preprocessing import DepthPreprocessor
+
+# Measures how many depth images per second the airgym observation preprocessing turns into 84x84 uint8
+# observations, next to the original PIL based transform_obs, for the float lists simGetImages returns.
+# No simulator is needed.
+
+
+def legacy_transform_obs(response):
+    img1d = np.array(response.image_data_float, dtype=np.float64)
+    img1d = 255 / np.maximum(np.ones(img1d.size), img1d)
+    img2d = np.reshape(img1d, (response.height, response.width))
+
+    from PIL import Image
+
+    image = Image.fromarray(img2d)
+    im_final = np.array(image.resize((84, 84)).convert("L"))
+
+    return im_final.reshape([84, 84, 1])
+
+
+def depth_response(width, height):
+    response = airsim.ImageResponse()
+    response.width = width
+    response.height = height
+    response.pixels_as_float = True
+    response.image_data_float = np.random.default_rng(0).uniform(0.5, 100, width * height).tolist()
+    return response
+
+
+def run(name, transform, number):
+    seconds = min(timeit.repeat(transform, number=number, repeat=5))
+    print(f"{name:<40} {number / seconds:>12.0f} frames/s  {seconds / number * 1e6:>8.2f} us/frame")
+
+
+def main(args):
+    for width, height in args.resolutions:
+        response = depth_response(width, height)
+        preprocessor = DepthPreprocessor((84, 84, args.frames))
+        run(f"DepthPreprocessor {width}x{height}", lambda: preprocessor.transform(response), args.number)
+        try:
+            legacy_transform_obs(response)
+        except ImportError:
+            continue
+        run(f"transform_obs (legacy) {width}x{height}", lambda: legacy_transform_obs(response), args.number)
+
+
+def resolution(value):
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument('--number', help="Frames per measurement", type=int, default=200)
+    parser.add_argument('--resolutions', help="Capture resolutions as WIDTHxHEIGHT", type=resolution, nargs='+',
+                        default=[(256, 144), (84, 84), (640, 480)])
+    parser.add_argument('--frames', help="Stacked frames per observation", type=int, default=1)
+
+    args = parser.parse_args()
+    main(args)
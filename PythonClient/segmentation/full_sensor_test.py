@@ -54,19 +54,14 @@ if __name__ == '__main__':
 
     print("Getting GPU LiDAR data...")
     lidar_data = client.getGPULidarData('gpulidar', 'airsimvehicle')
-    points = np.array(lidar_data.point_cloud, dtype=np.dtype('f4'))
-    points = np.reshape(points, (int(points.shape[0] / 5), 5))
+    xyz = lidar_data.points
 
-    rgb_values = points[:, 3].astype(np.uint32)
-    rgb = np.zeros((np.shape(points)[0], 3))
-    xyz = points[:, 0:3]
-    for index, rgb_value in enumerate(rgb_values):
-        rgb[index, 0] = (rgb_value >> 16) & 0xFF
-        rgb[index, 1] = (rgb_value >> 8) & 0xFF
-        rgb[index, 2] = rgb_value & 0xFF
+    print("Parsing segmentation RGB8 values from float32 data values...")
+    rgb, object_ids, object_names = airsim.gpulidar_segmentation(lidar_data,
+                                                                 client.simListInstanceSegmentationObjects())
+    print("Found " + str(len(np.unique(object_ids[object_ids >= 0]))) + " objects in the pointcloud")
     rgb = np.divide(rgb, 255)
 
-    print("Parsing segmentation RGB8 values from float32 data values...")
     fig = plt.figure()
     ax = fig.add_subplot(projection='3d')
     ax.scatter(xyz[:, 0], -xyz[:, 1], -xyz[:, 2], c=rgb)
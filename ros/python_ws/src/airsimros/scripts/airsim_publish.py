@@ -7,7 +7,6 @@ import math
 from std_msgs.msg import String, Header, Float32, Float32MultiArray
 from nav_msgs.msg import Path
 from geometry_msgs.msg import PoseStamped, TransformStamped, Point, Twist
-import sensor_msgs.point_cloud2 as pc2
 import tf2_ros
 from airsimros.msg import StringArray
 from sensor_msgs.msg import PointCloud2, PointField, Imu, CameraInfo
@@ -23,6 +22,11 @@ import tf2_msgs
 from multiprocessing import Queue
 import rosbag
 from datetime import datetime
+import threading
+import queue
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor, wait
 
 
 class PID(object):
@@ -79,6 +83,120 @@ class PID(object):
         return self.get_p_error(error) + self.get_ie_error(error) + self.get_de_error(error)
 
 
+class SensorFetchStage(object):
+    # Runs the RPCs of the live loop concurrently on a pool of client connections, one per worker thread.
+    # Every task has a rate divisor: it is started on every n-th tick of the loop, and skipped while its previous
+    # fetch is still running, so a slow sensor only lowers its own rate instead of the rate of every topic.
+
+    def __init__(self, client_factory, num_connections, stats_interval):
+        self.client_factory = client_factory
+        self.local = threading.local()
+        self.executor = ThreadPoolExecutor(max_workers=max(1, num_connections), initializer=self.connect)
+        self.tasks = {}
+        self.running = {}
+        self.lags = {}
+        self.stats_interval = stats_interval
+        self.stats_start = time.time()
+        self.stats = {}
+
+    def connect(self):
+        self.local.client = self.client_factory()
+
+    def add(self, name, fetch, rate_divisor=1):
+        # fetch(client, tick, timestamp) is called from a worker thread with its own client connection
+        self.tasks[name] = (fetch, max(1, int(rate_divisor)))
+        self.stats[name] = {'fetched': 0, 'skipped': 0, 'lag': 0.0}
+
+    def run_task(self, name, fetch, tick, timestamp, start_time):
+        result = fetch(self.local.client, tick, timestamp)
+        self.lags[name] = time.time() - start_time
+        return result
+
+    def start(self, tick, timestamp):
+        for name, (fetch, rate_divisor) in self.tasks.items():
+            if tick % rate_divisor != 0:
+                continue
+            if name in self.running:
+                self.stats[name]['skipped'] += 1
+                continue
+            self.running[name] = self.executor.submit(self.run_task, name, fetch, tick, timestamp, time.time())
+
+    def collect(self, timeout):
+        # waits up to timeout seconds for the running fetches and returns the finished ones, in the order the tasks
+        # were added, as name -> future. Call result() on the future to get the fetched data or the raised error.
+        if self.running:
+            wait(list(self.running.values()), timeout=max(0.0, timeout))
+        finished = {}
+        for name in self.tasks:
+            future = self.running.get(name)
+            if future is not None and future.done():
+                del self.running[name]
+                finished[name] = future
+                if future.exception() is None:
+                    self.stats[name]['fetched'] += 1
+                    self.stats[name]['lag'] += self.lags.pop(name)
+        self.report()
+        return finished
+
+    def report(self):
+        elapsed = time.time() - self.stats_start
+        if self.stats_interval <= 0 or elapsed < self.stats_interval:
+            return
+        lines = []
+        for name, stats in self.stats.items():
+            mean_lag = stats['lag'] / stats['fetched'] if stats['fetched'] > 0 else 0.0
+            lines.append("%s: %.1f Hz, lag %.1f ms, %d skipped" % (name, stats['fetched'] / elapsed,
+                                                                  mean_lag * 1000.0, stats['skipped']))
+            self.stats[name] = {'fetched': 0, 'skipped': 0, 'lag': 0.0}
+        self.stats_start = time.time()
+        rospy.loginfo("Sensor fetch rates: " + "; ".join(lines))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+class RosbagWriter(object):
+    # Writes messages to a rosbag on a separate thread, so capturing the next pose from the simulator overlaps with
+    # serializing and writing the previous one. The bag is written to a temporary file that is only renamed to its
+    # final path when it is closed as completed, so a bag at that path always holds the full set of messages.
+
+    def __init__(self, path, max_pending=256):
+        self.path = path
+        self.temporary_path = path + '.tmp'
+        self.bag = rosbag.Bag(self.temporary_path, 'w')
+        self.pending = queue.Queue(max_pending)
+        self.error = None
+        self.thread = threading.Thread(target=self.run)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                return
+            if self.error is None:
+                try:
+                    self.bag.write(*item)
+                except Exception as e:
+                    self.error = e
+
+    def write(self, topic, msg, t):
+        if self.error is not None:
+            raise self.error
+        self.pending.put((topic, msg, t))
+
+    def close(self, completed=True):
+        self.pending.put(None)
+        self.thread.join()
+        self.bag.close()
+        if completed and self.error is None:
+            os.replace(self.temporary_path, self.path)
+        else:
+            os.remove(self.temporary_path)
+        if self.error is not None:
+            raise self.error
+
+
 def pose_2_mat(p):
     q = p.orientation
     pos = p.position
@@ -112,6 +230,47 @@ def mat_2_tf(mat, cur_time, frame, child_frame):
     return t
 
 
+POINTFIELD_DTYPES = {
+    PointField.INT8: np.int8,
+    PointField.UINT8: np.uint8,
+    PointField.INT16: np.int16,
+    PointField.UINT16: np.uint16,
+    PointField.INT32: np.int32,
+    PointField.UINT32: np.uint32,
+    PointField.FLOAT32: np.float32,
+    PointField.FLOAT64: np.float64
+}
+
+FIELDS_XYZ = [
+    PointField('x', 0, PointField.FLOAT32, 1),
+    PointField('y', 4, PointField.FLOAT32, 1),
+    PointField('z', 8, PointField.FLOAT32, 1)
+]
+
+
+def create_cloud_from_columns(header, fields, columns):
+    # Same message as sensor_msgs.point_cloud2.create_cloud, but the point data is packed straight from NumPy columns, one per field,
+    # instead of going through a Python tuple per point
+    point_step = max(field.offset + np.dtype(POINTFIELD_DTYPES[field.datatype]).itemsize * field.count
+                     for field in fields)
+    dtype = np.dtype({'names': [field.name for field in fields],
+                      'formats': [POINTFIELD_DTYPES[field.datatype] for field in fields],
+                      'offsets': [field.offset for field in fields],
+                      'itemsize': point_step})
+    cloud = np.zeros(len(columns[0]), dtype=dtype)
+    for field, column in zip(fields, columns):
+        cloud[field.name] = column
+    return PointCloud2(header=header,
+                       height=1,
+                       width=len(cloud),
+                       is_dense=False,
+                       is_bigendian=False,
+                       fields=fields,
+                       point_step=point_step,
+                       row_step=point_step * len(cloud),
+                       data=cloud.tobytes())
+
+
 def handle_input_command(msg, args):
     # set the controls for car
     q = args
@@ -323,8 +482,35 @@ def get_object_pose_ros_message(c, object_pose_individual_coordinates_local, cur
         return object_pose, warning_issued_result
 
 
-def get_wifi_ros_message(c, cur_vehicle_name, cur_rospy, cur_timestamp):
+def get_range_arrays_ros_message(cur_range_data, cur_timestamp, cur_strip_anchor_prefix):
+    # one RangeArray per tag with the strongest range to each anchor, see airsim.group_ranges_by_tag()
     range_arrays = []
+    tags = cur_range_data.tags_as_structured()
+    for tag, tag_ranges in zip(tags.tolist(), airsim.group_ranges_by_tag(cur_range_data)):
+        if len(tag_ranges) == 0:
+            continue
+        range_array = RangeArray()
+        range_array.tagid = tag[0]
+        range_array.tag_position = Point(tag[1], tag[2], tag[3])
+        range_array.header.stamp = cur_timestamp
+        for _, anchor_id, _, anchor_x, anchor_y, anchor_z, valid_range, distance, rssi in tag_ranges.tolist():
+            diag = Diagnostics()
+            diag.rssi = rssi
+
+            rang = Range()
+            rang.stamp = cur_timestamp
+            rang.anchorid = anchor_id.split(":")[-1] if cur_strip_anchor_prefix else anchor_id
+            rang.anchor_position = Point(anchor_x, anchor_y, anchor_z)
+            rang.valid_range = valid_range
+            rang.distance = distance
+            rang.diagnostics = diag
+
+            range_array.ranges.append(rang)
+        range_arrays.append(range_array)
+    return range_arrays
+
+
+def get_wifi_ros_message(c, cur_vehicle_name, cur_rospy, cur_timestamp):
     wifi_data = c.getWifiData(vehicle_name=cur_vehicle_name)
 
     # Sanity check
@@ -346,80 +532,10 @@ def get_wifi_ros_message(c, cur_vehicle_name, cur_rospy, cur_timestamp):
         cur_rospy.signal_shutdown('Packet error.')
         sys.exit()
 
-    wifi_data.wr_anchorId = np.array(wifi_data.wr_anchorId)
-
-    wr_time_stamp = []
-    wr_anchorId = []
-    wr_anchorPosX = []
-    wr_anchorPosY = []
-    wr_anchorPosZ = []
-    wr_valid_range = []
-    wr_distance = []
-    wr_rssi = []
-    wra_ranges = []
-
-    idx_offset = 0
-
-    for rangeIdx, ranges in enumerate(wifi_data.wra_ranges):
-        u, uniqueRangeIds = np.unique(wifi_data.wr_anchorId[ranges], return_index=True)
-        uniqueRangeIds += idx_offset
-
-        wra_ranges_idx_start = len(wr_anchorPosX)
-        wr_anchorPosX += list(np.array(wifi_data.wr_anchorPosX)[uniqueRangeIds])
-        wr_anchorPosY += list(np.array(wifi_data.wr_anchorPosY)[uniqueRangeIds])
-        wr_anchorPosZ += list(np.array(wifi_data.wr_anchorPosZ)[uniqueRangeIds])
-        wr_time_stamp += list(np.array(wifi_data.wr_time_stamp)[uniqueRangeIds])
-        wr_anchorId += list(np.array(wifi_data.wr_anchorId)[uniqueRangeIds])
-        wr_valid_range += list(np.array(wifi_data.wr_valid_range)[uniqueRangeIds])
-
-        wra_ranges.append([])
-        wra_ranges[rangeIdx] = list(range(wra_ranges_idx_start, len(wr_anchorPosX)))
-        for arange in uniqueRangeIds:
-            currentRanges = np.array(wifi_data.wr_anchorId)[ranges]
-            currentRssi = np.array(wifi_data.wr_rssi)[ranges]
-            currentDistance = np.array(wifi_data.wr_distance)[ranges]
-            currentRssiFiltered = currentRssi * list(
-                map(int, currentRanges == wifi_data.wr_anchorId[arange]))
-            maxRssi = max(currentRssiFiltered)
-            maxRssiIdx = currentRssiFiltered.argmax()
-
-            wr_distance.append(currentDistance[maxRssiIdx])
-            wr_rssi.append(maxRssi)
-
-        # for arange in uniqueRangeIds:
-
-        idx_offset += len(ranges)
-
-    for wra_idx in range(0, len(wifi_data.wra_tagId)):
-        range_array = RangeArray()
-        range_array.tagid = str(wifi_data.wra_tagId[wra_idx])
-        range_array.tag_position = Point(wifi_data.wra_tagPosX[wra_idx], wifi_data.wra_tagPosY[wra_idx],
-                                         wifi_data.wra_tagPosZ[wra_idx])
-        range_array.header.stamp = cur_timestamp
-
-        # for wr_id in range(0, len(wr_time_stamp)):
-        for wr_id in wra_ranges[wra_idx]:
-            diag = Diagnostics()
-            diag.rssi = wr_rssi[wr_id]
-
-            rang = Range()
-            # rang.stamp = wr_time_stamp[wr_id]
-            rang.stamp = cur_timestamp
-            rang.anchorid = str(wr_anchorId[wr_id])
-            rang.anchor_position = Point(wr_anchorPosX[wr_id], wr_anchorPosY[wr_id], wr_anchorPosZ[wr_id])
-            rang.valid_range = wr_valid_range[wr_id]
-            rang.distance = wr_distance[wr_id]
-            rang.diagnostics = diag
-
-            range_array.ranges.append(rang)
-            range_arrays.append(range_array)
-
-    return range_arrays
+    return get_range_arrays_ros_message(wifi_data, cur_timestamp, False)
 
 
 def get_uwb_ros_message(c, cur_vehicle_name, cur_rospy, cur_timestamp):
-    range_arrays = []
-
     cur_uwb_data = c.getUWBData(vehicle_name=cur_vehicle_name)
 
     # Sanity check
@@ -441,75 +557,7 @@ def get_uwb_ros_message(c, cur_vehicle_name, cur_rospy, cur_timestamp):
         cur_rospy.signal_shutdown('Packet error.')
         sys.exit()
 
-    cur_uwb_data.mur_anchorId = np.array(cur_uwb_data.mur_anchorId)
-
-    mur_time_stamp = []
-    mur_anchorId = []
-    mur_anchorPosX = []
-    mur_anchorPosY = []
-    mur_anchorPosZ = []
-    mur_valid_range = []
-    mur_distance = []
-    mur_rssi = []
-    mura_ranges = []
-
-    idx_offset = 0
-
-    for rangeIdx, ranges in enumerate(cur_uwb_data.mura_ranges):
-        u, uniqueRangeIds = np.unique(cur_uwb_data.mur_anchorId[ranges], return_index=True)
-        uniqueRangeIds += idx_offset
-
-        mura_ranges_idx_start = len(mur_anchorPosX)
-        mur_anchorPosX += list(np.array(cur_uwb_data.mur_anchorPosX)[uniqueRangeIds])
-        mur_anchorPosY += list(np.array(cur_uwb_data.mur_anchorPosY)[uniqueRangeIds])
-        mur_anchorPosZ += list(np.array(cur_uwb_data.mur_anchorPosZ)[uniqueRangeIds])
-        mur_time_stamp += list(np.array(cur_uwb_data.mur_time_stamp)[uniqueRangeIds])
-        mur_anchorId += list(np.array(cur_uwb_data.mur_anchorId)[uniqueRangeIds])
-        mur_valid_range += list(np.array(cur_uwb_data.mur_valid_range)[uniqueRangeIds])
-
-        mura_ranges.append([])
-        mura_ranges[rangeIdx] = list(range(mura_ranges_idx_start, len(mur_anchorPosX)))
-        for arange in uniqueRangeIds:
-            currentRanges = np.array(cur_uwb_data.mur_anchorId)[ranges]
-            currentRssi = np.array(cur_uwb_data.mur_rssi)[ranges]
-            currentDistance = np.array(cur_uwb_data.mur_distance)[ranges]
-            currentRssiFiltered = currentRssi * list(
-                map(int, currentRanges == cur_uwb_data.mur_anchorId[arange]))
-            maxRssi = max(currentRssiFiltered)
-            maxRssiIdx = currentRssiFiltered.argmax()
-
-            mur_distance.append(currentDistance[maxRssiIdx])
-            mur_rssi.append(maxRssi)
-
-        # for arange in uniqueRangeIds:
-        idx_offset += len(ranges)
-
-    for mura_idx in range(0, len(cur_uwb_data.mura_tagId)):
-        range_array = RangeArray()
-        range_array.tagid = str(cur_uwb_data.mura_tagId[mura_idx])
-        range_array.tag_position = Point(cur_uwb_data.mura_tagPosX[mura_idx], cur_uwb_data.mura_tagPosY[mura_idx],
-                                         cur_uwb_data.mura_tagPosZ[mura_idx])
-        range_array.header.stamp = cur_timestamp
-
-        # for mur_id in range(0, len(mur_time_stamp)):
-        for mur_id in mura_ranges[mura_idx]:
-            diag = Diagnostics()
-            diag.rssi = mur_rssi[mur_id]
-
-            rang = Range()
-            # rang.stamp = mur_time_stamp[mur_id]
-            rang.stamp = cur_timestamp
-            rang.anchorid = str(mur_anchorId[mur_id]).split(":")[-1]
-            rang.anchor_position = Point(mur_anchorPosX[mur_id], mur_anchorPosY[mur_id],
-                                         mur_anchorPosZ[mur_id])
-            rang.valid_range = mur_valid_range[mur_id]
-            rang.distance = mur_distance[mur_id]
-            rang.diagnostics = diag
-
-            range_array.ranges.append(rang)
-            range_arrays.append(range_array)
-
-    return range_arrays
+    return get_range_arrays_ros_message(cur_uwb_data, cur_timestamp, True)
 
 
 def get_gpulidar_ros_message(c, cur_sensor_name, cur_vehicle_name, cur_last_timestamp, cur_fields_lidar,
@@ -523,19 +571,13 @@ def get_gpulidar_ros_message(c, cur_sensor_name, cur_vehicle_name, cur_last_time
         else:
             last_timestamp_return = cur_lidar_data.time_stamp
 
-            pcloud = PointCloud2()
-            points = np.array(cur_lidar_data.point_cloud, dtype=np.dtype('f4'))
-            points = np.reshape(points, (int(points.shape[0] / 5), 5))
-            points_x = points[:, 0]
-            points_y = -points[:, 1]
-            points_z = -points[:, 2]
-            points_rgb = points[:, 3].astype('uint32')
-            points_intensity = points[:, 4]
-            points_list = [points_x, points_y, points_z, points_rgb, points_intensity]
-            points_list_transposed = [list(i) for i in zip(*points_list)]
-            pcloud.header.frame_id = cur_sensor_gpulidar_frame
-            pcloud.header.stamp = cur_timestamp
-            pcloud = pc2.create_cloud(pcloud.header, cur_fields_lidar, points_list_transposed)
+            header = Header()
+            header.frame_id = cur_sensor_gpulidar_frame
+            header.stamp = cur_timestamp
+            points = cur_lidar_data.as_structured()
+            pcloud = create_cloud_from_columns(header, cur_fields_lidar,
+                                               [points['x'], -points['y'], -points['z'], points['rgb'],
+                                                points['intensity']])
             return pcloud, last_timestamp_return
     else:
         return None, None
@@ -552,19 +594,15 @@ def get_lidar_ros_message(c, cur_sensor_name, cur_vehicle_name, cur_last_timesta
         else:
             last_timestamp_return = cur_lidar_data.time_stamp
 
-            pcloud = PointCloud2()
-            points = np.array(cur_lidar_data.point_cloud, dtype=np.dtype('f4'))
-            points = np.reshape(points, (int(points.shape[0] / 3), 3))
-            points = points * np.array([1, -1, -1])
-            cloud = points.tolist()
-            pcloud.header.frame_id = cur_sensor_lidar_frame
-            pcloud.header.stamp = cur_timestamp
-            pcloud = pc2.create_cloud_xyz32(pcloud.header, cloud)
+            header = Header()
+            header.frame_id = cur_sensor_lidar_frame
+            header.stamp = cur_timestamp
+            points = cur_lidar_data.points
+            pcloud = create_cloud_from_columns(header, FIELDS_XYZ, [points[:, 0], -points[:, 1], -points[:, 2]])
 
             if cur_sensor_lidar_toggle_segmentation == 1:
-                labels = np.array(cur_lidar_data.groundtruth, dtype=np.dtype('U'))
                 groundtruth = StringArray()
-                groundtruth.data = labels.tolist()
+                groundtruth.data = cur_lidar_data.groundtruth
                 groundtruth.header.frame_id = cur_sensor_lidar_frame
                 groundtruth.header.stamp = cur_timestamp
             else:
@@ -587,18 +625,16 @@ def get_echo_ros_message(c, cur_sensor_name, cur_vehicle_name, cur_last_timestam
             last_timestamp_return = cur_timestamp
             header = Header()
             header.frame_id = cur_sensor_echo_frame
+            header.stamp = cur_timestamp
 
             if len(cur_echo_data.point_cloud) > 5:
-                points = np.array(cur_echo_data.point_cloud, dtype=np.dtype('f4'))
-                points = np.reshape(points, (int(points.shape[0] / 6), 6))
-                points = points * np.array([1, -1, -1, 1, 1, 1])
-                points_list = points.tolist()
-                pcloud = pc2.create_cloud(header, cur_fields_echo, points_list)
-                pcloud.header.stamp = cur_timestamp
-
-                labels = np.array(cur_echo_data.groundtruth, dtype=np.dtype('U'))
+                points = cur_echo_data.as_structured()
+                pcloud = create_cloud_from_columns(header, cur_fields_echo,
+                                                   [points['x'], -points['y'], -points['z'], points['attenuation'],
+                                                    points['distance'], points['reflections']])
+
                 groundtruth = StringArray()
-                groundtruth.data = labels.tolist()
+                groundtruth.data = cur_echo_data.groundtruth
                 groundtruth.header.frame_id = cur_sensor_echo_frame
                 groundtruth.header.stamp = cur_timestamp
             else:
@@ -607,16 +643,15 @@ def get_echo_ros_message(c, cur_sensor_name, cur_vehicle_name, cur_last_timestam
 
             if passive_enable:
                 if len(cur_echo_data.passive_beacons_point_cloud) > 8:
-                    pointsp = np.array(cur_echo_data.passive_beacons_point_cloud, dtype=np.dtype('f4'))
-                    pointsp = np.reshape(pointsp, (int(pointsp.shape[0] / 9), 9))
-                    pointsp = pointsp * np.array([1, -1, -1, 1, 1, 1, 1, -1, -1])
-                    pointsp_list = pointsp.tolist()
-                    pcloud_passive = pc2.create_cloud(header, cur_fields_echo_passive, pointsp_list)
-                    pcloud_passive.header.stamp = cur_timestamp
-
-                    labelsp = np.array(cur_echo_data.passive_beacons_groundtruth, dtype=np.dtype('U'))
+                    pointsp = cur_echo_data.passive_beacons_as_structured()
+                    pcloud_passive = create_cloud_from_columns(header, cur_fields_echo_passive,
+                                                               [pointsp['x'], -pointsp['y'], -pointsp['z'],
+                                                                pointsp['attenuation'], pointsp['distance'],
+                                                                pointsp['reflections'], pointsp['reflection_x'],
+                                                                -pointsp['reflection_y'], -pointsp['reflection_z']])
+
                     groundtruth_passive = StringArray()
-                    groundtruth_passive.data = labelsp.tolist()
+                    groundtruth_passive.data = cur_echo_data.passive_beacons_groundtruth
                     groundtruth_passive.header.frame_id = cur_sensor_echo_frame
                     groundtruth_passive.header.stamp = cur_timestamp
                 else:
@@ -738,30 +773,17 @@ def airsim_publish(client, use_route, route_rosbag, merged_rosbag, generate_gt_m
     else:
         rospy.loginfo("Reading route...")
         route = rosbag.Bag(route_rosbag)
-        output = rosbag.Bag(merged_rosbag, 'w')
         rospy.loginfo("Route retrieved!")
 
         rospy.loginfo("Started publishers...")
         rospy.logwarn("Ensure focus is on the screen of AirSim simulator to allow auto configuration!")
         rospy.logdebug(str(route.get_type_and_topic_info()))
 
-        last_timestamps = {}
-        warning_issued = {}
-        for cur_sensor_index, cur_sensor_name in enumerate(sensor_echo_names):
-            last_timestamps[cur_sensor_name] = None
-        for cur_sensor_index, cur_sensor_name in enumerate(sensor_lidar_names):
-            last_timestamps[cur_sensor_name] = None
-        for cur_sensor_index, cur_sensor_name in enumerate(sensor_gpulidar_names):
-            last_timestamps[cur_sensor_name] = None
-        for object_index, object_name in enumerate(object_poses_individual_names):
-            warning_issued[object_name] = False
-
         cameraInfo_objects = {}
         for cur_sensor_index, cur_sensor_name in enumerate(sensor_camera_names):
             if sensor_camera_toggle_camera_info[cur_sensor_index] == 1:
                 cameraInfo_objects[cur_sensor_name] = client.simGetCameraInfo(cur_sensor_name, vehicle_name)
 
-        pose_count = route.get_message_count('/' + pose_topic)
         pose_index = 1
         period = 1 / ros_rate
         tolerance = 0.05 * period
@@ -808,7 +830,7 @@ def airsim_publish(client, use_route, route_rosbag, merged_rosbag, generate_gt_m
         PointField('z', 8, PointField.FLOAT32, 1),
         PointField('a', 12, PointField.FLOAT32, 1),
         PointField('d', 16, PointField.FLOAT32, 1),
-        PointField('r', 16, PointField.FLOAT32, 1)
+        PointField('r', 20, PointField.FLOAT32, 1)
     ]
 
     fields_echo_passive = [
@@ -832,303 +854,104 @@ def airsim_publish(client, use_route, route_rosbag, merged_rosbag, generate_gt_m
     ]
 
     if use_route:
+        # Select the route poses to replay up front, so they can be split into chunks of route_chunk_size poses.
+        # Every chunk is captured into its own bag in the parts directory next to the merged rosbag. A chunk bag
+        # only gets its final name once all of its poses are written, so the finished chunk bags are the checkpoint
+        # a stopped replay resumes from. The chunks are shared out over one simulator instance per port in
+        # route_ports and merged into the merged rosbag once every chunk is done.
+        selected_poses = []
         for topic, msg, t in route.read_messages(topics=['/' + pose_topic, 'tf_static']):
-
-            if rospy.is_shutdown():
-                break
-
-            ros_timestamp = t
             if first_timestamp is None:
-                first_timestamp = ros_timestamp
-            timestamp = msg.header.stamp
-
+                first_timestamp = t
             if topic == "tf_static":
                 saved_static_tf.transforms = saved_static_tf.transforms + msg.transforms
-
             elif topic == '/' + pose_topic:
                 elapsedTime = t.to_sec() - last_time
                 if elapsedTime + tolerance >= period:
-                    client.simContinueForTime(period)
                     last_time = t.to_sec()
-                    cur_position = airsim.Vector3r(msg.pose.position.x, -msg.pose.position.y, -msg.pose.position.z)
-                    cur_orientation = airsim.Quaternionr(msg.pose.orientation.x, msg.pose.orientation.y,
-                                                         msg.pose.orientation.z, msg.pose.orientation.w).inverse()
-                    cur_orientation = airsim.Quaternionr(float(cur_orientation.x_val), float(cur_orientation.y_val),
-                                                         float(cur_orientation.z_val), float(cur_orientation.w_val))
-                    client.simSetVehiclePose(airsim.Pose(cur_position, cur_orientation), True, vehicle_name)
-
-                    rospy.loginfo("Setting vehicle pose " + str(pose_index) + ' of ' + str(pose_count)
-                                  + ' to record sensor data...')
-
-                    camera_responses = client.simGetImages(requests, vehicle_name)
-                    for cur_sensor_index, cur_sensor_name in enumerate(sensor_camera_names):
-                        response = camera_responses[response_locations[cur_sensor_name + '_scene']]
-                        if response.width == 0 and response.height == 0:
-                            rospy.logwarn("Camera '" + cur_sensor_name + "' could not retrieve scene image.")
-                        else:
-                            camera_msg = (
-                                get_scene_camera_ros_message(response, timestamp,
-                                                             sensor_camera_optical_frames[cur_sensor_index],
-                                                             cv_bridge,
-                                                             sensor_camera_scene_quality[cur_sensor_index],
-                                                             sensor_camera_toggle_scene_mono[cur_sensor_index]))
-                            output.write(sensor_camera_scene_topics[cur_sensor_index], camera_msg, t=ros_timestamp)
-                        if sensor_camera_toggle_segmentation[cur_sensor_index] == 1:
-                            response = camera_responses[response_locations[cur_sensor_name + '_segmentation']]
-                            if response.width == 0 and response.height == 0:
-                                rospy.logwarn("Camera '" + cur_sensor_name + "' could not retrieve segmentation image.")
-                            else:
-                                camera_msg = get_segmentation_camera_ros_message(camera_msg, response)
-                                output.write(sensor_camera_segmentation_topics[cur_sensor_index], camera_msg,
-                                             t=ros_timestamp)
-                        if sensor_camera_toggle_depth[cur_sensor_index] == 1:
-                            response = camera_responses[response_locations[cur_sensor_name + '_depth']]
-                            if response.width == 0 and response.height == 0:
-                                rospy.logwarn("Camera '" + cur_sensor_name + "' could not retrieve depth image.")
-                            else:
-                                camera_msg = get_depth_camera_ros_message(camera_msg, response)
-                                output.write(sensor_camera_depth_topics[cur_sensor_index], camera_msg,
-                                             t=ros_timestamp)
-                        if sensor_camera_toggle_annotation[cur_sensor_index] == 1:
-                            response = camera_responses[response_locations[cur_sensor_name + '_annotation']]
-                            if response.width == 0 and response.height == 0:
-                                rospy.logwarn("Camera '" + cur_sensor_name + "' could not retrieve annotation image.")
-                            else:
-                                camera_msg = get_annotation_camera_ros_message(camera_msg, response)
-                                output.write(sensor_camera_annotation_topics[cur_sensor_index], camera_msg,
-                                             t=ros_timestamp)
-                        if sensor_camera_toggle_camera_info[cur_sensor_index] == 1:
-                            if cur_sensor_index == 1:
-                                first_sensor = True
-                            else:
-                                first_sensor = False
-                            cam_info_msg = get_camera_info_ros_message(cameraInfo_objects[cur_sensor_name].fov,
-                                                                       sensor_camera_optical_frames[cur_sensor_index],
-                                                                       timestamp, response.width, response.height,
-                                                                       sensor_stereo_enable, baseline, first_sensor)
-                            output.write(sensor_camera_info_topics[cur_sensor_index], cam_info_msg, t=ros_timestamp)
-
-                    for cur_sensor_index, cur_sensor_name in enumerate(sensor_echo_names):
-                        pcloud, groundtruth, last_timestamp_return, pcloud_passive, groundtruth_passive = (
-                            get_echo_ros_message(client, cur_sensor_name, vehicle_name,
-                                                 last_timestamps[cur_sensor_name], fields_echo, fields_echo_passive,
-                                                 sensor_echo_frames[cur_sensor_index], timestamp,
-                                                 sensor_echo_toggle_passive[cur_sensor_index]))
-                        if last_timestamp_return is not None:
-                            last_timestamps[cur_sensor_name] = last_timestamp_return
-                        if pcloud is not None:
-                            output.write(sensor_echo_topics[cur_sensor_index], pcloud, t=ros_timestamp)
-
-                        if groundtruth is not None:
-                            output.write(sensor_echo_segmentation_topics[cur_sensor_index], groundtruth,
-                                         t=ros_timestamp)
-                        if sensor_echo_toggle_passive[cur_sensor_index]:
-                            if pcloud_passive is not None:
-                                output.write(sensor_echo_passive_topics[cur_sensor_index], pcloud_passive,
-                                             t=ros_timestamp)
-
-                            if groundtruth_passive is not None:
-                                output.write(sensor_echo_passive_segmentation_topics[cur_sensor_index],
-                                             groundtruth_passive, t=ros_timestamp)
-
-                    for cur_sensor_index, cur_sensor_name in enumerate(sensor_lidar_names):
-                        seg_enable = sensor_lidar_toggle_segmentation[cur_sensor_index]
-                        cur_frame = sensor_lidar_frames[cur_sensor_index]
-                        pcloud, groundtruth, last_timestamp_return = get_lidar_ros_message(client, cur_sensor_name,
-                                                                                           vehicle_name,
-                                                                                           last_timestamps[
-                                                                                               cur_sensor_name],
-                                                                                           cur_frame,
-                                                                                           timestamp,
-                                                                                           seg_enable)
-                        if last_timestamp_return is not None:
-                            last_timestamps[cur_sensor_name] = last_timestamp_return
-                        if pcloud is not None:
-                            output.write(sensor_lidar_topics[cur_sensor_index], pcloud, t=ros_timestamp)
-                        if sensor_lidar_toggle_segmentation[cur_sensor_index] == 1:
-                            if groundtruth is not None:
-                                output.write(sensor_lidar_segmentation_topics[cur_sensor_index], groundtruth,
-                                             t=ros_timestamp)
-
-                    for cur_sensor_index, cur_sensor_name in enumerate(sensor_gpulidar_names):
-                        pcloud, last_timestamp_return = get_gpulidar_ros_message(client, cur_sensor_name, vehicle_name,
-                                                                                 last_timestamps[cur_sensor_name],
-                                                                                 fields_lidar,
-                                                                                 sensor_gpulidar_frames[
-                                                                                     cur_sensor_index],
-                                                                                 timestamp)
-                        if last_timestamp_return is not None:
-                            last_timestamps[cur_sensor_name] = last_timestamp_return
-                        if pcloud is not None:
-                            output.write(sensor_gpulidar_topics[cur_sensor_index], pcloud, t=ros_timestamp)
-
-                    for cur_sensor_index, cur_sensor_name in enumerate(sensor_uwb_names):
-                        if cur_sensor_index == 0:  # only once
-                            range_arrays = get_uwb_ros_message(client, vehicle_name, rospy, timestamp)
-                            if len(range_arrays) != 0:
-                                for range_array in range_arrays:
-                                    output.write(sensor_uwb_topic, range_array, t=ros_timestamp)
-
-                    for cur_sensor_index, cur_sensor_name in enumerate(sensor_wifi_names):
-                        if cur_sensor_index == 0:  # only once
-                            range_arrays = get_wifi_ros_message(client, vehicle_name, rospy, timestamp)
-                            if len(range_arrays) != 0:
-                                for range_array in range_arrays:
-                                    output.write(sensor_wifi_topic, range_array, t=ros_timestamp)
-
-                    if object_poses_all:
-                        object_path = get_all_objects_ros_path_message(client, timestamp, first_message,
-                                                                       object_poses_all_once,
-                                                                       map_frame, object_poses_all_coordinates_local)
-                        if object_path is not None:
-                            output.write(object_poses_all_topic, object_path, t=ros_timestamp)
-
-                    else:
-                        for object_index, object_name in enumerate(object_poses_individual_names):
-                            local_enable = object_poses_individual_coordinates_local[object_index]
-                            object_pose, warning_issued_result = get_object_pose_ros_message(client, local_enable,
-                                                                                             object_name,
-                                                                                             warning_issued[
-                                                                                                 object_name],
-                                                                                             rospy, timestamp,
-                                                                                             map_frame)
-                            warning_issued[object_name] = warning_issued_result
-                            if not warning_issued_result:
-                                if object_pose is not None:
-                                    output.write(object_poses_individual_topics[object_index], object_pose,
-                                                 t=ros_timestamp)
-
-                    pose_index += 1
-                    first_message = False
-                    time.sleep(1)
-
-        output.write('/tf_static', saved_static_tf, first_timestamp)
-        rospy.loginfo("Process completed. Writing all other messages to merged rosbag...")
-        for topic, msg, t in route.read_messages():
-            if topic != 'tf/static':
-                output.write(topic, msg, t)
-        output.close()
-        rospy.loginfo("Merged rosbag with route and sensor data created!")
-        if generate_gt_map:
-            rospy.loginfo("Loading segmentation colormap...")
-            colorMap = client.simGetSegmentationColorMap()
-            rospy.loginfo("Loaded segmentation colormap.")
-
-            currentObjectList = client.simListInstanceSegmentationObjects()
-            rospy.loginfo("Generating list of all current objects...")
-            with open('airsim_gt_map_' + datetime.now().strftime("%Y_%m_%d_%H_%M_%S") + '.csv', 'w') as f:
-                f.write("ObjectName,R,G,B\n")
-                for index, item in enumerate(currentObjectList):
-                    f.write("%s,%s\n" % (item, ','.join([str(x) for x in colorMap[index, :]])))
-            rospy.loginfo("Generated ground truth map of " + str(len(currentObjectList)) + ' objects.')
-
-    else:
-        segmentation_warning_issued = False
-        while not rospy.is_shutdown():
-
-            timestamp = rospy.Time.now()
-
-            try:
-                cur_pose = client.simGetVehiclePose(vehicle_name)
-            except msgpackrpc.error.RPCError:
-                rospy.logerr("vehicle '" + vehicle_name + "' could not be found.")
-                rospy.signal_shutdown('Vehicle not found.')
-                sys.exit()
-
-            cur_pos = cur_pose.position
-            cur_orientation = cur_pose.orientation.inverse()
-
-            pose_msg = PoseStamped()
-            pose_msg.header.stamp = timestamp
-            pose_msg.header.frame_id = map_frame
-            pose_msg.header.seq = 1
-
-            pose_msg.pose.position.x = cur_pos.x_val + pose_offset_x
-            pose_msg.pose.position.y = -cur_pos.y_val + pose_offset_y
-            pose_msg.pose.position.z = -cur_pos.z_val + pose_offset_z
-            pose_msg.pose.orientation.w = cur_orientation.w_val
-            pose_msg.pose.orientation.x = cur_orientation.x_val
-            pose_msg.pose.orientation.y = cur_orientation.y_val
-            pose_msg.pose.orientation.z = cur_orientation.z_val
-            pose_publisher.publish(pose_msg)
-
-            sim_odom = Odometry()
-            if odometry_enable:
-                sim_odom.header = pose_msg.header
-                sim_odom.child_frame_id = odom_frame
-                sim_odom.pose.pose = pose_msg.pose
-                kinematics = client.simGetGroundTruthKinematics(vehicle_name)
-                t_w_veh = tf.transformations.quaternion_matrix([cur_orientation.x_val, cur_orientation.y_val,
-                                                                cur_orientation.z_val, cur_orientation.w_val])
-                t_w_veh[:3, 3] = np.array([cur_pos.x_val, -cur_pos.y_val, -cur_pos.z_val])
-                t_veh_w = t_invert(t_w_veh)
-
-                local_linear = np.matmul(t_veh_w[:3, :3], np.array(
-                    [kinematics.linear_velocity.x_val, - kinematics.linear_velocity.y_val,
-                     - kinematics.linear_velocity.z_val]))
-                local_angular = np.matmul(t_veh_w[:3, :3], np.array(
-                    [kinematics.angular_velocity.x_val, - kinematics.angular_velocity.y_val,
-                     - kinematics.angular_velocity.z_val]))
-                sim_odom.twist.twist.linear.x = local_linear[0]
-                sim_odom.twist.twist.linear.y = local_linear[1]
-                sim_odom.twist.twist.linear.z = local_linear[2]
-                sim_odom.twist.twist.angular.x = local_angular[0]
-                sim_odom.twist.twist.angular.y = local_angular[1]
-                sim_odom.twist.twist.angular.z = local_angular[2]
-                odom_publisher.publish(sim_odom)
-
-            if tf_odom_enable:
-                tf_odom_pose = mat_2_tf(pose_2_mat(pose_msg.pose), timestamp, map_frame, odom_frame)
-                tf_br.sendTransform(tf_odom_pose)
-
-                tf_map_odom = TransformStamped()
-                tf_map_odom.header.stamp = timestamp
-                tf_map_odom.header.frame_id = odom_frame
-                tf_map_odom.child_frame_id = vehicle_base_frame
-                tf_map_odom.transform.rotation.w = 1
-                tf_br.sendTransform(tf_map_odom)
-
-            if sensor_imu_enable:
-                imu_msg = get_imu_ros_message(client, sensor_imu_name, vehicle_name, timestamp, sensor_imu_frame)
-                imu_publisher.publish(imu_msg)
-
-            camera_responses = client.simGetImages(requests, vehicle_name)
+                    selected_poses.append((msg, t))
+
+        chunk_size = max(1, int(route_chunk_size))
+        chunks = [selected_poses[start:start + chunk_size] for start in range(0, len(selected_poses), chunk_size)]
+        parts_directory = merged_rosbag + '.parts'
+        parts_signature = "%s %d %d %f\n" % (os.path.abspath(route_rosbag), len(selected_poses), chunk_size, period)
+        parts_signature_file = os.path.join(parts_directory, 'route.txt')
+        if os.path.isdir(parts_directory):
+            previous_signature = None
+            if os.path.isfile(parts_signature_file):
+                with open(parts_signature_file) as f:
+                    previous_signature = f.read()
+            if not route_resume or previous_signature != parts_signature:
+                if route_resume:
+                    rospy.logwarn("Discarding the chunks in " + parts_directory + " as they belong to another route "
+                                  "or chunk size.")
+                shutil.rmtree(parts_directory)
+        if not os.path.isdir(parts_directory):
+            os.makedirs(parts_directory)
+            with open(parts_signature_file, 'w') as f:
+                f.write(parts_signature)
+
+        chunk_paths = [os.path.join(parts_directory, 'chunk_%05d.bag' % chunk_index)
+                       for chunk_index in range(len(chunks))]
+        chunk_queue = queue.Queue()
+        for chunk_index, chunk_path in enumerate(chunk_paths):
+            if os.path.isfile(chunk_path):
+                pose_index += len(chunks[chunk_index])
+            else:
+                chunk_queue.put(chunk_index)
+        if pose_index > 1:
+            rospy.loginfo("Resuming route after " + str(pose_index - 1) + ' of ' + str(len(selected_poses))
+                          + ' poses already recorded in ' + parts_directory + '.')
+        pose_count = len(selected_poses)
+        progress_lock = threading.Lock()
+
+        def capture_pose(c, msg, ros_timestamp, first_message, last_timestamps, warning_issued, write):
+            timestamp = msg.header.stamp
+            c.simContinueForTime(period)
+            cur_position = airsim.Vector3r(msg.pose.position.x, -msg.pose.position.y, -msg.pose.position.z)
+            cur_orientation = airsim.Quaternionr(msg.pose.orientation.x, msg.pose.orientation.y,
+                                                 msg.pose.orientation.z, msg.pose.orientation.w).inverse()
+            cur_orientation = airsim.Quaternionr(float(cur_orientation.x_val), float(cur_orientation.y_val),
+                                                 float(cur_orientation.z_val), float(cur_orientation.w_val))
+            c.simSetVehiclePose(airsim.Pose(cur_position, cur_orientation), True, vehicle_name)
+
+            camera_responses = c.simGetImages(requests, vehicle_name)
             for cur_sensor_index, cur_sensor_name in enumerate(sensor_camera_names):
                 response = camera_responses[response_locations[cur_sensor_name + '_scene']]
                 if response.width == 0 and response.height == 0:
                     rospy.logwarn("Camera '" + cur_sensor_name + "' could not retrieve scene image.")
                 else:
-                    camera_msg = get_scene_camera_ros_message(response, timestamp,
-                                                              sensor_camera_optical_frames[cur_sensor_index], cv_bridge,
-                                                              sensor_camera_scene_quality[cur_sensor_index],
-                                                              sensor_camera_toggle_scene_mono[cur_sensor_index])
-                    image_publishers[cur_sensor_name + '_scene'].publish(camera_msg)
-
+                    camera_msg = (
+                        get_scene_camera_ros_message(response, timestamp,
+                                                     sensor_camera_optical_frames[cur_sensor_index],
+                                                     cv_bridge,
+                                                     sensor_camera_scene_quality[cur_sensor_index],
+                                                     sensor_camera_toggle_scene_mono[cur_sensor_index]))
+                    write(sensor_camera_scene_topics[cur_sensor_index], camera_msg, t=ros_timestamp)
                 if sensor_camera_toggle_segmentation[cur_sensor_index] == 1:
                     response = camera_responses[response_locations[cur_sensor_name + '_segmentation']]
                     if response.width == 0 and response.height == 0:
                         rospy.logwarn("Camera '" + cur_sensor_name + "' could not retrieve segmentation image.")
                     else:
                         camera_msg = get_segmentation_camera_ros_message(camera_msg, response)
-                        image_publishers[cur_sensor_name + '_segmentation'].publish(camera_msg)
-                    if not segmentation_warning_issued:
-                        segmentation_warning_issued = True
-                        rospy.logwarn("Instance segmentation is being used."
-                                      " Do not forget to generate ground truth map!")
+                        write(sensor_camera_segmentation_topics[cur_sensor_index], camera_msg,
+                              t=ros_timestamp)
                 if sensor_camera_toggle_depth[cur_sensor_index] == 1:
                     response = camera_responses[response_locations[cur_sensor_name + '_depth']]
                     if response.width == 0 and response.height == 0:
                         rospy.logwarn("Camera '" + cur_sensor_name + "' could not retrieve depth image.")
                     else:
                         camera_msg = get_depth_camera_ros_message(camera_msg, response)
-                        image_publishers[cur_sensor_name + '_depth'].publish(camera_msg)
+                        write(sensor_camera_depth_topics[cur_sensor_index], camera_msg,
+                              t=ros_timestamp)
                 if sensor_camera_toggle_annotation[cur_sensor_index] == 1:
                     response = camera_responses[response_locations[cur_sensor_name + '_annotation']]
                     if response.width == 0 and response.height == 0:
                         rospy.logwarn("Camera '" + cur_sensor_name + "' could not retrieve annotation image.")
                     else:
                         camera_msg = get_annotation_camera_ros_message(camera_msg, response)
-                        image_publishers[cur_sensor_name + '_annotation'].publish(camera_msg)
+                        write(sensor_camera_annotation_topics[cur_sensor_index], camera_msg,
+                              t=ros_timestamp)
                 if sensor_camera_toggle_camera_info[cur_sensor_index] == 1:
                     if cur_sensor_index == 1:
                         first_sensor = True
@@ -1138,90 +961,433 @@ def airsim_publish(client, use_route, route_rosbag, merged_rosbag, generate_gt_m
                                                                sensor_camera_optical_frames[cur_sensor_index],
                                                                timestamp, response.width, response.height,
                                                                sensor_stereo_enable, baseline, first_sensor)
-                    image_publishers[cur_sensor_name + '_cameraInfo'].publish(cam_info_msg)
+                    write(sensor_camera_info_topics[cur_sensor_index], cam_info_msg, t=ros_timestamp)
 
             for cur_sensor_index, cur_sensor_name in enumerate(sensor_echo_names):
                 pcloud, groundtruth, last_timestamp_return, pcloud_passive, groundtruth_passive = (
-                    get_echo_ros_message(client, cur_sensor_name, vehicle_name, last_timestamps[cur_sensor_name],
-                                         fields_echo, fields_echo_passive, sensor_echo_frames[cur_sensor_index],
-                                         timestamp, sensor_echo_toggle_passive[cur_sensor_index]))
+                    get_echo_ros_message(c, cur_sensor_name, vehicle_name,
+                                         last_timestamps[cur_sensor_name], fields_echo, fields_echo_passive,
+                                         sensor_echo_frames[cur_sensor_index], timestamp,
+                                         sensor_echo_toggle_passive[cur_sensor_index]))
                 if last_timestamp_return is not None:
                     last_timestamps[cur_sensor_name] = last_timestamp_return
                 if pcloud is not None:
-                    pointcloud_publishers[cur_sensor_name].publish(pcloud)
+                    write(sensor_echo_topics[cur_sensor_index], pcloud, t=ros_timestamp)
+
                 if groundtruth is not None:
-                    string_segmentation_publishers[cur_sensor_name].publish(groundtruth)
+                    write(sensor_echo_segmentation_topics[cur_sensor_index], groundtruth,
+                          t=ros_timestamp)
                 if sensor_echo_toggle_passive[cur_sensor_index]:
                     if pcloud_passive is not None:
-                        pointcloud_publishers[cur_sensor_name + "_passive"].publish(pcloud_passive)
+                        write(sensor_echo_passive_topics[cur_sensor_index], pcloud_passive,
+                              t=ros_timestamp)
 
                     if groundtruth_passive is not None:
-                        string_segmentation_publishers[cur_sensor_name + "_passive"].publish(groundtruth_passive)
+                        write(sensor_echo_passive_segmentation_topics[cur_sensor_index],
+                              groundtruth_passive, t=ros_timestamp)
 
             for cur_sensor_index, cur_sensor_name in enumerate(sensor_lidar_names):
                 seg_enable = sensor_lidar_toggle_segmentation[cur_sensor_index]
                 cur_frame = sensor_lidar_frames[cur_sensor_index]
-                pcloud, groundtruth, last_timestamp_return = get_lidar_ros_message(client, cur_sensor_name,
+                pcloud, groundtruth, last_timestamp_return = get_lidar_ros_message(c, cur_sensor_name,
                                                                                    vehicle_name,
-                                                                                   last_timestamps[cur_sensor_name],
+                                                                                   last_timestamps[
+                                                                                       cur_sensor_name],
                                                                                    cur_frame,
                                                                                    timestamp,
                                                                                    seg_enable)
                 if last_timestamp_return is not None:
                     last_timestamps[cur_sensor_name] = last_timestamp_return
                 if pcloud is not None:
-                    pointcloud_publishers[cur_sensor_name].publish(pcloud)
+                    write(sensor_lidar_topics[cur_sensor_index], pcloud, t=ros_timestamp)
                 if sensor_lidar_toggle_segmentation[cur_sensor_index] == 1:
                     if groundtruth is not None:
-                        string_segmentation_publishers[cur_sensor_name].publish(groundtruth)
+                        write(sensor_lidar_segmentation_topics[cur_sensor_index], groundtruth,
+                              t=ros_timestamp)
 
             for cur_sensor_index, cur_sensor_name in enumerate(sensor_gpulidar_names):
-                if not segmentation_warning_issued:
-                    segmentation_warning_issued = True
-                    rospy.logwarn("Instance segmentation is being used."
-                                  " Do not forget to generate ground truth map!")
-                pcloud, last_timestamp_return = get_gpulidar_ros_message(client, cur_sensor_name, vehicle_name,
+                pcloud, last_timestamp_return = get_gpulidar_ros_message(c, cur_sensor_name, vehicle_name,
                                                                          last_timestamps[cur_sensor_name],
                                                                          fields_lidar,
-                                                                         sensor_gpulidar_frames[cur_sensor_index],
+                                                                         sensor_gpulidar_frames[
+                                                                             cur_sensor_index],
                                                                          timestamp)
                 if last_timestamp_return is not None:
                     last_timestamps[cur_sensor_name] = last_timestamp_return
                 if pcloud is not None:
-                    pointcloud_publishers[cur_sensor_name].publish(pcloud)
+                    write(sensor_gpulidar_topics[cur_sensor_index], pcloud, t=ros_timestamp)
 
             for cur_sensor_index, cur_sensor_name in enumerate(sensor_uwb_names):
                 if cur_sensor_index == 0:  # only once
-                    range_arrays = get_uwb_ros_message(client, vehicle_name, rospy, timestamp)
+                    range_arrays = get_uwb_ros_message(c, vehicle_name, rospy, timestamp)
                     if len(range_arrays) != 0:
                         for range_array in range_arrays:
-                            uwb_range_array_publisher.publish(range_array)
+                            write(sensor_uwb_topic, range_array, t=ros_timestamp)
 
             for cur_sensor_index, cur_sensor_name in enumerate(sensor_wifi_names):
                 if cur_sensor_index == 0:  # only once
-                    range_arrays = get_wifi_ros_message(client, vehicle_name, rospy, timestamp)
+                    range_arrays = get_wifi_ros_message(c, vehicle_name, rospy, timestamp)
                     if len(range_arrays) != 0:
                         for range_array in range_arrays:
-                            wifi_range_array_publisher.publish(range_array)
+                            write(sensor_wifi_topic, range_array, t=ros_timestamp)
 
             if object_poses_all:
-                object_path = get_all_objects_ros_path_message(client, timestamp, first_message, object_poses_all_once,
+                object_path = get_all_objects_ros_path_message(c, timestamp, first_message,
+                                                               object_poses_all_once,
                                                                map_frame, object_poses_all_coordinates_local)
                 if object_path is not None:
-                    object_path_publisher.publish(object_path)
+                    write(object_poses_all_topic, object_path, t=ros_timestamp)
 
             else:
                 for object_index, object_name in enumerate(object_poses_individual_names):
                     local_enable = object_poses_individual_coordinates_local[object_index]
-                    object_pose, warning_issued_result = get_object_pose_ros_message(client, local_enable, object_name,
-                                                                                     warning_issued[object_name],
-                                                                                     rospy, timestamp, map_frame)
+                    object_pose, warning_issued_result = get_object_pose_ros_message(c, local_enable,
+                                                                                     object_name,
+                                                                                     warning_issued[
+                                                                                         object_name],
+                                                                                     rospy, timestamp,
+                                                                                     map_frame)
+                    warning_issued[object_name] = warning_issued_result
+                    if not warning_issued_result:
+                        if object_pose is not None:
+                            write(object_poses_individual_topics[object_index], object_pose,
+                                  t=ros_timestamp)
+
+        def replay_chunks(worker_port):
+            nonlocal pose_index
+            c = airsim.VehicleClient(ip=ip, port=worker_port)
+            while not rospy.is_shutdown():
+                try:
+                    chunk_index = chunk_queue.get_nowait()
+                except queue.Empty:
+                    return
+                last_timestamps = {}
+                for cur_sensor_name in sensor_echo_names + sensor_lidar_names + sensor_gpulidar_names:
+                    last_timestamps[cur_sensor_name] = None
+                warning_issued = {}
+                for object_name in object_poses_individual_names:
+                    warning_issued[object_name] = False
+                writer = RosbagWriter(chunk_paths[chunk_index])
+                completed = False
+                try:
+                    for chunk_pose_index, (msg, t) in enumerate(chunks[chunk_index]):
+                        if rospy.is_shutdown():
+                            break
+                        with progress_lock:
+                            rospy.loginfo("Setting vehicle pose " + str(pose_index) + ' of ' + str(pose_count)
+                                          + ' to record sensor data (simulator on port ' + str(worker_port)
+                                          + ')...')
+                            pose_index += 1
+                        first_message = chunk_index == 0 and chunk_pose_index == 0
+                        capture_pose(c, msg, t, first_message, last_timestamps, warning_issued, writer.write)
+                        time.sleep(route_settle_time)
+                    else:
+                        completed = True
+                finally:
+                    writer.close(completed)
+
+        workers = [threading.Thread(target=replay_chunks, args=(worker_port,)) for worker_port in route_ports]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        missing_chunks = [chunk_path for chunk_path in chunk_paths if not os.path.isfile(chunk_path)]
+        if missing_chunks:
+            rospy.logwarn("Route replay stopped with " + str(len(missing_chunks)) + ' of ' + str(len(chunk_paths))
+                          + ' chunks left to record. Run it again to resume from ' + parts_directory + '.')
+            route.close()
+            return
+
+        rospy.loginfo("Process completed. Merging " + str(len(chunk_paths)) + " chunks into merged rosbag...")
+        output = rosbag.Bag(merged_rosbag, 'w')
+        for chunk_path in chunk_paths:
+            with rosbag.Bag(chunk_path) as chunk:
+                for topic, msg, t in chunk.read_messages():
+                    output.write(topic, msg, t)
+        output.write('/tf_static', saved_static_tf, first_timestamp)
+        rospy.loginfo("Writing all other messages to merged rosbag...")
+        for topic, msg, t in route.read_messages():
+            if topic != 'tf/static':
+                output.write(topic, msg, t)
+        output.close()
+        route.close()
+        shutil.rmtree(parts_directory)
+        rospy.loginfo("Merged rosbag with route and sensor data created!")
+        if generate_gt_map:
+            rospy.loginfo("Loading segmentation colormap...")
+            colorMap = client.simGetSegmentationColorMap()
+            rospy.loginfo("Loaded segmentation colormap.")
+
+            currentObjectList = client.simListInstanceSegmentationObjects()
+            rospy.loginfo("Generating list of all current objects...")
+            with open('airsim_gt_map_' + datetime.now().strftime("%Y_%m_%d_%H_%M_%S") + '.csv', 'w') as f:
+                f.write("ObjectName,R,G,B\n")
+                for index, item in enumerate(currentObjectList):
+                    f.write("%s,%s\n" % (item, ','.join([str(x) for x in colorMap[index, :]])))
+            rospy.loginfo("Generated ground truth map of " + str(len(currentObjectList)) + ' objects.')
+
+    else:
+        segmentation_warning_issued = False
+        sim_odom = Odometry()
+
+        def rate_divisor(*keys):
+            # the first of the task name, sensor name or sensor group that has a rate divisor configured
+            for key in keys:
+                if key in fetch_rate_divisors:
+                    return fetch_rate_divisors[key]
+            return 1
+
+        fetch_stage = SensorFetchStage(lambda: airsim.VehicleClient(ip=ip, port=port), fetch_connections,
+                                       fetch_stats_interval)
+        # the car control needs the velocity of the current tick, so the pose is fetched every tick when it is enabled
+        odometry_needed = odometry_enable or carcontrol_enable == 1
+        snapshot_sensors = ['pose', 'kinematics'] if odometry_needed else ['pose']
+        fetch_stage.add('pose', lambda c, tick, timestamp: (timestamp,
+                                                            c.getSensorSnapshot(snapshot_sensors, vehicle_name)),
+                        1 if carcontrol_enable == 1 else rate_divisor('pose'))
+        if sensor_imu_enable:
+            fetch_stage.add('imu', lambda c, tick, timestamp: get_imu_ros_message(c, sensor_imu_name, vehicle_name,
+                                                                                 timestamp, sensor_imu_frame),
+                            rate_divisor('imu', sensor_imu_name))
+        if len(requests) > 0:
+            fetch_stage.add('cameras', lambda c, tick, timestamp: (timestamp, c.simGetImages(requests, vehicle_name)),
+                            rate_divisor('cameras'))
+        for cur_sensor_index, cur_sensor_name in enumerate(sensor_echo_names):
+            fetch_stage.add('echo/' + cur_sensor_name,
+                            lambda c, tick, timestamp, name=cur_sensor_name, index=cur_sensor_index:
+                            get_echo_ros_message(c, name, vehicle_name, last_timestamps[name], fields_echo,
+                                                 fields_echo_passive, sensor_echo_frames[index], timestamp,
+                                                 sensor_echo_toggle_passive[index]),
+                            rate_divisor('echo/' + cur_sensor_name, cur_sensor_name, 'echo'))
+        for cur_sensor_index, cur_sensor_name in enumerate(sensor_lidar_names):
+            fetch_stage.add('lidar/' + cur_sensor_name,
+                            lambda c, tick, timestamp, name=cur_sensor_name, index=cur_sensor_index:
+                            get_lidar_ros_message(c, name, vehicle_name, last_timestamps[name],
+                                                  sensor_lidar_frames[index], timestamp,
+                                                  sensor_lidar_toggle_segmentation[index]),
+                            rate_divisor('lidar/' + cur_sensor_name, cur_sensor_name, 'lidar'))
+        for cur_sensor_index, cur_sensor_name in enumerate(sensor_gpulidar_names):
+            fetch_stage.add('gpulidar/' + cur_sensor_name,
+                            lambda c, tick, timestamp, name=cur_sensor_name, index=cur_sensor_index:
+                            get_gpulidar_ros_message(c, name, vehicle_name, last_timestamps[name], fields_lidar,
+                                                     sensor_gpulidar_frames[index], timestamp),
+                            rate_divisor('gpulidar/' + cur_sensor_name, cur_sensor_name, 'gpulidar'))
+        if len(sensor_uwb_names) > 0:
+            fetch_stage.add('uwb', lambda c, tick, timestamp: get_uwb_ros_message(c, vehicle_name, rospy, timestamp),
+                            rate_divisor('uwb'))
+        if len(sensor_wifi_names) > 0:
+            fetch_stage.add('wifi', lambda c, tick, timestamp: get_wifi_ros_message(c, vehicle_name, rospy, timestamp),
+                            rate_divisor('wifi'))
+        if object_poses_all:
+            fetch_stage.add('objects',
+                            lambda c, tick, timestamp: get_all_objects_ros_path_message(
+                                c, timestamp, tick == 0, object_poses_all_once, map_frame,
+                                object_poses_all_coordinates_local),
+                            rate_divisor('objects'))
+        else:
+            for object_index, object_name in enumerate(object_poses_individual_names):
+                fetch_stage.add('object/' + object_name,
+                                lambda c, tick, timestamp, name=object_name, index=object_index:
+                                get_object_pose_ros_message(c, object_poses_individual_coordinates_local[index], name,
+                                                            warning_issued[name], rospy, timestamp, map_frame),
+                                rate_divisor('object/' + object_name, object_name, 'objects'))
+
+        tick = 0
+        period = 1.0 / ros_rate
+        while not rospy.is_shutdown():
+
+            tick_start = time.time()
+            timestamp = rospy.Time.now()
+            fetch_stage.start(tick, timestamp)
+            fetched = fetch_stage.collect(tick_start + period - time.time())
+
+            if 'pose' in fetched:
+                try:
+                    pose_timestamp, snapshot = fetched['pose'].result()
+                except msgpackrpc.error.RPCError:
+                    rospy.logerr("vehicle '" + vehicle_name + "' could not be found.")
+                    fetch_stage.shutdown()
+                    rospy.signal_shutdown('Vehicle not found.')
+                    sys.exit()
+
+                cur_pose = snapshot.pose
+                cur_pos = cur_pose.position
+                cur_orientation = cur_pose.orientation.inverse()
+
+                pose_msg = PoseStamped()
+                pose_msg.header.stamp = pose_timestamp
+                pose_msg.header.frame_id = map_frame
+                pose_msg.header.seq = 1
+
+                pose_msg.pose.position.x = cur_pos.x_val + pose_offset_x
+                pose_msg.pose.position.y = -cur_pos.y_val + pose_offset_y
+                pose_msg.pose.position.z = -cur_pos.z_val + pose_offset_z
+                pose_msg.pose.orientation.w = cur_orientation.w_val
+                pose_msg.pose.orientation.x = cur_orientation.x_val
+                pose_msg.pose.orientation.y = cur_orientation.y_val
+                pose_msg.pose.orientation.z = cur_orientation.z_val
+                pose_publisher.publish(pose_msg)
+
+                sim_odom = Odometry()
+                if odometry_needed:
+                    sim_odom.header = pose_msg.header
+                    sim_odom.child_frame_id = odom_frame
+                    sim_odom.pose.pose = pose_msg.pose
+                    kinematics = snapshot.kinematics
+                    t_w_veh = tf.transformations.quaternion_matrix([cur_orientation.x_val, cur_orientation.y_val,
+                                                                    cur_orientation.z_val, cur_orientation.w_val])
+                    t_w_veh[:3, 3] = np.array([cur_pos.x_val, -cur_pos.y_val, -cur_pos.z_val])
+                    t_veh_w = t_invert(t_w_veh)
+
+                    local_linear = np.matmul(t_veh_w[:3, :3], np.array(
+                        [kinematics.linear_velocity.x_val, - kinematics.linear_velocity.y_val,
+                         - kinematics.linear_velocity.z_val]))
+                    local_angular = np.matmul(t_veh_w[:3, :3], np.array(
+                        [kinematics.angular_velocity.x_val, - kinematics.angular_velocity.y_val,
+                         - kinematics.angular_velocity.z_val]))
+                    sim_odom.twist.twist.linear.x = local_linear[0]
+                    sim_odom.twist.twist.linear.y = local_linear[1]
+                    sim_odom.twist.twist.linear.z = local_linear[2]
+                    sim_odom.twist.twist.angular.x = local_angular[0]
+                    sim_odom.twist.twist.angular.y = local_angular[1]
+                    sim_odom.twist.twist.angular.z = local_angular[2]
+                    if odometry_enable:
+                        odom_publisher.publish(sim_odom)
+
+                if tf_odom_enable:
+                    tf_odom_pose = mat_2_tf(pose_2_mat(pose_msg.pose), pose_timestamp, map_frame, odom_frame)
+                    tf_br.sendTransform(tf_odom_pose)
+
+                    tf_map_odom = TransformStamped()
+                    tf_map_odom.header.stamp = pose_timestamp
+                    tf_map_odom.header.frame_id = odom_frame
+                    tf_map_odom.child_frame_id = vehicle_base_frame
+                    tf_map_odom.transform.rotation.w = 1
+                    tf_br.sendTransform(tf_map_odom)
+
+            if 'imu' in fetched:
+                imu_publisher.publish(fetched['imu'].result())
+
+            if 'cameras' in fetched:
+                camera_timestamp, camera_responses = fetched['cameras'].result()
+                for cur_sensor_index, cur_sensor_name in enumerate(sensor_camera_names):
+                    response = camera_responses[response_locations[cur_sensor_name + '_scene']]
+                    if response.width == 0 and response.height == 0:
+                        rospy.logwarn("Camera '" + cur_sensor_name + "' could not retrieve scene image.")
+                    else:
+                        camera_msg = get_scene_camera_ros_message(response, camera_timestamp,
+                                                                  sensor_camera_optical_frames[cur_sensor_index],
+                                                                  cv_bridge,
+                                                                  sensor_camera_scene_quality[cur_sensor_index],
+                                                                  sensor_camera_toggle_scene_mono[cur_sensor_index])
+                        image_publishers[cur_sensor_name + '_scene'].publish(camera_msg)
+
+                    if sensor_camera_toggle_segmentation[cur_sensor_index] == 1:
+                        response = camera_responses[response_locations[cur_sensor_name + '_segmentation']]
+                        if response.width == 0 and response.height == 0:
+                            rospy.logwarn("Camera '" + cur_sensor_name + "' could not retrieve segmentation image.")
+                        else:
+                            camera_msg = get_segmentation_camera_ros_message(camera_msg, response)
+                            image_publishers[cur_sensor_name + '_segmentation'].publish(camera_msg)
+                        if not segmentation_warning_issued:
+                            segmentation_warning_issued = True
+                            rospy.logwarn("Instance segmentation is being used."
+                                          " Do not forget to generate ground truth map!")
+                    if sensor_camera_toggle_depth[cur_sensor_index] == 1:
+                        response = camera_responses[response_locations[cur_sensor_name + '_depth']]
+                        if response.width == 0 and response.height == 0:
+                            rospy.logwarn("Camera '" + cur_sensor_name + "' could not retrieve depth image.")
+                        else:
+                            camera_msg = get_depth_camera_ros_message(camera_msg, response)
+                            image_publishers[cur_sensor_name + '_depth'].publish(camera_msg)
+                    if sensor_camera_toggle_annotation[cur_sensor_index] == 1:
+                        response = camera_responses[response_locations[cur_sensor_name + '_annotation']]
+                        if response.width == 0 and response.height == 0:
+                            rospy.logwarn("Camera '" + cur_sensor_name + "' could not retrieve annotation image.")
+                        else:
+                            camera_msg = get_annotation_camera_ros_message(camera_msg, response)
+                            image_publishers[cur_sensor_name + '_annotation'].publish(camera_msg)
+                    if sensor_camera_toggle_camera_info[cur_sensor_index] == 1:
+                        if cur_sensor_index == 1:
+                            first_sensor = True
+                        else:
+                            first_sensor = False
+                        cam_info_msg = get_camera_info_ros_message(cameraInfo_objects[cur_sensor_name].fov,
+                                                                   sensor_camera_optical_frames[cur_sensor_index],
+                                                                   camera_timestamp, response.width, response.height,
+                                                                   sensor_stereo_enable, baseline, first_sensor)
+                        image_publishers[cur_sensor_name + '_cameraInfo'].publish(cam_info_msg)
+
+            for cur_sensor_index, cur_sensor_name in enumerate(sensor_echo_names):
+                if 'echo/' + cur_sensor_name not in fetched:
+                    continue
+                pcloud, groundtruth, last_timestamp_return, pcloud_passive, groundtruth_passive = \
+                    fetched['echo/' + cur_sensor_name].result()
+                if last_timestamp_return is not None:
+                    last_timestamps[cur_sensor_name] = last_timestamp_return
+                if pcloud is not None:
+                    pointcloud_publishers[cur_sensor_name].publish(pcloud)
+                if groundtruth is not None:
+                    string_segmentation_publishers[cur_sensor_name].publish(groundtruth)
+                if sensor_echo_toggle_passive[cur_sensor_index]:
+                    if pcloud_passive is not None:
+                        pointcloud_publishers[cur_sensor_name + "_passive"].publish(pcloud_passive)
+
+                    if groundtruth_passive is not None:
+                        string_segmentation_publishers[cur_sensor_name + "_passive"].publish(groundtruth_passive)
+
+            for cur_sensor_index, cur_sensor_name in enumerate(sensor_lidar_names):
+                if 'lidar/' + cur_sensor_name not in fetched:
+                    continue
+                pcloud, groundtruth, last_timestamp_return = fetched['lidar/' + cur_sensor_name].result()
+                if last_timestamp_return is not None:
+                    last_timestamps[cur_sensor_name] = last_timestamp_return
+                if pcloud is not None:
+                    pointcloud_publishers[cur_sensor_name].publish(pcloud)
+                if sensor_lidar_toggle_segmentation[cur_sensor_index] == 1:
+                    if groundtruth is not None:
+                        string_segmentation_publishers[cur_sensor_name].publish(groundtruth)
+
+            for cur_sensor_index, cur_sensor_name in enumerate(sensor_gpulidar_names):
+                if not segmentation_warning_issued:
+                    segmentation_warning_issued = True
+                    rospy.logwarn("Instance segmentation is being used."
+                                  " Do not forget to generate ground truth map!")
+                if 'gpulidar/' + cur_sensor_name not in fetched:
+                    continue
+                pcloud, last_timestamp_return = fetched['gpulidar/' + cur_sensor_name].result()
+                if last_timestamp_return is not None:
+                    last_timestamps[cur_sensor_name] = last_timestamp_return
+                if pcloud is not None:
+                    pointcloud_publishers[cur_sensor_name].publish(pcloud)
+
+            if 'uwb' in fetched:
+                for range_array in fetched['uwb'].result():
+                    uwb_range_array_publisher.publish(range_array)
+
+            if 'wifi' in fetched:
+                for range_array in fetched['wifi'].result():
+                    wifi_range_array_publisher.publish(range_array)
+
+            if object_poses_all:
+                if 'objects' in fetched:
+                    object_path = fetched['objects'].result()
+                    if object_path is not None:
+                        object_path_publisher.publish(object_path)
+
+            else:
+                for object_index, object_name in enumerate(object_poses_individual_names):
+                    if 'object/' + object_name not in fetched:
+                        continue
+                    object_pose, warning_issued_result = fetched['object/' + object_name].result()
                     warning_issued[object_name] = warning_issued_result
                     if not warning_issued_result:
                         if object_pose is not None:
                             objectpose_publishers[object_name].publish(object_pose)
 
-            if carcontrol_enable == 1:
+            # a pose that did not arrive within the tick leaves sim_odom stale, so the car control waits for a fresh one
+            if carcontrol_enable == 1 and 'pose' in fetched:
                 desired_speed, v, error, desired_rotation_return = get_car_control_ros_message(client,
                                                                                                queue_input_command,
                                                                                                speed_pid,
@@ -1234,14 +1400,20 @@ def airsim_publish(client, use_route, route_rosbag, merged_rosbag, generate_gt_m
                 error_speed_publisher.publish(error)
 
             first_message = False
+            tick += 1
             rate.sleep()
 
+        fetch_stage.shutdown()
+
 
 if __name__ == '__main__':
     try:
         rospy.init_node('airsim_play_route_record_sensors', anonymous=True)
 
         ros_rate = rospy.get_param('~rate', 10)
+        fetch_connections = rospy.get_param('~fetch_connections', 4)
+        fetch_rate_divisors = rospy.get_param('~fetch_rate_divisors', {})
+        fetch_stats_interval = rospy.get_param('~fetch_stats_interval', 0)
         ip = rospy.get_param('~ip', "localhost")
         port = rospy.get_param('~port', 41451)
 
@@ -1252,6 +1424,12 @@ if __name__ == '__main__':
         use_route = rospy.get_param('~use_route', 0)
         route_rosbag = rospy.get_param('~route_rosbag', "./airsim_route_only.bag")
         merged_rosbag = rospy.get_param('~merged_rosbag', "./airsim_sensor_data.bag")
+        route_chunk_size = rospy.get_param('~route_chunk_size', 100)
+        route_resume = rospy.get_param('~route_resume', 1)
+        route_ports = rospy.get_param('~route_ports', [])
+        if not route_ports:
+            route_ports = [port]
+        route_settle_time = rospy.get_param('~route_settle_time', 1.0)
         generate_gt_map = rospy.get_param('~generate_gt_map', 0)
 
         vehicle_name = rospy.get_param('~vehicle_name', "airsimvehicle")